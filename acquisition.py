@@ -0,0 +1,186 @@
+"""
+Acquisition of measurement frames from the load.
+
+A measurement frame is one sample of every value the app needs per tick. Instead of doing a full serial round-trip
+for each value(as the property accessors of KELSerial do), all queries of a frame are written to the port at once
+and the responses are read back in bulk afterward. This way the sample rate is limited by bandwidth instead of latency.
+
+Run state and Ah/Wh integration from frames is kept separate from the user interface, so it is shared by the GUI worker
+and headless logging. Frames are stamped with a monotonic clock at the midpoint of their queries, Ah/Wh are integrated
+with the trapezoidal rule between those timestamps, so neither clock adjustments nor the serial latency end up in them.
+"""
+
+import datetime
+import time
+import numpy
+from kelctl import *
+
+FRAME_QUERIES = (":FUNC?", ":MEAS:VOLT?", ":MEAS:POW?", ":INP?", ":MEAS:CURR?")
+BATTERY_QUERIES = (":BATT:TIM?", ":BATT:CAP?")
+
+
+clock = time.perf_counter  # monotonic and high resolution, timestamps of frames are only compared with each other
+
+
+class MeasurementFrame(object):  # One timestamped record of all values read from the load in a single tick
+    __slots__ = ("timestamp", "mode", "voltage", "power", "input_state", "current", "batt_time", "batt_cap")
+
+    def __init__(self, timestamp: float, mode: Mode, voltage: float, power: float, input_state: OnOffState,
+                 current: float, batt_time: float = None, batt_cap: float = None):
+        self.timestamp = timestamp
+        self.mode = mode
+        self.voltage = voltage
+        self.power = power
+        self.input_state = input_state
+        self.current = current
+        self.batt_time = batt_time
+        self.batt_cap = batt_cap
+
+    def __repr__(self):
+        return "MeasurementFrame({0}, {1}, {2}V, {3}A, {4}W, {5})".format(self.timestamp, self.mode, self.voltage,
+                                                                         self.current, self.power, self.input_state)
+
+
+def raw_serial(load: KELSerial):
+    """ Serial wrapper(KELSerial.Serial with port and debug flag) of a load.
+
+    KELSerial keeps it private and only offers one command per call with a sleep after every write, while pipelined
+    frames, host timed setpoints, instrumentation and the simulator need the port itself. The name-mangled attribute is
+    checked here, so a py_kelctl version which changed it fails right away(the version is pinned in requirements.txt).
+    """
+    kel_serial = getattr(load, "_KELSerial__serial", None)
+    if kel_serial is None or not hasattr(kel_serial, "port"):
+        raise RuntimeError("KELSerial of this py_kelctl version has no serial port wrapper, see requirements.txt")
+    return kel_serial
+
+
+def query_pipelined(load: KELSerial, queries) -> list:
+    """ Send all queries in a single write and read one response line per query.
+
+    :return: list of response strings in the same order as queries
+    """
+    kel_serial = raw_serial(load)
+    port = kel_serial.port
+    if kel_serial.debug:
+        print("_send: ", " | ".join(queries))
+    port.write(("\n".join(queries) + "\n").encode('ascii'))
+
+    responses = []
+    for q in queries:
+        response = port.readline().decode()
+        if response == "":  # timeout, drop whatever might still arrive so next frame does not read stale responses
+            port.reset_input_buffer()
+            raise ValueError("No response from device for " + q)
+        responses.append(response.strip("\n"))
+    if kel_serial.debug:
+        print("read: ", " | ".join(responses))
+
+    return responses
+
+
+def parse_float(value: str, suffix: str) -> float:
+    try:
+        return float(value.rstrip(suffix))
+    except ValueError:
+        raise ValueError("Invalid value received from device: " + value)
+
+
+def read_frame(load: KELSerial, battery_hint: bool = False) -> MeasurementFrame:
+    """ Read a complete measurement frame with as few round-trips as possible.
+
+    Battery values are only available(and needed) in battery mode, since the mode is part of the same frame they are
+    included when battery_hint is set(i.e. the previous frame was in battery mode). If the mode switched to battery in
+    between, a second pipelined read is done for the battery values.
+    """
+    queries = FRAME_QUERIES + BATTERY_QUERIES if battery_hint else FRAME_QUERIES
+    sent = clock()
+    responses = query_pipelined(load, queries)
+    timestamp = (sent + clock()) / 2
+
+    mode = Mode(responses[0])
+    frame = MeasurementFrame(timestamp, mode, parse_float(responses[1], "V"), parse_float(responses[2], "W"),
+                             OnOffState(responses[3]), parse_float(responses[4], "A"))
+
+    if mode == Mode.battery:
+        if not battery_hint:
+            responses += query_pipelined(load, BATTERY_QUERIES)
+        frame.batt_time = parse_float(responses[5], "M")
+        frame.batt_cap = parse_float(responses[6], "AH")
+
+    return frame
+
+
+def read_frame_serial(load: KELSerial) -> MeasurementFrame:  # Previous way of doing one round-trip per value
+    sent = clock()
+    mode = load.function
+    voltage = load.measured_voltage
+    power = load.measured_power
+    input_state = load.input.get()
+    current = load.measured_current
+    frame = MeasurementFrame((sent + clock()) / 2, mode, voltage, power, input_state, current)
+    if mode == Mode.battery:
+        frame.batt_time = load.get_batt_time()
+        frame.batt_cap = load.get_batt_cap()
+
+    return frame
+
+
+def calculate_charge_energy(amp_watt_hour_value: float, runtime: float, last_value: float, value: float) -> float:
+    return amp_watt_hour_value + (last_value + value) / 2 * runtime / 3600
+
+
+def integrate(time_column: numpy.ndarray, value_column: numpy.ndarray) -> float:
+    """ Integrate a recorded column in Ah/Wh the same way RunTracker does while measuring, from all samples at once.
+
+    Runtime starts at 0 again with every run, intervals between runs(where it goes backward) are not integrated.
+    """
+    intervals = numpy.diff(time_column)
+    values = numpy.asarray(value_column, dtype=numpy.float64)
+    areas = (values[1:] + values[:-1]) / 2 * intervals
+    return float(areas[intervals > 0].sum() / 3600)
+
+
+class RunTracker(object):  # Run state of the load and Ah/Wh integrated from measurement frames
+    def __init__(self):
+        self.running = False
+        self.start_timestamp = clock()
+        self.run_time = datetime.timedelta()
+        self.previous = None  # last frame of the run, start of the next integration interval
+        self.ah_value = 0.0
+        self.wh_value = 0.0
+        self.batt_cap = None  # charge measured by the load in battery mode
+
+    @property
+    def charge_error(self):  # deviation of the integrated charge from the one measured by the load in battery mode
+        return None if self.batt_cap is None else self.ah_value - self.batt_cap
+
+    def start(self):  # run started from app
+        self.running = True
+        self.start_timestamp = clock()
+        self.previous = None
+
+    def stop(self):
+        self.running = False
+
+    def update(self, frame: MeasurementFrame) -> bool:
+        """ Integrate values of a frame, runs started or stopped on the device itself are picked up from the input state.
+
+        :return: True if the input is on, i.e. the frame belongs to the run and should be recorded
+        """
+        if frame.input_state != OnOffState.on:
+            self.running = False
+            self.previous = None
+            return False
+
+        if not self.running:
+            self.running = True
+            self.start_timestamp = frame.timestamp
+        if self.previous is not None and frame.timestamp > self.previous.timestamp:  # same intervals as integrate()
+            interval = frame.timestamp - self.previous.timestamp
+            self.wh_value = calculate_charge_energy(self.wh_value, interval, self.previous.power, frame.power)
+            self.ah_value = calculate_charge_energy(self.ah_value, interval, self.previous.current, frame.current)
+        self.batt_cap = frame.batt_cap if frame.mode == Mode.battery else None
+        self.run_time = datetime.timedelta(seconds=max(frame.timestamp - self.start_timestamp, 0.0))
+        self.previous = frame
+
+        return True
@@ -0,0 +1,573 @@
+"""
+Benchmarks for the acquisition path, run with ``python benchmark.py``.
+
+Covers serial acquisition, the complete polling tick, user command latency, integration, concurrent loads, storage, export, sessions, graph redraw, GUI frame
+time under load and startup. Results can be written as JSON(``--json results.json``) to compare them between commits,
+``--only`` selects benchmarks.
+
+No load is needed, the simulated load from simulator.py answers the queries with the timing of a real serial line(10
+bits per byte at the set baudrate plus a fixed turnaround time of the device for each command).
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import math
+import time
+import tracemalloc
+import numpy
+from kelctl import *
+from acquisition import read_frame, read_frame_serial, raw_serial, integrate, MeasurementFrame, RunTracker
+from scheduler import SerialScheduler, PRIORITY_POLL
+from recorder import RunRecorder
+from samplestore import SampleStore
+from export import write_csv
+from session import save_session, load_session
+from decimate import DecimatedColumn
+from pacer import DeadlinePacer
+from simulator import SimulatedKEL103, simulated_load
+from instrumentation import SerialInstrumentation, instrument
+from devices import DeviceManager
+from provisioning import write_slots, init_slot_writes
+from sequencer import list_sequence
+from waveform import resample
+
+device_latency = 0.002  # response time of the simulated load per command, set with --latency
+
+
+def stand_in_load(baudrate: BaudRate, send_sleep_time: float = 0.1) -> KELSerial:  # simulated load drawing 1 A
+    device = SimulatedKEL103(noise=0.0, latency=device_latency)
+    device.input_on = True
+    return simulated_load(device, baudrate, False, send_sleep_time)
+
+
+def samples_per_second(read, samples: int) -> float:
+    start = time.perf_counter()
+    for _ in range(samples):
+        read()
+    return samples / (time.perf_counter() - start)
+
+
+def percentiles(values, scale: float = 1000) -> dict:  # summary of latencies in ms
+    values = numpy.asarray(values) * scale
+    return {"p50": float(numpy.percentile(values, 50)), "p90": float(numpy.percentile(values, 90)),
+            "p99": float(numpy.percentile(values, 99)), "max": float(values.max())}
+
+
+def bench_frame(samples: int):
+    print("Measurement frame acquisition - samples/sec")
+    print("{0:>8} {1:>12} {2:>12} {3:>12}".format("baud", "serial", "frame", "speedup"))
+    results = {}
+    for baudrate in (BaudRate.R9600, BaudRate.R115200):
+        load = stand_in_load(baudrate)  # same send sleep time as used by the app
+        serial_rate = samples_per_second(lambda: read_frame_serial(load), samples)
+        frame_rate = samples_per_second(lambda: read_frame(load), samples)
+        print("{0:>8} {1:>12.2f} {2:>12.2f} {3:>11.1f}x".format(baudrate.b, serial_rate, frame_rate, frame_rate / serial_rate))
+        results[str(baudrate.b)] = {"serial_samples_per_s": serial_rate, "frame_samples_per_s": frame_rate}
+    return results
+
+
+def bench_ticks(ticks: int):
+    print("Polling tick(scheduler, frame, integration, storage, run file) - {0} ticks at 115200 baud".format(ticks))
+    load = stand_in_load(BaudRate.R115200)
+    scheduler = SerialScheduler("benchmark")
+    run_state = RunTracker()
+    store = SampleStore()
+    path = os.path.join(tempfile.mkdtemp(), "ticks.kelrun")
+    recorder = RunRecorder(path)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(ticks):  # same steps as Worker.work, without updating labels
+        tick_start = time.perf_counter()
+        frame = scheduler.call(read_frame, load, False, priority=PRIORITY_POLL)
+        if run_state.update(frame):
+            timestamp = run_state.run_time.total_seconds()
+            store.append(timestamp, frame.voltage, frame.current, frame.power)
+            recorder.append(timestamp, frame.voltage, frame.current, frame.power)
+        latencies.append(time.perf_counter() - tick_start)
+    rate = ticks / (time.perf_counter() - start)
+    scheduler.stop()
+    recorder.close()
+    os.remove(path)
+
+    results = dict(percentiles(latencies), samples_per_s=rate)
+    print("{0:>12.1f} samples/s, latency p50 {1:.2f} ms, p90 {2:.2f} ms, p99 {3:.2f} ms, max {4:.2f} ms".format(
+        rate, results["p50"], results["p90"], results["p99"], results["max"]))
+    return results
+
+
+def bench_commands(commands: int, interval: float = 0.05):
+    print("User commands while polling every {0:.0f} ms - {1} commands at 115200 baud".format(interval * 1000, commands))
+    print("{0:>10} {1:>14} {2:>14} {3:>16}".format("", "latency p50", "latency max", "loop stall max"))
+    load = stand_in_load(BaudRate.R115200)
+    scheduler = SerialScheduler("benchmark")
+
+    async def measure(blocking: bool):  # blocking: command waits on the event loop like the former GUI thread did
+        latencies = []
+        stalls = []
+
+        async def heartbeat():  # stands in for the 16 ms frames of the GUI, delayed by everything blocking the loop
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(0.016)
+                stalls.append(time.perf_counter() - start - 0.016)
+
+        async def poll():
+            while True:
+                await scheduler.run(read_frame, load, False, priority=PRIORITY_POLL)
+                await asyncio.sleep(interval)
+
+        tasks = [asyncio.ensure_future(heartbeat()), asyncio.ensure_future(poll())]
+        for _ in range(commands):
+            start = time.perf_counter()
+            if blocking:
+                scheduler.call(lambda: load.settings.voltage_limit)
+            else:
+                await scheduler.run(lambda: load.settings.voltage_limit)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.02)
+        for task in tasks:
+            task.cancel()
+        return percentiles(latencies), percentiles(stalls)
+
+    results = {}
+    for name, blocking in (("thread", True), ("asyncio", False)):
+        latency, stall = asyncio.run(measure(blocking))
+        print("{0:>10} {1:>11.2f} ms {2:>11.2f} ms {3:>13.2f} ms".format(name, latency["p50"], latency["max"], stall["max"]))
+        results[name] = {"latency": latency, "loop_stall": stall}
+    scheduler.stop()
+    return results
+
+
+def bench_slots():
+    print("Initializing all save slots at 115200 baud - seconds")
+    load = stand_in_load(BaudRate.R115200)
+    load.input.off()  # slots are only compared while the input is off
+    scheduler = SerialScheduler("benchmark")
+    results = {}
+    for name, skip_identical in (("write all", False), ("skip identical", True)):  # second run finds all slots initialized
+        start = time.perf_counter()
+        result = asyncio.run(write_slots(scheduler, load, init_slot_writes(), skip_identical))
+        results[name] = {"seconds": time.perf_counter() - start, "written": result["written"], "skipped": result["skipped"]}
+        print("{0:>16} {1:>8.2f} s, {2} written, {3} skipped".format(name, results[name]["seconds"], result["written"], result["skipped"]))
+    scheduler.stop()
+    return results
+
+
+def bench_sequence(steps: int, duration: float = 0.02, interval: float = 0.05):
+    print("Host list of {0} steps of {1:.0f} ms while polling every {2:.0f} ms at 115200 baud".format(steps, duration * 1000, interval * 1000))
+    load = stand_in_load(BaudRate.R115200, 0.0)
+    program = [ListStep(1 + i % 2, 0.1, duration) for i in range(steps)]
+
+    start = time.perf_counter()  # setter with sleep for each step, its time adds up over the sequence
+    for step in program:
+        load.current = step.current
+        time.sleep(step.duration)
+    drift = time.perf_counter() - start - steps * duration
+    print("{0:>10}: end {1:.1f} ms behind".format("sleep", drift * 1000))
+
+    scheduler = SerialScheduler("benchmark")
+    sequence = list_sequence(program)
+
+    async def play():
+        async def poll():
+            while True:
+                await scheduler.run(read_frame, load, False, priority=PRIORITY_POLL)
+                await asyncio.sleep(interval)
+
+        polling = asyncio.ensure_future(poll())
+        await sequence.run(scheduler, load)
+        polling.cancel()
+
+    asyncio.run(play())
+    scheduler.stop()
+    report = sequence.report()
+    print("{0:>10}: lateness mean {1:.2f} ms p99 {2:.2f} ms max {3:.2f} ms, {4} skipped".format(
+        "sequencer", report["lateness_mean"] * 1000, report["lateness_p99"] * 1000, report["lateness_max"] * 1000, report["skipped"]))
+    return {"sleep_drift": drift, "sequencer": report}
+
+
+def bench_waveform(points: int, interval: float = 0.05):
+    print("Resampling a waveform of {0} points to {1:.0f} ms setpoints".format(points, interval * 1000))
+    time_column = numpy.arange(points, dtype=numpy.float64)  # one point per second, e.g. current draw over a day
+    values = 1 + numpy.sin(time_column / 600) + (time_column % 3600 < 60) * 2  # slow drift and an hourly peak
+    start = time.perf_counter()
+    setpoints, durations = resample(time_column, values, interval)
+    elapsed = time.perf_counter() - start
+    print("{0:>10}: {1:.1f} ms, {2} setpoints(merged from {3} intervals)".format("resample", elapsed * 1000, len(setpoints),
+                                                                                 int(round(durations.sum() / interval))))
+    return {"seconds": elapsed, "setpoints": len(setpoints)}
+
+
+def bench_instrumentation(samples: int):
+    print("Serial instrumentation overhead - frames/sec without line timing")
+    rates = []
+    for instrumented in (False, True):
+        device = SimulatedKEL103(noise=0.0, latency=0.0)
+        load = simulated_load(device)
+        raw_serial(load).port.line.byte_time = 0.0  # only overhead of the code remains
+        if instrumented:
+            instrument(load, SerialInstrumentation())
+        rates.append(samples_per_second(lambda: read_frame(load), samples))
+    overhead = (1 / rates[1] - 1 / rates[0]) / 5 * 1e6  # frames consist of 5 queries
+    print("{0:>14.0f} plain, {1:.0f} instrumented, {2:.1f} us per command".format(rates[0], rates[1], overhead))
+    return {"plain_frames_per_s": rates[0], "instrumented_frames_per_s": rates[1], "overhead_us_per_command": overhead}
+
+
+def bench_integration(samples: int):
+    print("Runtime and Ah/Wh integration - updates/sec")
+    frame = MeasurementFrame(0.0, Mode.constant_current, 12.0, 12.0, OnOffState.on, 1.0)
+    run_state = RunTracker()
+    rate = samples_per_second(lambda: run_state.update(frame), samples)
+    columns = filled_store(samples).view()
+    start = time.perf_counter()
+    integrate(columns["time"], columns["current"])
+    vectorized = samples / (time.perf_counter() - start)
+    print("{0:>12.0f} updates/s, recomputed from sample store {1:.0f} samples/s".format(rate, vectorized))
+    return {"updates_per_s": rate, "recomputed_samples_per_s": vectorized}
+
+
+def bench_pacing(ticks: int, interval: float = 0.05):
+    load = stand_in_load(BaudRate.R9600)  # slower than the interval, acquisitions overrun their deadlines
+    print("Polling with acquisitions slower than a {0:.0f} ms interval - {1} acquisitions".format(interval * 1000, ticks))
+
+    start = time.monotonic()  # timer firing at a fixed period queues a call on every timeout, calls run back to back
+    for _ in range(ticks):
+        read_frame(load)
+    elapsed = time.monotonic() - start
+    backlog = int(elapsed / interval) - ticks
+    print("{0:>10}: {1} calls still queued, last sample {2:.2f} s behind".format("fixed", backlog, elapsed - ticks * interval))
+
+    pacer = DeadlinePacer(interval)
+    pacer.start()
+    for _ in range(ticks):
+        pacer.begin()
+        read_frame(load)
+        time.sleep(pacer.end())
+    print("{0:>10}: 0 calls queued, {1} late, {2} skipped, max {3:.0f} ms behind deadline".format(
+        "deadline", pacer.late, pacer.skipped, pacer.max_lateness * 1000))
+    return {"fixed_backlog": backlog, "deadline": pacer.metrics()}
+
+
+def bench_devices(seconds: float, interval: float = 0.05, counts=(1, 2, 4, 8)):
+    print("Concurrent loads with {0:.0f} ms interval - {1:g} s each".format(interval * 1000, seconds))
+    print("{0:>8} {1:>14} {2:>14} {3:>16} {4:>8}".format("loads", "samples/s", "per load", "CPU us/sample", "late"))
+    results = {}
+    for count in counts:
+        manager = DeviceManager()
+        manager.set_interval(interval)
+        for index in range(count):
+            manager.add("simulated:{0}".format(index + 1), start=False, record=False).set_input(True)
+        cpu = time.process_time()
+        for device in manager.devices:
+            device.start(interval)
+        time.sleep(seconds)
+        for device in manager.devices:
+            device.stop()
+        cpu = time.process_time() - cpu
+        total = sum(device.samples.total_length for device in manager.devices)
+        late = sum(device.pacer.late for device in manager.devices)
+        manager.close_all()
+        results[count] = {"samples_per_second": total / seconds, "cpu_per_sample": cpu / total, "late": late}
+        print("{0:>8} {1:>14.1f} {2:>14.1f} {3:>16.1f} {4:>8}".format(count, total / seconds, total / seconds / count,
+                                                                      cpu / total * 1e6, late))
+
+    manager = DeviceManager()  # one load on a slow connection, which can not keep up with the interval
+    manager.set_interval(interval)
+    manager.add("simulated:slow", BaudRate.R9600, start=False, record=False).set_input(True)
+    for index in range(3):
+        manager.add("simulated:{0}".format(index + 1), start=False, record=False).set_input(True)
+    for device in manager.devices:
+        device.start(interval)
+    time.sleep(seconds)
+    for device in manager.devices:
+        device.stop()
+    rates = [device.samples.total_length / seconds for device in manager.devices]
+    manager.close_all()
+    print("{0:>8}: slow load {1:.1f} samples/s, others {2}".format("9600 bd", rates[0], ", ".join("%.1f" % rate for rate in rates[1:])))
+    results["slow_load"] = rates
+    return results
+
+
+def bench_store(samples: int):
+    print("Sample storage - memory per million samples")
+    tracemalloc.start()
+    volts_list, amps_list, watts_list = [], [], []
+    for i in range(samples):  # previous storage as lists of (time, value) tuples per channel
+        t = i * 0.1
+        volts_list.append((t, 12.0 + i % 7))
+        amps_list.append((t, 1.0 + i % 5))
+        watts_list.append((t, 12.0 + i % 3))
+    list_bytes = tracemalloc.get_traced_memory()[0]
+    del volts_list, amps_list, watts_list
+    tracemalloc.stop()
+
+    store = SampleStore()
+    start = time.perf_counter()
+    for i in range(samples):
+        store.append(i * 0.1, 12.0 + i % 7, 1.0 + i % 5, 12.0 + i % 3)
+    append_rate = samples / (time.perf_counter() - start)
+
+    print("{0:>14} {1:>10.1f} MB".format("tuple lists", list_bytes / samples))
+    print("{0:>14} {1:>10.1f} MB ({2:.1f} MB allocated, {3:.0f} appends/s)".format(
+        "sample store", store.bytes_per_sample, store.nbytes / samples, append_rate))
+    return {"tuple_lists_mb_per_million": list_bytes / samples, "store_mb_per_million": store.bytes_per_sample,
+            "store_allocated_mb_per_million": store.nbytes / samples, "store_appends_per_s": append_rate}
+
+
+def filled_store(samples: int) -> SampleStore:
+    store = SampleStore(samples)
+    for i in range(samples):
+        store.append(i * 0.1, 12.0 + i % 7 / 10, 1.0 + i % 5 / 10, 12.0 + i % 3 / 10)
+    return store
+
+
+def bench_export(samples: int):
+    print("CSV export - rows/sec")
+    columns = filled_store(samples).view()
+    path = os.path.join(tempfile.mkdtemp(), "export.csv")
+
+    start = time.perf_counter()  # previous export of a single channel per file
+    numpy.savetxt(fname=path, X=numpy.column_stack((columns["time"], columns["voltage"])), fmt='%f', delimiter=",",
+                  header="Time,Value", comments="")
+    savetxt_rate = samples / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    write_csv(path, columns)
+    chunked_rate = samples / (time.perf_counter() - start)
+    os.remove(path)
+
+    print("{0:>24} {1:>12.0f}".format("savetxt, one channel", savetxt_rate))
+    print("{0:>24} {1:>12.0f} ({2:.0f} values/s)".format("chunked, all channels", chunked_rate, chunked_rate * 3))
+    return {"savetxt_rows_per_s": savetxt_rate, "chunked_rows_per_s": chunked_rate}
+
+
+def bench_session(samples: int):
+    print("Session save/load - seconds for {0} samples".format(samples))
+    columns = filled_store(samples).view()
+    directory = tempfile.mkdtemp()
+    csv_path = os.path.join(directory, "session.csv")
+    npz_path = os.path.join(directory, "session.npz")
+
+    start = time.perf_counter()
+    write_csv(csv_path, columns)
+    csv_save = time.perf_counter() - start
+    start = time.perf_counter()
+    numpy.loadtxt(csv_path, delimiter=",", skiprows=1)
+    csv_load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    save_session(npz_path, columns, {"model": "benchmark"})
+    npz_save = time.perf_counter() - start
+    start = time.perf_counter()
+    load_session(npz_path)
+    npz_load = time.perf_counter() - start
+
+    print("{0:>8} {1:>10} {2:>10} {3:>10}".format("", "save", "load", "size MB"))
+    print("{0:>8} {1:>10.3f} {2:>10.3f} {3:>10.1f}".format("csv", csv_save, csv_load, os.path.getsize(csv_path) / 1e6))
+    print("{0:>8} {1:>10.3f} {2:>10.3f} {3:>10.1f}".format("npz", npz_save, npz_load, os.path.getsize(npz_path) / 1e6))
+    print("{0:>8} {1:>9.0f}x {2:>9.0f}x".format("speedup", csv_save / npz_save, csv_load / npz_load))
+    os.remove(csv_path)
+    os.remove(npz_path)
+    return {"csv_save_s": csv_save, "csv_load_s": csv_load, "npz_save_s": npz_save, "npz_load_s": npz_load}
+
+
+def qt_application():  # Qt is only needed for the graph benchmarks
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6 import QtWidgets
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def bench_plot(max_samples: int, raw_max_samples: int):
+    app = qt_application()
+    import pyqtgraph as pg
+    widget = pg.PlotWidget()
+    widget.resize(1000, 400)
+    widget.show()
+    curve = widget.plot()
+
+    def redraw(x, y):
+        start = time.perf_counter()
+        curve.setData(x, y)
+        widget.getPlotItem().vb.setXRange(x[0], x[-1], padding=0)
+        widget.grab()  # forces rendering
+        app.processEvents()
+        return (time.perf_counter() - start) * 1000
+
+    print("Graph redraw with all samples in view - ms")
+    print("{0:>10} {1:>10} {2:>10} {3:>8}".format("samples", "all", "decimated", "points"))
+    results = {}
+    samples = 10000
+    while samples <= max_samples:
+        x = numpy.arange(samples) * 0.1
+        y = (numpy.sin(x / 50) + numpy.random.rand(samples) * 0.1).astype(numpy.float32)
+        raw = redraw(x, y) if samples <= raw_max_samples else float("nan")
+        column = DecimatedColumn()
+        start = time.perf_counter()
+        column.update(x[:-1], y[:-1])  # level of detail is kept up to date while recording, only last sample is new
+        column.update(x, y)
+        plot_x, plot_y = column.decimate(x, y, x[0], x[-1], widget.width())
+        decimated = redraw(plot_x, plot_y) + (time.perf_counter() - start) * 1000
+        print("{0:>10} {1:>10.1f} {2:>10.1f} {3:>8}".format(samples, raw, decimated, len(plot_x)))
+        results[str(samples)] = {"all_ms": None if math.isnan(raw) else raw, "decimated_ms": decimated}
+        samples *= 10
+    return results
+
+
+def bench_gui(seconds: float, samples: int, interval: float):
+    print("GUI frame time while polling every {0:.0f} ms with {1} samples in view - {2:.0f} s".format(
+        interval * 1000, samples, seconds))
+    qt_application()
+    from PySide6 import QtCore, QtAsyncio
+    working_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())  # app writes config file and run files to working directory
+    try:
+        import main as gui
+        window = gui.MainWindow()
+        window.show()
+        for i in range(samples):  # earlier part of the run, new samples continue at runtime 0
+            gui.samples.append((i - samples) * interval, 12.0 + i % 7 / 10, 1.0 + i % 5 / 10, 12.0 + i % 3 / 10)
+        window.build_plot()  # done at connect in the app
+        window.plot_widget.x_range_controller.offset_left = samples * interval
+        gui.load = stand_in_load(BaudRate.R115200)
+
+        frames = []
+        last = [time.perf_counter()]
+
+        def frame():  # time between frames is stretched by everything blocking the event loop
+            now = time.perf_counter()
+            frames.append(now - last[0])
+            last[0] = now
+
+        frame_timer = QtCore.QTimer()
+        frame_timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+        frame_timer.timeout.connect(frame)
+        frame_timer.start(16)
+
+        async def poll():  # polling runs as coroutine on the Qt event loop, same as in the app
+            window.start_polling.emit(interval)
+            await asyncio.sleep(seconds)
+            window.stop_polling.emit()
+
+        QtAsyncio.run(poll(), keep_running=False, quit_qapp=True)  # loop only stops by quitting the event loop of Qt
+        frame_timer.stop()
+        ticks = window.worker.pacer.metrics()
+        gui.clear_samples()
+    finally:
+        os.chdir(working_directory)
+
+    results = dict(percentiles(frames), ticks=ticks["ticks"], late=ticks["late"], skipped=ticks["skipped"])
+    print("frame time(16 ms timer) p50 {0:.1f} ms, p90 {1:.1f} ms, p99 {2:.1f} ms, max {3:.1f} ms | {4} ticks, {5} late, {6} skipped".format(
+        results["p50"], results["p90"], results["p99"], results["max"], ticks["ticks"], ticks["late"], ticks["skipped"]))
+    return results
+
+
+STARTUP_GUI = """
+import os, sys, time
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+start = time.perf_counter()
+sys.argv = ["main.py"]
+import main
+app = main.QtWidgets.QApplication(sys.argv)
+window = main.MainWindow()
+window.show()
+app.processEvents()
+"""
+STARTUP_HEADLESS = """
+import sys, time
+start = time.perf_counter()
+import headless
+headless.parse_args(["--headless", "--port", "none"])
+"""
+STARTUP_REPORT = """
+import os, resource
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "PySide6" in sys.modules, flush=True)
+os._exit(0)  # skip shutdown, GUI threads are not stopped
+"""
+
+
+def bench_startup():
+    print("Startup until ready to connect - GUI compared to headless logging")
+    print("{0:>10} {1:>10} {2:>10} {3:>8}".format("", "time s", "RSS MB", "Qt"))
+    results = {}
+    for name, code in (("gui", STARTUP_GUI), ("headless", STARTUP_HEADLESS)):
+        with tempfile.TemporaryDirectory() as directory:  # GUI creates its config file in working directory
+            env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+            result = subprocess.run([sys.executable, "-c", code + STARTUP_REPORT], cwd=directory, env=env,
+                                    capture_output=True, text=True, check=True)
+        seconds, rss, qt = result.stdout.split()[-3:]
+        print("{0:>10} {1:>10.2f} {2:>10.1f} {3:>8}".format(name, float(seconds), int(rss) / 1024, qt))
+        results[name] = {"seconds": float(seconds), "rss_mb": int(rss) / 1024}
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    global device_latency
+    benchmarks = ("frame", "ticks", "commands", "slots", "sequence", "waveform", "instrumentation", "integration", "pacing", "devices", "startup", "store", "export", "session", "plot", "gui")
+    parser = argparse.ArgumentParser(description="Benchmarks for the KELgui acquisition path")
+    parser.add_argument("--only", nargs="+", choices=benchmarks, help="run only these benchmarks")
+    parser.add_argument("--json", help="write results to this JSON file")
+    parser.add_argument("--latency", type=float, default=0.002, help="response time of the simulated load per command in seconds")
+    parser.add_argument("--samples", type=int, default=10, help="number of samples per measurement")
+    parser.add_argument("--ticks", type=int, default=500, help="number of polling ticks for tick latency benchmark")
+    parser.add_argument("--commands", type=int, default=100, help="number of user commands for command latency benchmark")
+    parser.add_argument("--sequence-steps", type=int, default=200, help="number of steps for host list benchmark")
+    parser.add_argument("--waveform-points", type=int, default=86400, help="number of points for waveform resampling benchmark")
+    parser.add_argument("--instrumentation-samples", type=int, default=20000, help="number of frames for instrumentation benchmark")
+    parser.add_argument("--integration-samples", type=int, default=200000, help="number of updates for integration benchmark")
+    parser.add_argument("--pacing-ticks", type=int, default=20, help="number of acquisitions for polling benchmark")
+    parser.add_argument("--devices-seconds", type=float, default=3, help="duration per number of loads for concurrent loads benchmark")
+    parser.add_argument("--store-samples", type=int, default=1000000, help="number of samples for storage benchmark")
+    parser.add_argument("--export-samples", type=int, default=200000, help="number of samples for export benchmark")
+    parser.add_argument("--session-samples", type=int, default=10000000, help="number of samples for session benchmark")
+    parser.add_argument("--plot-samples", type=int, default=10000000, help="maximum number of samples in view for graph benchmark")
+    parser.add_argument("--plot-raw-samples", type=int, default=1000000, help="maximum number of samples drawn without decimation")
+    parser.add_argument("--gui-seconds", type=float, default=5, help="duration of GUI frame time benchmark")
+    parser.add_argument("--gui-samples", type=int, default=1000000, help="number of samples in view for GUI frame time benchmark")
+    parser.add_argument("--gui-interval", type=float, default=0.05, help="measure interval for GUI frame time benchmark")
+    args = parser.parse_args()
+    device_latency = args.latency
+
+    runs = {"frame": lambda: bench_frame(args.samples),
+            "ticks": lambda: bench_ticks(args.ticks),
+            "commands": lambda: bench_commands(args.commands),
+            "slots": bench_slots,
+            "sequence": lambda: bench_sequence(args.sequence_steps),
+            "waveform": lambda: bench_waveform(args.waveform_points),
+            "instrumentation": lambda: bench_instrumentation(args.instrumentation_samples),
+            "integration": lambda: bench_integration(args.integration_samples),
+            "pacing": lambda: bench_pacing(args.pacing_ticks),
+            "devices": lambda: bench_devices(args.devices_seconds),
+            "startup": bench_startup,
+            "store": lambda: bench_store(args.store_samples),
+            "export": lambda: bench_export(args.export_samples),
+            "session": lambda: bench_session(args.session_samples),
+            "plot": lambda: bench_plot(args.plot_samples, args.plot_raw_samples),
+            "gui": lambda: bench_gui(args.gui_seconds, args.gui_samples, args.gui_interval)}
+    results = {}
+    for name in benchmarks:
+        if args.only is None or name in args.only:
+            results[name] = runs[name]()
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"commit": git_commit(), "time": datetime.datetime.now().isoformat(), "python": platform.python_version(),
+                       "platform": platform.platform(), "arguments": vars(args), "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
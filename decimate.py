@@ -0,0 +1,87 @@
+"""
+Min/max decimation of data for plotting.
+
+Plotting every sample of a long run makes redraws slower the longer it runs, while the plot can not show more than
+about one value per pixel anyway. Data is therefore reduced to the minimum and maximum of each bucket(in their original
+order), so the shape including single spikes stays visible while the number of plotted points only depends on the
+width of the plot.
+
+For zoomed out views a level of detail with min/max of fixed blocks of samples is kept, which is updated incrementally
+as samples get appended, so the cost of a redraw does not grow with the number of samples in view.
+"""
+
+import numpy
+
+
+def minmax_envelope(x: numpy.ndarray, y: numpy.ndarray, buckets: int):
+    """ Reduce x/y to min and max of y per bucket of equal sample count.
+
+    :return: tuple of x and y arrays with at most 2 * buckets points
+    """
+    n = len(x)
+    if n <= 2 * buckets:
+        return x, y
+    size = -(-n // buckets)
+    full = n // size * size
+    blocks = y[:full].reshape(-1, size)
+    index_min = blocks.argmin(axis=1)
+    index_max = blocks.argmax(axis=1)
+    base = numpy.arange(0, full, size)
+    index = numpy.column_stack((base + numpy.minimum(index_min, index_max), base + numpy.maximum(index_min, index_max))).ravel()
+    if full < n:  # incomplete last bucket
+        rest = y[full:]
+        index = numpy.concatenate((index, numpy.sort([full + rest.argmin(), full + rest.argmax()])))
+
+    return x[index], y[index]
+
+
+class DecimatedColumn(object):  # min/max decimation of one column with incrementally updated level of detail
+    def __init__(self, block_size: int = 256):
+        self.block_size = block_size
+        self.clear()
+
+    def clear(self):
+        self.offset = None  # offset of the SampleStore the level of detail belongs to
+        self.blocks = 0
+        self.lod_x = numpy.empty(0)
+        self.lod_y = numpy.empty(0)
+
+    def update(self, x: numpy.ndarray, y: numpy.ndarray, offset: int = 0):
+        """ Add min/max of blocks completed since last update. Level of detail is rebuilt if samples were dropped
+        from the store(offset changed) or the store got cleared. """
+        if offset != self.offset or len(x) < self.blocks * self.block_size:
+            self.clear()
+            self.offset = offset
+        complete = len(x) // self.block_size
+        if complete > self.blocks:
+            start, stop = self.blocks * self.block_size, complete * self.block_size
+            lod_x, lod_y = minmax_envelope(x[start:stop], y[start:stop], complete - self.blocks)
+            self.lod_x = numpy.concatenate((self.lod_x, lod_x))
+            self.lod_y = numpy.concatenate((self.lod_y, lod_y))
+            self.blocks = complete
+
+    def decimate(self, x: numpy.ndarray, y: numpy.ndarray, x_min: float, x_max: float, buckets: int):
+        """ Decimate samples between x_min and x_max(plus one sample on each side so lines continue out of view).
+
+        Values are returned as float64 even for float32 columns, pyqtgraph compares the bounds of the data with limits
+        near the float64 maximum which overflow when cast to float32.
+
+        :return: tuple of x and y arrays with at most about 2 * buckets points
+        """
+        start = max(int(numpy.searchsorted(x, x_min)) - 1, 0)
+        stop = min(int(numpy.searchsorted(x, x_max, side="right")) + 1, len(x))
+        if stop - start <= 8 * max(buckets, self.block_size):  # few enough samples to decimate directly
+            plot_x, plot_y = minmax_envelope(x[start:stop], y[start:stop], buckets)
+            return plot_x, plot_y.astype(numpy.float64)
+
+        lod_stop = self.blocks * self.block_size
+        lod_start = int(numpy.searchsorted(self.lod_x, x[start], side="right")) - 1
+        lod_end = int(numpy.searchsorted(self.lod_x, x[min(stop, lod_stop) - 1], side="right")) + 1
+        part_x = [self.lod_x[max(lod_start, 0):lod_end]]
+        part_y = [self.lod_y[max(lod_start, 0):lod_end]]
+        if stop > lod_stop:  # samples of incomplete last block
+            part_x.append(x[max(lod_stop, start):stop])
+            part_y.append(y[max(lod_stop, start):stop])
+
+        plot_x, plot_y = minmax_envelope(numpy.concatenate(part_x), numpy.concatenate(part_y), buckets)
+        return plot_x, plot_y.astype(numpy.float64)
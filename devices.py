@@ -0,0 +1,267 @@
+"""
+Control and logging of several loads at once.
+
+Each Device owns its connection with its own serial scheduler(thread) and its own acquisition loop thread, paced by
+deadline like the acquisition of the app. Samples go into a SampleStore and a run file per device. Since devices share
+nothing but the process, the cost grows linearly with the number of devices and a slow or unresponsive port only delays
+its own device. DeviceManager keeps the connected devices and provides an overview of all of them.
+
+Devices do not depend on Qt, they are used by the devices tab of the app as well as by headless logging. Commands
+changing a device(open, input, close) have a blocking variant for headless logging and an awaitable one(suffix _async)
+for the app, which waits for the serial thread of the device without blocking the event loop.
+"""
+
+import asyncio
+import threading
+import serial
+from kelctl import *
+from acquisition import read_frame, read_frame_serial, RunTracker
+from scheduler import SerialScheduler, PRIORITY_POLL
+from samplestore import SampleStore
+from recorder import RunRecorder, new_run_path, RECORD_DTYPE
+from pacer import DeadlinePacer
+from simulator import open_load
+from instrumentation import SerialInstrumentation, instrument
+from quality import QualityIndex
+
+
+class Device(object):
+    def __init__(self, port: str, baudrate: BaudRate = BaudRate.R115200, debug: bool = False, record: bool = True,
+                 run_path: str = None, frame_acquisition: bool = True, memory_window: int = 1000000,
+                 run_directory: str = "runs"):
+        """ Load on a port, connected by open or open_async.
+
+        :param record: write samples to a run file
+        :param run_path: run file for the first run, later runs(and the first one if not set) get a new file in
+        run_directory
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.debug = debug
+        self.record = record
+        self.run_path = run_path
+        self.run_directory = run_directory
+        self.frame_acquisition = frame_acquisition
+        self.scheduler = SerialScheduler("serial " + port)
+        self.instrumentation = SerialInstrumentation()
+        self.load = None
+        self.model = ""
+        self.run_state = RunTracker()
+        self.samples = SampleStore(max_length=memory_window)
+        self.recorder = None
+        self.pacer = DeadlinePacer(0.5)
+        self.quality = QualityIndex(0.5)
+        self.frame = None  # last measurement frame
+        self.error = None  # message of error that stopped the acquisition loop
+        self._lock = threading.Lock()  # recorder is replaced by clear while acquisition loop records
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _connect(self):  # runs on the serial thread
+        self.load = open_load(self.port, self.baudrate, self.debug)
+        instrument(self.load, self.instrumentation)
+        self.model = self.load.model
+
+    def open(self):
+        try:
+            self.scheduler.call(self._connect)
+        except BaseException:
+            self.scheduler.stop()
+            raise
+
+    async def open_async(self):
+        try:
+            await self.scheduler.run(self._connect)
+        except BaseException:
+            self.scheduler.stop()
+            raise
+
+    @property
+    def running(self):  # acquisition loop is running
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float):
+        self.stop()
+        self.error = None
+        self.pacer.interval = interval
+        self.pacer.reset_stats()
+        self.quality.interval = interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="acquisition " + self.port, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            if self._thread is not threading.current_thread():
+                self._thread.join()
+            self._thread = None
+
+    async def stop_async(self):  # waits for the acquisition loop to finish its current tick without blocking
+        if self._thread is not None:
+            self._stop.set()
+            while self._thread.is_alive():
+                await asyncio.sleep(0.01)
+            self._thread = None
+
+    def _run(self):
+        battery_hint = False
+        skipped = 0  # deadlines skipped by pacer up to the previous sample
+        self.pacer.start()
+        while not self._stop.is_set():
+            self.pacer.begin()
+            try:
+                if self.frame_acquisition:
+                    frame = self.scheduler.call(read_frame, self.load, battery_hint, priority=PRIORITY_POLL)
+                else:
+                    frame = self.scheduler.call(read_frame_serial, self.load, priority=PRIORITY_POLL)
+            except (serial.serialutil.SerialException, ValueError, AttributeError) as ex:
+                self.error = str(ex)
+                self.quality.error(self.error)
+                break
+            battery_hint = frame.mode == Mode.battery
+            self.frame = frame
+            if self.run_state.update(frame):
+                self._record(self.run_state.run_time.total_seconds(), frame.voltage, frame.current, frame.power)
+                self.quality.sample(self.run_state.run_time.total_seconds(), self.pacer.skipped - skipped)
+                skipped = self.pacer.skipped
+            self._stop.wait(self.pacer.end())
+
+    def _record(self, timestamp: float, voltage: float, current: float, power: float):
+        with self._lock:
+            self.samples.append(timestamp, voltage, current, power)
+            if self.record:
+                if self.recorder is None:
+                    self.recorder = RunRecorder(self.run_path if self.run_path else new_run_path(self.run_directory))
+                    self.run_path = None
+                self.recorder.append(timestamp, voltage, current, power)
+
+    def clear(self):  # clear samples and end current run file
+        with self._lock:
+            self.samples.clear()
+            self.quality.reset()
+            if self.recorder is not None:
+                self.recorder.close()
+                self.recorder = None
+
+    def columns(self) -> dict:  # all columns of current run, paged from run file if not all samples are still in memory
+        with self._lock:
+            if self.samples.offset > 0 and self.recorder is not None:
+                records = self.recorder.read()
+                return {name: records[name] for name in RECORD_DTYPE.names}
+            return {name: column.copy() for name, column in self.samples.view().items()}
+
+    def set_input(self, on: bool):
+        self.scheduler.call(self.load.input.on if on else self.load.input.off)
+        self._input_changed(on)
+
+    async def set_input_async(self, on: bool):
+        await self.scheduler.run(self.load.input.on if on else self.load.input.off)
+        self._input_changed(on)
+
+    def _input_changed(self, on: bool):
+        if on:
+            self.run_state.start()
+            self.clear()
+        else:
+            self.run_state.stop()
+
+    def _disconnect(self, input_off: bool):  # runs on the serial thread
+        if self.load is not None and self.load.is_open:
+            if input_off:
+                self.load.input.off()
+            self.load.close()
+
+    def close(self, input_off: bool = False):
+        self.stop()
+        try:
+            self.scheduler.call(self._disconnect, input_off)
+        finally:
+            self._release()
+
+    async def close_async(self, input_off: bool = False):
+        await self.stop_async()
+        try:
+            await self.scheduler.run(self._disconnect, input_off)
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._lock:
+            if self.recorder is not None:
+                self.recorder.close()
+        self.scheduler.stop()
+
+    def status(self) -> dict:  # latest values for overview
+        frame = self.frame
+        charge = self.run_state.ah_value
+        if frame is not None and frame.mode == Mode.battery and frame.batt_cap is not None:
+            charge = frame.batt_cap
+        return {"port": self.port, "model": self.model, "mode": frame.mode.value if frame else "",
+                "input": frame.input_state == OnOffState.on if frame else False,
+                "voltage": frame.voltage if frame else 0.0, "current": frame.current if frame else 0.0,
+                "power": frame.power if frame else 0.0, "ah": charge, "wh": self.run_state.wh_value,
+                "run_time": self.run_state.run_time.total_seconds() if self.run_state.running else 0.0,
+                "samples": self.samples.total_length, "late": self.pacer.late, "skipped": self.pacer.skipped,
+                "running": self.running, "error": self.error}
+
+
+class DeviceManager(object):
+    def __init__(self):
+        self.devices = []
+        self.interval = 0.5
+
+    def __len__(self):
+        return len(self.devices)
+
+    def add(self, port: str, baudrate: BaudRate = BaudRate.R115200, start: bool = True, **kwargs) -> Device:
+        """ Connect to a load and start its acquisition loop.
+
+        :param kwargs: passed on to Device
+        """
+        device = self._new_device(port, baudrate, **kwargs)
+        device.open()
+        return self._added(device, start)
+
+    async def add_async(self, port: str, baudrate: BaudRate = BaudRate.R115200, start: bool = True, **kwargs) -> Device:
+        device = self._new_device(port, baudrate, **kwargs)
+        await device.open_async()
+        if self._connected(port):  # added by another call while connecting
+            await device.close_async()
+            raise ValueError("Already connected to " + port)
+        return self._added(device, start)
+
+    def _connected(self, port: str) -> bool:
+        return any(device.port == port for device in self.devices)
+
+    def _new_device(self, port: str, baudrate: BaudRate, **kwargs) -> Device:
+        if self._connected(port):
+            raise ValueError("Already connected to " + port)
+        return Device(port, baudrate, **kwargs)
+
+    def _added(self, device: Device, start: bool) -> Device:
+        self.devices.append(device)
+        if start:
+            device.start(self.interval)
+        return device
+
+    def remove(self, device: Device, input_off: bool = False):
+        self.devices.remove(device)
+        device.close(input_off)
+
+    async def remove_async(self, device: Device, input_off: bool = False):
+        self.devices.remove(device)
+        await device.close_async(input_off)
+
+    def set_interval(self, interval: float):  # takes effect from next deadline on
+        self.interval = interval
+        for device in self.devices:
+            device.pacer.interval = interval
+            device.quality.interval = interval
+
+    def overview(self) -> list:
+        return [device.status() for device in self.devices]
+
+    def close_all(self, input_off: bool = False):
+        for device in list(self.devices):
+            self.remove(device, input_off)
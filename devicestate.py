@@ -0,0 +1,124 @@
+"""
+Cache of the limits and settings of the connected load.
+
+Limits and settings rarely change but reading them takes a serial round-trip per value, so they are read once(at
+connect or when refreshed on request) and taken from the cache afterward, e.g. for validating dynamic mode values
+without interrupting the acquisition. Values written by the app are invalidated and read again the next time they are
+needed, changes made on the device itself are only picked up by refreshing.
+
+Settings are written as a diff against the cached snapshot: only settings which differ from the values on the load get
+sent, since every write costs a round-trip and rewrites the persistent storage of the load.
+
+Reading them uses the pipelined queries of the frame acquisition: the queries of a batch are written at once and their
+responses read back in bulk, so a refresh costs a few batches instead of one round-trip per value. The batches are
+separate jobs on the serial scheduler, so acquisition ticks run in between them.
+"""
+
+import re
+from kelctl import *
+from acquisition import query_pipelined
+
+LIMITS = ("voltage_limit", "current_limit", "resistance_limit", "power_limit")
+SETTINGS = ("baudrate", "beep", "lock", "trigger", "compensation", "dhcp", "ipaddress", "subnetmask", "gateway",
+            "macaddress", "port")
+SWITCHES = ("beep", "lock", "trigger", "compensation", "dhcp")  # settings with on/off state, read with get()
+WRITE_ORDER = ("beep", "lock", "trigger", "compensation", "ipaddress", "subnetmask", "gateway", "macaddress", "port",
+               "dhcp", "baudrate")  # baudrate last, the connection only works at the new rate afterward
+DEVICE_SPECIFIC = ("baudrate", "ipaddress", "macaddress")  # not applied to other loads: addresses have to be unique per
+# load and a new baudrate would cut their connection
+
+
+QUERIES = {"voltage_limit": (":VOLT:UPP?", lambda r: float(r.rstrip("V"))),
+           "current_limit": (":CURR:UPP?", lambda r: float(r.rstrip("A"))),
+           "resistance_limit": (":RES:UPP?", lambda r: float(r.rstrip("OHM"))),
+           "power_limit": (":POW:UPP?", lambda r: float(r.rstrip("W"))),
+           "baudrate": (":SYST:BAUD?", lambda r: BaudRate(int(r))),
+           "beep": (":SYST:BEEP?", OnOffState), "lock": (":SYST:LOCK?", OnOffState),
+           "trigger": (":SYST:EXIT?", OnOffState), "compensation": (":SYST:COMP?", OnOffState),
+           "dhcp": (":SYST:DHCP?", OnOffState), "ipaddress": (":SYST:IPAD?", str), "subnetmask": (":SYST:SMASK?", str),
+           "gateway": (":SYST:GATE?", str), "macaddress": (":SYST:MAC?", str), "port": (":SYST:PORT?", int)}
+BATCH_SIZE = 6  # queries per pipelined batch, an acquisition tick can run between batches
+
+
+def batches(names, size: int = BATCH_SIZE) -> list:
+    names = tuple(names)
+    return [names[i:i + size] for i in range(0, len(names), size)]
+
+
+def read_values_pipelined(load: KELSerial, names) -> dict:  # read values in a single write, has to run on serial thread
+    responses = query_pipelined(load, [QUERIES[name][0] for name in names])
+    values = {}
+    for name, response in zip(names, responses):
+        try:
+            values[name] = QUERIES[name][1](response)
+        except ValueError:
+            raise ValueError("Invalid value received from device for {0}: {1}".format(name, response))
+    return values
+
+
+def read_values(settings, names) -> dict:  # read values from load, has to run on its serial thread
+    values = {}
+    for name in names:
+        value = getattr(settings, name)
+        values[name] = value.get() if name in SWITCHES else value
+    return values
+
+
+def normalized(name: str, value):  # comparable form of a setting as read or as entered
+    if name in SWITCHES:
+        return bool(value if isinstance(value, bool) else value.value)
+    if name == "baudrate":
+        return value.b
+    if name == "macaddress":
+        return re.sub("[-:]", "", str(value)).lower()
+    if name == "port":
+        return int(value)
+    return str(value).strip()
+
+
+def settings_diff(current: dict, wanted: dict) -> dict:  # wanted settings which differ from current(or are not known)
+    return {name: value for name, value in wanted.items()
+            if name not in current or normalized(name, current[name]) != normalized(name, value)}
+
+
+def describe_diff(current: dict, changes: dict) -> list:  # one line per changed setting, "beep: on -> off"
+    def text(name, value):
+        value = normalized(name, value)
+        return ("on" if value else "off") if name in SWITCHES else str(value)
+
+    return ["{0}: {1} -> {2}".format(name, text(name, current[name]) if name in current else "?", text(name, changes[name]))
+            for name in WRITE_ORDER if name in changes]
+
+
+def write_values(settings, values: dict):  # write settings to load, has to run on its serial thread
+    for name in WRITE_ORDER:
+        if name not in values:
+            continue
+        if name in SWITCHES:
+            switch = getattr(settings, name)
+            switch.on() if values[name] else switch.off()
+        else:
+            setattr(settings, name, values[name])
+
+
+class DeviceState(object):
+    def __init__(self):
+        self._values = {}
+
+    def __contains__(self, name: str):
+        return name in self._values
+
+    def __getitem__(self, name: str):
+        return self._values[name]
+
+    def missing(self, names) -> tuple:  # names of values not in cache
+        return tuple(name for name in names if name not in self._values)
+
+    def update(self, values: dict):
+        self._values.update(values)
+
+    def invalidate(self, *names):  # values written or possibly changed, all values if no names given
+        if not names:
+            self._values.clear()
+        for name in names:
+            self._values.pop(name, None)
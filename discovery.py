@@ -0,0 +1,172 @@
+"""
+Discovery of serial ports with a load connected.
+
+A background thread lists the serial ports periodically, so ports plugged in or removed are picked up without user
+action. USB ports which appear are probed in parallel with an identity query(*IDN?) and a short timeout, which also
+finds rebadged loads that do not show "KORAD" in their port description. Probe results are cached by USB serial number
+in a JSON file, so known adapters are recognized right away without opening their port again.
+
+The baudrate of a load can be detected the same way, by probing the rates one after another(a port can only be open
+with one rate at a time) with a timeout just long enough for the identity response at that rate.
+"""
+
+import concurrent.futures
+import json
+import threading
+import serial
+import serial.tools.list_ports
+
+IDENTITY_MARKERS = ("KEL10", "KORAD")  # identity responses of loads contain one of these
+IDENTITY_BYTES = 64  # upper bound of identity response length
+
+
+class PortInfo(object):  # serial port and the load found on it
+    __slots__ = ("device", "description", "serial_number", "model")
+
+    def __init__(self, device: str, description: str, serial_number: str = None, model: str = None):
+        self.device = device
+        self.description = description
+        self.serial_number = serial_number
+        self.model = model  # identity of the load, None if no load was found on the port
+
+    def __repr__(self):
+        return "PortInfo({0}, {1}, {2})".format(self.device, self.description, self.model)
+
+
+def probe(device: str, baudrate: int, timeout: float = 0.3):
+    """ Query identity of a load on a port.
+
+    :return: identity string if a load answered, None otherwise
+    """
+    try:
+        with serial.Serial(device, baudrate, timeout=timeout, write_timeout=timeout) as port:
+            port.reset_input_buffer()
+            port.write(b"*IDN?\n")
+            response = port.readline().decode(errors="replace").strip()
+    except (serial.serialutil.SerialException, OSError, ValueError):
+        return None
+    if any(marker in response.upper() for marker in IDENTITY_MARKERS):
+        return response
+    return None
+
+
+def detect_baudrate(device: str, rates, turnaround: float = 0.05):
+    """ Find the baudrate a load answers at, fastest rates are tried first since a wrong guess costs less time there.
+
+    :param rates: candidate baudrates
+    :param turnaround: time the load takes before responding
+    :return: tuple of baudrate and identity, (None, None) if the load did not answer at any rate
+    """
+    for rate in sorted(rates, reverse=True):
+        identity = probe(device, rate, turnaround + IDENTITY_BYTES * 10 / rate)
+        if identity is not None:
+            return rate, identity
+    return None, None
+
+
+class PortCache(object):  # probe results by USB serial number, "" for adapters without load
+    def __init__(self, path: str = "ports.json"):
+        self.path = path
+        self._models = {}
+        try:
+            with open(path) as file:
+                self._models = json.load(file)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, serial_number: str):
+        return self._models.get(serial_number)
+
+    def set(self, serial_number: str, model: str):
+        if self._models.get(serial_number) == model:
+            return
+        self._models[serial_number] = model
+        try:
+            with open(self.path, "w") as file:
+                json.dump(self._models, file, indent=2)
+        except OSError:
+            pass
+
+
+class PortDiscovery(object):
+    def __init__(self, on_change, baudrate: int = 115200, interval: float = 1.0, cache: PortCache = None, exclude=None):
+        """
+        :param on_change: called from the discovery thread with the list of PortInfo whenever ports or probe results changed
+        :param interval: seconds between listing the ports
+        :param exclude: optional callable returning ports which must not be probed, e.g. because they are connected
+        """
+        self.on_change = on_change
+        self.baudrate = baudrate
+        self.interval = interval
+        self.cache = cache if cache is not None else PortCache()
+        self.exclude = exclude
+        self.ports = []
+        self._known = {}  # device -> PortInfo of ports probed or taken from cache
+        self._force = False  # probe again even if cached
+        self._rescan = threading.Event()
+        self._stop = threading.Event()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="probe")
+        self._thread = threading.Thread(target=self._run, name="port discovery", daemon=True)
+        self._thread.start()
+
+    def rescan(self):  # list ports right away and probe all of them again
+        self._force = True
+        self._rescan.set()
+
+    def stop(self):
+        self._stop.set()
+        self._rescan.set()
+        self._thread.join()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._rescan.clear()
+            self._scan()
+            self._rescan.wait(self.interval)
+
+    def _scan(self):
+        excluded = set(self.exclude()) if self.exclude is not None else set()
+        if self._force:
+            self._force = False
+            self._known.clear()
+            force = True
+        else:
+            force = False
+        ports = []
+        probes = {}
+        for port in serial.tools.list_ports.comports():
+            known = self._known.get(port.device)
+            if known is not None and known.serial_number == port.serial_number:
+                ports.append(known)
+                continue
+            info = PortInfo(port.device, port.description, port.serial_number)
+            ports.append(info)
+            if not force and port.serial_number is not None and self.cache.get(port.serial_number) is not None:
+                info.model = self.cache.get(port.serial_number) or None
+                self._known[port.device] = info
+            elif port.vid is not None and port.device not in excluded:  # only USB adapters get probed
+                probes[port.device] = (info, self._executor.submit(probe, port.device, self.baudrate))
+        for info, future in probes.values():
+            info.model = future.result()
+            self._known[info.device] = info
+            if info.serial_number is not None:
+                self.cache.set(info.serial_number, info.model or "")
+
+        current = {port.device for port in ports}
+        for device in list(self._known):
+            if device not in current:  # unplugged
+                del self._known[device]
+        if [(port.device, port.model) for port in ports] != [(port.device, port.model) for port in self.ports]:
+            self.ports = ports
+            self.on_change(list(ports))
+
+
+def preferred_port(ports: list):  # port to preselect: first one with a load, then one named like a load
+    for port in ports:
+        if port.model is not None:
+            return port.device
+    for port in ports:
+        if "KORAD" in port.description:
+            return port.device
+    return None
@@ -0,0 +1,52 @@
+"""
+Export of recorded data to CSV.
+
+All channels share the same time base, so they are written into a single file with one row per sample. Rows are
+formatted and written in chunks, which allows reporting progress and cancelling between chunks.
+"""
+
+import os
+import numpy
+
+COLUMN_HEADERS = {"time": "Time", "voltage": "Voltage", "current": "Current", "power": "Power"}
+SINGLE_CHANNEL_HEADERS = ("Time", "Value")  # header of exports of a single channel, as written by earlier versions
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def write_csv(path: str, columns: dict, names=("time", "voltage", "current", "power"), chunk_rows: int = 50000,
+              progress=None, cancelled=None) -> int:
+    """ Write columns as CSV file.
+
+    :param columns: dict of equally long arrays, as returned by SampleStore.view()
+    :param names: names of columns to write, in order, time and a single channel get the header "Time,Value"
+    :param progress: optional callable getting the number of rows written after each chunk
+    :param cancelled: optional callable, export stops(and the partial file is removed) once it returns True
+    :return: number of rows written
+    """
+    data = [columns[name] for name in names]
+    rows = min(len(column) for column in data)
+    row_format = ",".join(["%f"] * len(names)) + "\n"
+
+    try:
+        with open(path, "w", newline="") as file:
+            if len(names) == 2 and names[0] == "time":
+                headers = SINGLE_CHANNEL_HEADERS
+            else:
+                headers = [COLUMN_HEADERS.get(name, name) for name in names]
+            file.write(",".join(headers) + "\n")
+            for start in range(0, rows, chunk_rows):
+                if cancelled is not None and cancelled():
+                    raise ExportCancelled()
+                stop = min(start + chunk_rows, rows)
+                chunk = numpy.column_stack([column[start:stop] for column in data]).tolist()
+                file.write("".join([row_format % tuple(row) for row in chunk]))
+                if progress is not None:
+                    progress(stop)
+    except ExportCancelled:
+        os.remove(path)
+        raise
+
+    return rows
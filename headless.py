@@ -0,0 +1,123 @@
+"""
+Headless logging of runs without user interface, e.g. for unattended discharge tests on machines without display.
+
+    python main.py --headless --port /dev/ttyACM0 --interval 0.5 --out run.bin
+    python main.py --headless --port /dev/ttyACM0 --port /dev/ttyACM1 --out run.bin
+
+Measurements are acquired the same way as by the app(measurement frames paced by deadline, runtime and Ah/Wh
+integrated by RunTracker) and streamed into a run file(see recorder.py), which can be converted to CSV with session.py.
+Several loads are logged at once by passing --port more than once, each one gets its own acquisition thread(see
+devices.py) and its own run file, numbered if --out is given. Neither Qt nor pyqtgraph get imported, which keeps startup
+time and memory use low.
+"""
+
+import argparse
+import os
+import time
+import serial
+from kelctl import *
+from devices import DeviceManager
+from recorder import new_run_path
+from quality import write_report
+from simulator import SIMULATED_PORT
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Log measurements of KEL103 loads to run files without user interface")
+    parser.add_argument("--headless", action="store_true", help="run without user interface(required when started through main.py)")
+    parser.add_argument("--port", action="append", default=[], help="serial port of a load, repeat to log several loads")
+    parser.add_argument("--simulate", type=int, nargs="?", const=1, default=0, metavar="COUNT",
+                        help="log from simulated loads instead of(or in addition to) serial ports")
+    parser.add_argument("--baudrate", type=int, default=BaudRate.R115200.b, choices=[rate.b for rate in BaudRate],
+                        help="baudrate of the serial connection")
+    parser.add_argument("--interval", type=float, default=0.5, help="interval between measurements in seconds")
+    parser.add_argument("--out", help="run file to write, default is a new file in runs/")
+    parser.add_argument("--duration", type=float, help="stop logging after this many seconds, default is until interrupted")
+    parser.add_argument("--start", action="store_true", help="switch input of loads on at start and off at end")
+    parser.add_argument("--status-interval", type=float, default=10.0, help="seconds between status lines, 0 to disable")
+    parser.add_argument("--no-frame-acquisition", action="store_true", help="read values one by one instead of as frame")
+    parser.add_argument("--serial-debug", action="store_true", help="print serial communication")
+    parser.add_argument("--diagnostics", help="write latency, timeouts and errors per command to this CSV file at the end")
+    parser.add_argument("--quality", help="write sampling quality report(rate, intervals, gaps) to this JSON file at the end")
+
+    args = parser.parse_args(argv)
+    for index in range(args.simulate):
+        args.port.append(SIMULATED_PORT if index == 0 else "{0}:{1}".format(SIMULATED_PORT, index + 1))
+    if not args.port:
+        parser.error("--port or --simulate is required")
+
+    return args
+
+
+def numbered_path(path: str, index: int, count: int) -> str:  # run.bin -> run-1.bin, run-2.bin... for several loads
+    if count == 1:
+        return path
+    base, extension = os.path.splitext(path)
+    return "{0}-{1}{2}".format(base, index + 1, extension)
+
+
+def status_line(status: dict) -> str:
+    return "{0} {1} {2} {3:.3f} V {4:.5f} A {5:.5f} Ah {6:.5f} Wh | {7} samples, {8} late, {9} skipped".format(
+        status["port"], time.strftime("%H:%M:%S", time.gmtime(status["run_time"])), status["mode"], status["voltage"],
+        status["current"], status["ah"], status["wh"], status["samples"], status["late"], status["skipped"])
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    manager = DeviceManager()
+    manager.set_interval(args.interval)
+    try:
+        for index, port in enumerate(args.port):
+            path = numbered_path(args.out, index, len(args.port)) if args.out else new_run_path()
+            device = manager.add(port, BaudRate(args.baudrate), start=False, debug=args.serial_debug, run_path=path,
+                                 frame_acquisition=not args.no_frame_acquisition)
+            print("Logging {0} on {1} to {2}".format(device.model, port, path))
+    except serial.serialutil.SerialException as ex:
+        print("Could not connect to load: " + str(ex))
+        manager.close_all()
+        return 1
+
+    result = 0
+    print("Stop with Ctrl+C")
+    try:
+        for device in manager.devices:
+            if args.start:
+                device.set_input(True)
+            device.start(args.interval)
+        stop_time = None if args.duration is None else time.monotonic() + args.duration
+        next_status = time.monotonic() + args.status_interval
+        while stop_time is None or time.monotonic() < stop_time:
+            if not any(device.running for device in manager.devices):  # all loops stopped by errors
+                break
+            if args.status_interval > 0 and time.monotonic() >= next_status:
+                for status in manager.overview():
+                    print(status_line(status))
+                next_status += args.status_interval
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    except (serial.serialutil.SerialException, ValueError, AttributeError) as ex:
+        print("Error during updating values: " + str(ex))
+        result = 1
+    finally:
+        for device in manager.devices:
+            device.stop()
+        for index, device in enumerate(manager.devices):
+            if device.error is not None:
+                print("Error during updating values of {0}: {1}".format(device.port, device.error))
+                result = 1
+            report = device.quality.report(device.columns()["time"])
+            print("{0}: {1} samples | {2:.5f} Ah {3:.5f} Wh | {4} late, {5} skipped | {6:.2f} samples/s, p99 interval {7:.1f} ms, {8} gaps".format(
+                device.port, device.samples.total_length, device.run_state.ah_value, device.run_state.wh_value,
+                device.pacer.late, device.pacer.skipped, report["mean_rate"], report["interval_p99"] * 1000, len(report["gaps"])))
+            if args.quality:
+                write_report(numbered_path(args.quality, index, len(manager)), report)
+            if args.diagnostics:
+                device.instrumentation.write_csv(numbered_path(args.diagnostics, index, len(manager)))
+        manager.close_all(input_off=args.start)
+
+    return result
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
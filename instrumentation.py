@@ -0,0 +1,171 @@
+"""
+Instrumentation of the serial communication with the load.
+
+InstrumentedPort wraps the pyserial port of a KELSerial, so every command sent to the load is counted, no matter if it
+is sent by the property accessors of KELSerial or pipelined by acquisition.py. The latency of a query is the time from
+writing it until its response line is read, which includes waiting behind responses of earlier pipelined queries.
+Queries without response are counted as timeouts, responses not matching the expected format as parse errors.
+"""
+
+import bisect
+import collections
+import csv
+import math
+import re
+import threading
+import time
+from acquisition import raw_serial
+
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, math.inf)  # upper bounds in seconds
+NUMBER = r"-?\d+(\.\d+)?"
+RESPONSE_FORMATS = {  # expected responses by prefix of query, responses of other queries are not checked
+    ":MEAS:": re.compile(NUMBER + "[VAW]$"),
+    ":BATT:TIM?": re.compile(NUMBER + "M$"),
+    ":BATT:CAP?": re.compile(NUMBER + "AH$"),
+    ":INP?": re.compile("(ON|OFF|0|1)$"),
+    ":FUNC?": re.compile("[A-Za-z ]+$"),
+}
+
+
+def command_name(line: str) -> str:  # command without its arguments, e.g. ":CURR 1.0000A" -> ":CURR"
+    return line.strip().split(" ", 1)[0].upper()
+
+
+def bucket_label(bound: float) -> str:
+    return "<={0:g}ms".format(bound * 1000) if bound != math.inf else ">{0:g}ms".format(LATENCY_BUCKETS[-2] * 1000)
+
+
+class CommandStats(object):
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.timeouts = 0
+        self.errors = 0
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, latency: float):
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """ Upper bound of the histogram bucket containing the q-th percentile(0-100), limited to the maximum. """
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.histogram):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class SerialInstrumentation(object):  # statistics per command, shared between serial thread and UI
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.commands = {}
+        self.started = time.time()
+
+    def _stats(self, name: str) -> CommandStats:
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+        return stats
+
+    def record(self, name: str, latency: float):
+        with self._lock:
+            self._stats(name).add(latency)
+
+    def record_timeout(self, name: str):
+        with self._lock:
+            self._stats(name).timeouts += 1
+
+    def record_error(self, name: str):
+        with self._lock:
+            self._stats(name).errors += 1
+
+    def reset(self):
+        with self._lock:
+            self.commands = {}
+            self.started = time.time()
+
+    def snapshot(self) -> list:
+        """ Statistics of all commands, most frequent first.
+
+        :return: list of dicts with command, count, mean/p50/p90/max latency in ms, timeouts, errors and histogram
+        """
+        with self._lock:
+            rows = []
+            for name, stats in self.commands.items():
+                rows.append({"command": name, "count": stats.count, "mean_ms": stats.mean * 1000,
+                             "p50_ms": stats.percentile(50) * 1000, "p90_ms": stats.percentile(90) * 1000,
+                             "max_ms": stats.max * 1000, "timeouts": stats.timeouts, "errors": stats.errors,
+                             "histogram": list(stats.histogram)})
+        rows.sort(key=lambda row: row["count"], reverse=True)
+        return rows
+
+    def write_csv(self, path: str):
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["command", "count", "mean_ms", "p50_ms", "p90_ms", "max_ms", "timeouts", "errors"] +
+                            [bucket_label(bound) for bound in LATENCY_BUCKETS])
+            for row in self.snapshot():
+                writer.writerow([row["command"], row["count"], "%f" % row["mean_ms"], "%f" % row["p50_ms"],
+                                 "%f" % row["p90_ms"], "%f" % row["max_ms"], row["timeouts"], row["errors"]] + row["histogram"])
+
+
+class InstrumentedPort(object):  # wraps a pyserial port, everything not needed for instrumentation is passed through
+    def __init__(self, port, instrumentation: SerialInstrumentation):
+        self.port = port
+        self.instrumentation = instrumentation
+        self.pending = collections.deque()  # (command, time written) of queries waiting for their response
+
+    def __getattr__(self, name):
+        return getattr(self.port, name)
+
+    def write(self, data: bytes):
+        start = time.perf_counter()
+        written = self.port.write(data)
+        end = time.perf_counter()
+        for line in data.decode('ascii', 'replace').split("\n")[:-1]:
+            name = command_name(line)
+            if name.endswith("?"):
+                self.pending.append((name, start))
+            else:  # commands without response only take the time to write them
+                self.instrumentation.record(name, end - start)
+        return written
+
+    def readline(self):
+        response = self.port.readline()
+        if not self.pending:  # additional lines of a multi-line response
+            return response
+        name, start = self.pending.popleft()
+        if response == b"":
+            self.instrumentation.record_timeout(name)
+            self.pending.clear()  # remaining responses are out of order after a timeout
+            return response
+        self.instrumentation.record(name, time.perf_counter() - start)
+        for prefix, response_format in RESPONSE_FORMATS.items():
+            if name.startswith(prefix):
+                if not response_format.match(response.decode('ascii', 'replace').strip()):
+                    self.instrumentation.record_error(name)
+                break
+        return response
+
+    def reset_input_buffer(self):
+        self.pending.clear()
+        self.port.reset_input_buffer()
+
+
+def instrument(load, instrumentation: SerialInstrumentation):
+    """ Route all communication of a KELSerial through an InstrumentedPort. """
+    kel_serial = raw_serial(load)
+    if not isinstance(kel_serial.port, InstrumentedPort):
+        kel_serial.port = InstrumentedPort(kel_serial.port, instrumentation)
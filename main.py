@@ -1,38 +1,50 @@
+import time
+startup_marks = [("start", time.perf_counter())]  # phases of startup, reported with --profile-startup
+import asyncio
 import datetime
+import functools
 import math
 import os
 import sys
 import configparser
-import serial.tools.list_ports
+import serial
 import atexit
+if __name__ == "__main__" and "--headless" in sys.argv:  # dispatched before Qt and pyqtgraph get imported
+    import headless
+    sys.exit(headless.main())
 import ui_mainwindow
-import time
-import numpy
-from PySide6 import QtWidgets, QtCore
+from PySide6 import QtWidgets, QtCore, QtAsyncio
 from PySide6.QtCore import Signal, QTimer, Slot
 from PySide6.QtWidgets import *
 from PySide6.QtGui import QIcon, QColor
-import pyqtgraph as pg
-from pglive.kwargs import Crosshair, Axis
-from pglive.sources.data_connector import DataConnector
-from pglive.sources.live_plot import LiveLinePlot
-from pglive.sources.live_axis import LiveAxis
-from pglive.sources.live_axis_range import LiveAxisRange
-from pglive.sources.live_plot_widget import LivePlotWidget
 from kelctl import *
+from acquisition import read_frame, read_frame_serial, integrate, RunTracker
+from scheduler import SerialScheduler, PRIORITY_POLL
+from samplestore import SampleStore
+from recorder import RunRecorder, new_run_path, RECORD_DTYPE
+from export import write_csv, ExportCancelled
+from session import save_session
+from decimate import DecimatedColumn
+from pacer import DeadlinePacer
+from simulator import open_load, start_simulated_port, SIMULATED_PORT
+from instrumentation import SerialInstrumentation, instrument, LATENCY_BUCKETS, bucket_label
+from devices import DeviceManager
+from quality import QualityIndex, write_report, report_path
+from sequencer import list_sequence, read_program, send_setpoint, write_step_table, step_table_path, COMMANDS, LIMITS as SETPOINT_LIMITS
+from waveform import read_waveform, waveform_sequence, update_interval, MIN_INTERVAL
+from devicestate import DeviceState, read_values, read_values_pipelined, batches, write_values, settings_diff, describe_diff, LIMITS, SETTINGS, DEVICE_SPECIFIC
+from discovery import PortDiscovery, preferred_port, detect_baudrate
+from provisioning import write_slots, init_slot_writes
 # from library.kelctl import * # only used for testing local changes in library
+startup_marks.append(("imports", time.perf_counter()))
 
 basedir = os.path.dirname(__file__)
-running = False
-start_time = datetime.datetime.now()
-amps_list = [(0.0, 0.0)]  # List of tuple(time, amps)
-volts_list = [(0.0, 0.0)]  # List of tuple(time, volts)
-watts_list = [(0.0, 0.0)]  # List of tuple(time, watts)
-ah_value = 0.0
-wh_value = 0.0
+run_state = RunTracker()  # running state, runtime and Ah/Wh of current run
+samples = SampleStore(max_length=1000000)  # recorded time, voltage, current and power(newest samples of run)
+recorder = None  # RunRecorder of current run, all samples of run on disk
+quality = QualityIndex(0.5)  # intervals, skipped deadlines and error gaps of current run
+device_state = DeviceState()  # limits and settings of connected load
 configfile_name = "config.ini"
-blocking_serial = False
-previous_run_time = 0.0
 
 setting_off_stop = True
 setting_off_disconnect = False
@@ -41,18 +53,71 @@ setting_serial_debug = False
 setting_baudrate = BaudRate.R115200
 setting_crosshair = True
 setting_graph_time = 30.0
+setting_frame_acquisition = True
+setting_record_runs = False  # opt-in, every run leaves a file in setting_run_directory
+setting_run_directory = "runs"
+setting_memory_window = 1000000
+setting_auto_baudrate = False
 
 load = KELSerial(None, setting_baudrate, setting_serial_debug, 0.0)
+scheduler = SerialScheduler()  # every access to load has to go through here
+simulated_port = None  # port of simulated load when started with --simulate
+serial_stats = SerialInstrumentation()  # latency, timeouts and errors per command sent to load
+device_manager = DeviceManager()  # additional loads, each with its own serial scheduler and acquisition thread
 
 # TODO documentation
 
 
+def record_sample(timestamp: float, voltage: float, current: float, power: float):  # keep sample in memory window and in run file
+    global recorder
+    samples.append(timestamp, voltage, current, power)
+    if setting_record_runs:
+        if recorder is None:
+            recorder = RunRecorder(new_run_path(setting_run_directory))
+        recorder.append(timestamp, voltage, current, power)
+
+
+def clear_samples():  # clear data-log and end current run file, next sample will start a new one
+    global recorder
+    samples.clear()
+    quality.reset()
+    if recorder is not None:
+        recorder.close()
+        recorder = None
+
+
+def run_columns() -> dict:  # all columns of current run, paged from run file if not all samples are still in memory
+    if samples.offset > 0 and recorder is not None:
+        records = recorder.read()
+        return {name: records[name] for name in RECORD_DTYPE.names}
+    columns = samples.view()
+    if samples.max_length is not None and samples.max_length - len(samples) < 10000:  # window is about to drop samples, which moves data within views
+        columns = {name: column.copy() for name, column in columns.items()}
+    return columns
+
+
+def dropped_samples(store: SampleStore, run_recorder) -> int:  # samples of run which are neither in memory nor in a run file
+    return store.offset if run_recorder is None else 0
+
+
 def exit_handler(window):  # Handling app shutdown to safely close connections and optionally stop load
-    if running and setting_off_stop:
-        load.input.off()
-    window.thread.terminate()
+    window.discovery.stop()
+    if run_state.running and setting_off_stop:
+        scheduler.call(load.input.off)
+    if recorder is not None:
+        recorder.close()
     if load.is_open:
-        load.close()
+        scheduler.call(load.close)
+    scheduler.stop()
+    device_manager.close_all(input_off=setting_off_stop)
+
+
+def task(method):  # coroutine method usable as slot, every call starts it as task on the Qt event loop(QtAsyncio)
+    @functools.wraps(method)
+    def start(*args):
+        return asyncio.ensure_future(method(*args))
+
+    return start
 
 
 class ListCellDelegate(QItemDelegate):  # customize List mode table cells mostly to use QDoublespinbox inside cell
@@ -68,7 +133,7 @@ class ListCellDelegate(QItemDelegate):  # customize List mode table cells mostly
         return editor
 
 
-class Worker(QtCore.QObject):  # separate thread for loop without locking up UI
+class Worker(QtCore.QObject):  # polling loop as coroutine, UI keeps running while it waits for the serial thread
     volt_label_update = Signal(str)
     mode_label_update = Signal(str)
     current_label_update = Signal(str)
@@ -84,91 +149,152 @@ class Worker(QtCore.QObject):  # separate thread for loop without locking up UI
     display_error = Signal(str, str)
 
     def __init__(self):
-        global previous_run_time
         super(Worker, self).__init__()
-        previous_run_time = 0.0
+        self.battery_hint = False  # whether last frame was in battery mode, so battery values get read with same frame
+        self.pacer = DeadlinePacer(setting_measure_interval)
+        self.skipped = 0  # deadlines skipped by pacer up to the previous sample
+        self.poll_task = None
+
+    @property
+    def polling(self):
+        return self.poll_task is not None and not self.poll_task.done()
+
+    @Slot(float)
+    def start_polling(self, interval: float):
+        self.stop_polling()
+        self.pacer.interval = interval
+        self.pacer.reset_stats()
+        self.skipped = 0
+        quality.interval = interval
+        self.poll_task = asyncio.ensure_future(self.poll())
 
     @Slot()
-    def work(self, data_connector_voltage: DataConnector, data_connector_current: DataConnector, data_connector_power: DataConnector):
-        global blocking_serial, start_time, running, ah_value, wh_value, previous_run_time
-
-        while blocking_serial:  # Maybe a bit hacky, but works(and is fairly simple) - blocking this thread from using serial connection while being used in other thread
-            time.sleep(0.05)
-        blocking_serial = True
+    def stop_polling(self):
+        if self.poll_task is not None:
+            self.poll_task.cancel()
+            self.poll_task = None
+
+    @Slot(float)
+    def set_poll_interval(self, interval: float):  # takes effect from the next deadline on
+        self.pacer.interval = interval
+        quality.interval = interval
+
+    async def poll(self):  # next acquisition is only started once the previous one finished
+        self.pacer.start()
+        while True:
+            self.pacer.begin()
+            if not await self.work():
+                break
+            await asyncio.sleep(self.pacer.end())
+
+    async def work(self) -> bool:
         try:
-            mode = load.function
-            measured_voltage = load.measured_voltage
-            measured_power = load.measured_power
+            if setting_frame_acquisition:
+                frame = await scheduler.run(read_frame, load, self.battery_hint, priority=PRIORITY_POLL)
+            else:
+                frame = await scheduler.run(read_frame_serial, load, priority=PRIORITY_POLL)
+            self.battery_hint = frame.mode == Mode.battery
+            mode = frame.mode
+            measured_voltage = frame.voltage
+            measured_power = frame.power
             self.volt_label_update.emit(str(measured_voltage) + " V")
             self.mode_label_update.emit(mode.value)
-            if load.input.get() == OnOffState.on:
-                measured_current = load.measured_current
-                current_run_time = datetime.datetime.now() - start_time
-                volts_list.append((current_run_time.total_seconds(), measured_voltage))
-                watts_list.append((current_run_time.total_seconds(), measured_power))
-                data_connector_voltage.cb_append_data_point(measured_voltage, current_run_time.total_seconds())
-                data_connector_power.cb_append_data_point(measured_power, current_run_time.total_seconds())
-                wh_value = self.calculate_charge_energy(wh_value, current_run_time.total_seconds() - previous_run_time, measured_power)
-                self.energy_label_update.emit(f'{wh_value:.5f}' + " Wh")
+            was_running = run_state.running
+            if run_state.update(frame):
+                measured_current = frame.current
+                current_run_time = run_state.run_time
+                record_sample(current_run_time.total_seconds(), measured_voltage, measured_current, measured_power)
+                quality.sample(current_run_time.total_seconds(), self.pacer.skipped - self.skipped)
+                self.skipped = self.pacer.skipped
+                self.energy_label_update.emit(f'{run_state.wh_value:.5f}' + " Wh")
                 self.current_label_update.emit(f'{measured_current:.5f}' + " A")
                 self.power_label_update.emit(f'{measured_power:.5f}' + " W")
 
                 if mode == Mode.battery:
-                    battery_time = datetime.timedelta(minutes=load.get_batt_time())
-                    self.charge_label_update.emit(f'{load.get_batt_cap():.5f}' + " Ah")
+                    battery_time = datetime.timedelta(minutes=frame.batt_time)
+                    self.charge_label_update.emit(f'{frame.batt_cap:.5f}' + " Ah")
                     self.runtime_label_update.emit(
                         str(battery_time - datetime.timedelta(microseconds=battery_time.microseconds)))
-                    self.charge_label_tip.emit("measured Value")
+                    self.charge_label_tip.emit("measured Value - calculated estimate deviates by {0:+.5f} Ah".format(run_state.charge_error))
                 else:
-                    ah_value = self.calculate_charge_energy(ah_value, current_run_time.total_seconds() - previous_run_time, measured_current)
-                    amps_list.append((current_run_time.total_seconds(), measured_current))
-                    data_connector_current.cb_append_data_point(measured_current, current_run_time.total_seconds())
-                    self.charge_label_update.emit(f'{ah_value:.5f}' + " Ah *")
+                    self.charge_label_update.emit(f'{run_state.ah_value:.5f}' + " Ah *")
                     self.runtime_label_update.emit(
                         str(current_run_time - datetime.timedelta(microseconds=current_run_time.microseconds)))
                     self.charge_label_tip.emit("Calculated estimate - not measured")
 
-                if not running:
-                    running = True
-                    start_time = datetime.datetime.now()
+                if not was_running:
                     self.start_button_update.emit("Stop")
                     self.start_button_icon.emit(QIcon(os.path.join(basedir, "stop.png")))
                     self.start_button_stylesheet.emit("color: rgb(170, 0, 0);")
                     self.start_button_checked.emit(True)
-
-                previous_run_time = current_run_time.total_seconds()
             else:
-                if running:
-                    running = False
+                if was_running:
                     self.start_button_update.emit("Start")
                     self.start_button_icon.emit(QIcon(os.path.join(basedir, "play.png")))
                     self.start_button_stylesheet.emit("color: rgb(0, 170, 0);")
                     self.start_button_checked.emit(False)
                     self.current_label_update.emit("0 A")
                     self.power_label_update.emit("0 W")
-            blocking_serial = False
-        except (serial.serialutil.PortNotOpenError, ValueError, AttributeError) as ex:
-            blocking_serial = False
+        except (serial.serialutil.SerialException, ValueError, AttributeError) as ex:
+            quality.error(str(ex))
             self.display_error.emit("Update Error", "Error during updating values:\n" + str(ex) + "\nProbably error on device, clear error on device(on device or by setting different mode) and disconnect/reconnect.")
+            return False
 
-    def calculate_charge_energy(self, amp_watt_hour_value: float, runtime: float, last_value: float):
-        charge_energy = amp_watt_hour_value
-        charge_energy += (last_value * runtime) / 3600
+        return True
 
-        return charge_energy
+
+class ExportWorker(QtCore.QObject):  # writes export file in separate thread, so large data-logs do not freeze UI
+    progress = Signal(int)
+    done = Signal(int, float)
+    failed = Signal(str)
+
+    def __init__(self, file_name: str, columns: dict, names: tuple, session_metadata: dict = None, quality_report: dict = None):
+        super(ExportWorker, self).__init__()
+        self.file_name = file_name
+        self.columns = columns
+        self.names = names
+        self.session_metadata = session_metadata  # if set, a session file is written instead of CSV
+        self.quality_report = quality_report  # written next to CSV files, session files have it in their metadata
+        self.cancelled = False
+
+    @Slot()
+    def run(self):
+        start = datetime.datetime.now()
+        try:
+            if self.session_metadata is not None:
+                save_session(self.file_name, self.columns, self.session_metadata)
+                rows = len(self.columns["time"])
+            else:
+                rows = write_csv(self.file_name, self.columns, self.names, progress=self.progress.emit, cancelled=lambda: self.cancelled)
+                if self.quality_report is not None:
+                    write_report(report_path(self.file_name), self.quality_report)
+        except ExportCancelled:
+            self.failed.emit("")
+        except OSError as ex:
+            self.failed.emit(str(ex))
+        else:
+            self.done.emit(rows, (datetime.datetime.now() - start).total_seconds())
+
+    def cancel(self):  # called directly from UI thread, worker thread is busy exporting
+        self.cancelled = True
 
 
 class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
-    do_work = Signal(DataConnector, DataConnector, DataConnector)
+    start_polling = Signal(float)
+    stop_polling = Signal()
+    set_poll_interval = Signal(float)
+    ports_changed = Signal(list)
 
     def __init__(self):
         super(MainWindow, self).__init__()
         self.setupUi(self)  # gets defined in the UI file
         self.setWindowTitle("KEL103 Control")
         self.btn_connect.setChecked(False)
+        self.model = ""
 
         # Connecting to all the signals from Ui-elements
         self.btn_refreshPorts.clicked.connect(self.refresh_ports)
+        self.ports_changed.connect(self.update_ports)
         self.btn_connect.clicked.connect(self.pressed_connect_btn)
         self.btn_setStd.clicked.connect(self.pressed_set_std_btn)
         self.cmbBox_stdModes.currentIndexChanged.connect(self.selected_std_mode_changed)
@@ -209,18 +335,18 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
         self.btn_pulse_validate.clicked.connect(self.validate_pulse)
         self.btn_toggle_set.clicked.connect(self.set_toggle)
         self.btn_toggle_validate.clicked.connect(self.validate_toggle)
-        self.btn_trigger.clicked.connect(lambda: load.trigger())
+        self.btn_trigger.clicked.connect(lambda: self.run_command(load.trigger))
         self.btn_list_set.clicked.connect(self.set_list)
         self.btn_list_validate.clicked.connect(self.validate_list)
         self.btn_list_recall.clicked.connect(self.recall_list)
         self.btn_list_clear_all.clicked.connect(self.table_list.clearContents)
         self.btn_list_clear_mark.clicked.connect(self.clear_marked_list)
         self.btn_save_settings.clicked.connect(self.save_settings)
-        self.btn_memory_save.clicked.connect(lambda: load.memories[self.val_memory_slot.value()].save())
-        self.btn_memory_recall.clicked.connect(lambda: load.memories[self.val_memory_slot.value()].recall())
-        self.chk_show_current.stateChanged.connect(lambda: self.plot_curve_current.setVisible(self.chk_show_current.isChecked()))
-        self.chk_show_power.stateChanged.connect(lambda: self.plot_curve_power.setVisible(self.chk_show_power.isChecked()))
-        self.chk_show_voltage.stateChanged.connect(lambda: self.plot_curve_voltage.setVisible(self.chk_show_voltage.isChecked()))
+        self.btn_memory_save.clicked.connect(lambda: self.run_command(load.memories[self.val_memory_slot.value()].save))
+        self.btn_memory_recall.clicked.connect(lambda: self.run_command(load.memories[self.val_memory_slot.value()].recall))
+        self.chk_show_current.stateChanged.connect(self.update_curve_visibility)
+        self.chk_show_power.stateChanged.connect(self.update_curve_visibility)
+        self.chk_show_voltage.stateChanged.connect(self.update_curve_visibility)
 
         # Set up table in List mode settings
         self.table_list.setItemDelegate(ListCellDelegate(self.table_list))
@@ -228,10 +354,37 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
         header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
-
-        self.refresh_ports()
-
-        # connecting to all signals from worker thread
+        self.btn_list_host = QPushButton("Run on host", self.page_2)  # lists of any length streamed from a file
+        self.btn_list_host.setCheckable(True)
+        self.btn_list_host.setToolTip("Play a list program from a CSV file(current, slope, duration per row) by sending each step from here, not limited by the save slots of the load")
+        self.gridLayout_4.addWidget(self.btn_list_host, 0, 4, 1, 1)
+        self.btn_list_host.clicked.connect(self.host_list)
+        self.btn_waveform = QPushButton("Play waveform", self.page_11)  # recorded profiles as setpoints of basic mode
+        self.btn_waveform.setCheckable(True)
+        self.btn_waveform.setGeometry(QtCore.QRect(330, 50, 103, 33))
+        self.btn_waveform.setToolTip("Play a waveform from a CSV(time, setpoint per row) or NPZ file as setpoints of the selected mode, resampled to the rate the connection sustains")
+        self.btn_waveform.clicked.connect(self.waveform)
+
+        # Program settings which are not part of the UI file
+        self.chk_frame_acquisition = self.add_program_setting("Frame acquisition", QCheckBox())
+        self.chk_frame_acquisition.setToolTip("Query all values of a measurement in a single write instead of one round-trip per value")
+        self.val_measure_interval.setMinimum(0.1)  # frame acquisition allows for shorter intervals than the UI file default
+        self.chk_record_runs = self.add_program_setting("Record runs to disk", QCheckBox())
+        self.chk_record_runs.setToolTip("Write every sample to a run file in the run folder, so long runs are not limited by memory and survive a crash")
+        self.val_run_directory = self.add_program_setting("Run folder", QLineEdit())
+        self.val_run_directory.setToolTip("Folder run files are written to, relative to the working directory unless absolute. Run files are not deleted by the app")
+        self.val_memory_window = self.add_program_setting("Memory window", QSpinBox())
+        self.val_memory_window.setRange(10000, 100000000)
+        self.val_memory_window.setSingleStep(100000)
+        self.val_memory_window.setSuffix(" S")
+        self.val_memory_window.setToolTip("Number of newest samples kept in memory, older samples are read from the run file when needed")
+        self.chk_auto_baudrate = self.add_program_setting("Detect baudrate", QCheckBox())
+        self.chk_auto_baudrate.setToolTip("Find the baudrate of the load when connecting to a port for the first time, it is remembered for the port")
+        self.chk_settings_devices = QCheckBox("Also set on Devices", self.groupBox_settings)
+        self.chk_settings_devices.setGeometry(QtCore.QRect(160, 460, 170, 33))
+        self.chk_settings_devices.setToolTip("Apply the changed settings to the loads of the Devices tab as well(except baudrate, IP and MAC address)")
+
+        # connecting to all signals from polling
         self.worker = Worker()
         self.worker.volt_label_update.connect(self.lbl_volt_out.setText)
         self.worker.mode_label_update.connect(self.lbl_mode.setText)
@@ -248,8 +401,119 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
         self.worker.display_error.connect(self.display_error_thread)
 
         self.btn_startStop.setIcon(QIcon(os.path.join(basedir, "play.png")))
+        self.cmbBox_outGraphSel.insertItem(0, "All")
+        self.cmbBox_outGraphSel.setCurrentIndex(0)
+
+        # Graph(and pyqtgraph/pglive) is only set up at connect, see build_plot
+        self.plot_widget = None
+        self.lbl_graph_placeholder = QLabel("Graph is shown once connected to the load")
+        self.lbl_graph_placeholder.setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
+        self.layout_graph.addWidget(self.lbl_graph_placeholder)
+        self.plot_state = None
+        self.plot_timer = QTimer(self)
+        self.plot_timer.setInterval(250)
+        self.plot_timer.timeout.connect(self.update_plot)
+
+        # Worker paces its acquisitions itself once polling is started
+        self.start_polling.connect(self.worker.start_polling)
+        self.stop_polling.connect(self.worker.stop_polling)
+        self.set_poll_interval.connect(self.worker.set_poll_interval)
+
+        # Tabs built in code are empty until first shown, their contents are built by these
+        self.tab_diagnostics = QWidget()
+        self.tab_devices = QWidget()
+        self.tab_builders = {self.tab_diagnostics: self.build_diagnostics_tab, self.tab_devices: self.build_devices_tab}
+        self.tabWidget.currentChanged.connect(self.build_tab)  # before the updates of the tabs
+        self.tabWidget.addTab(self.tab_diagnostics, "Diagnostics")
+        self.tabWidget.currentChanged.connect(self.update_diagnostics)
+        self.tabWidget.addTab(self.tab_devices, "Devices")
+        self.tabWidget.currentChanged.connect(self.update_devices)
+        self.device_ports = []  # offered in devices tab
+
+        # Ports are listed and probed for loads in the background, connected ports are left alone
+        self.connected_port = None
+        self.update_ports([])
+
+        # Show metrics of serial scheduler in status bar
+        self.lbl_scheduler = QLabel()
+        self.statusbar.addPermanentWidget(self.lbl_scheduler)
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.update_scheduler_metrics)
+        self.metrics_timer.timeout.connect(self.update_diagnostics)
+        self.metrics_timer.timeout.connect(self.update_devices)
+        self.metrics_timer.start(1000)
+
+        self.read_settings()
+        self.discovery = PortDiscovery(self.ports_changed.emit, setting_baudrate.b, exclude=self.busy_ports)
+
+    def build_tab(self, index: int):
+        builder = self.tab_builders.pop(self.tabWidget.widget(index), None)
+        if builder is not None:
+            builder()
+
+    def build_diagnostics_tab(self):  # Diagnostics tab with statistics of the serial communication
+        diagnostics_layout = QVBoxLayout(self.tab_diagnostics)
+        self.table_diagnostics = QTableWidget(0, 8 + len(LATENCY_BUCKETS), self.tab_diagnostics)
+        self.table_diagnostics.setHorizontalHeaderLabels(["Command", "Count", "Mean ms", "p50 ms", "p90 ms", "Max ms", "Timeouts", "Parse errors"] +
+                                                         [bucket_label(bound) for bound in LATENCY_BUCKETS])
+        self.table_diagnostics.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table_diagnostics.verticalHeader().setVisible(False)
+        diagnostics_layout.addWidget(self.table_diagnostics)
+        diagnostics_buttons = QHBoxLayout()
+        self.lbl_diagnostics = QLabel()
+        diagnostics_buttons.addWidget(self.lbl_diagnostics, 1)
+        self.btn_diagnostics_reset = QPushButton("Reset")
+        self.btn_diagnostics_reset.clicked.connect(self.reset_diagnostics)
+        diagnostics_buttons.addWidget(self.btn_diagnostics_reset)
+        self.btn_diagnostics_export = QPushButton("Export")
+        self.btn_diagnostics_export.clicked.connect(self.export_diagnostics)
+        diagnostics_buttons.addWidget(self.btn_diagnostics_export)
+        diagnostics_layout.addLayout(diagnostics_buttons)
+
+    def build_devices_tab(self):  # Devices tab for controlling and logging additional loads next to the connected one
+        devices_layout = QVBoxLayout(self.tab_devices)
+        self.table_devices = QTableWidget(0, 12, self.tab_devices)
+        self.table_devices.setHorizontalHeaderLabels(["Port", "Model", "Mode", "Input", "Voltage", "Current", "Power", "Ah", "Wh",
+                                                      "Samples", "Late/Skipped", "Status"])
+        self.table_devices.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table_devices.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table_devices.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.table_devices.verticalHeader().setVisible(False)
+        devices_layout.addWidget(self.table_devices)
+        devices_buttons = QHBoxLayout()
+        self.cmb_device_port = QComboBox()
+        self.cmb_device_port.setEditable(True)
+        self.cmb_device_port.addItems(self.device_ports)
+        devices_buttons.addWidget(self.cmb_device_port, 1)
+        self.btn_device_add = QPushButton("Add")
+        self.btn_device_add.clicked.connect(self.add_device)
+        devices_buttons.addWidget(self.btn_device_add)
+        self.btn_device_remove = QPushButton("Remove")
+        self.btn_device_remove.clicked.connect(self.remove_device)
+        devices_buttons.addWidget(self.btn_device_remove)
+        self.btn_device_on = QPushButton("Input On")
+        self.btn_device_on.clicked.connect(lambda: self.set_device_input(True))
+        devices_buttons.addWidget(self.btn_device_on)
+        self.btn_device_off = QPushButton("Input Off")
+        self.btn_device_off.clicked.connect(lambda: self.set_device_input(False))
+        devices_buttons.addWidget(self.btn_device_off)
+        self.btn_device_export = QPushButton("Export")
+        self.btn_device_export.clicked.connect(self.export_device)
+        self.btn_device_export.setEnabled(self.btn_export.isEnabled())
+        devices_buttons.addWidget(self.btn_device_export)
+        devices_layout.addLayout(devices_buttons)
+
+    def build_plot(self):  # Setting up graph, plotting libraries are only imported here to keep startup fast
+        if self.plot_widget is not None:
+            return
+        import pyqtgraph as pg
+        from pglive.kwargs import Crosshair, Axis
+        from pglive.sources.data_connector import DataConnector
+        from pglive.sources.live_plot import LiveLinePlot
+        from pglive.sources.live_axis import LiveAxis
+        from pglive.sources.live_axis_range import LiveAxisRange
+        from pglive.sources.live_plot_widget import LivePlotWidget
 
-        # Setting up graph
         kwargs = {Crosshair.ENABLED: True,
                   Crosshair.LINE_PEN: pg.mkPen(color="red", width=1),
                   Crosshair.TEXT_KWARGS: {"color": "yellow"}}
@@ -262,25 +526,207 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
         self.plot_widget.addItem(self.plot_curve_voltage)
         self.plot_widget.addItem(self.plot_curve_power)
         self.plot_widget.addItem(self.plot_curve_current)
-        self.data_connector_voltage = DataConnector(self.plot_curve_voltage, update_rate=4)
-        self.data_connector_current = DataConnector(self.plot_curve_current, update_rate=4)
-        self.data_connector_power = DataConnector(self.plot_curve_power, update_rate=4)
+        self.data_connector_voltage = DataConnector(self.plot_curve_voltage)
+        self.data_connector_current = DataConnector(self.plot_curve_current)
+        self.data_connector_power = DataConnector(self.plot_curve_power)
+        self.layout_graph.removeWidget(self.lbl_graph_placeholder)
+        self.lbl_graph_placeholder.deleteLater()
         self.layout_graph.addWidget(self.plot_widget)
+        self.apply_plot_settings()
+        self.update_curve_visibility()
+
+        # Graph is fed with min/max decimated data from sample store instead of every sample
+        self.plot_columns = {"voltage": (DecimatedColumn(), self.data_connector_voltage),
+                             "current": (DecimatedColumn(), self.data_connector_current),
+                             "power": (DecimatedColumn(), self.data_connector_power)}
+        self.plot_timer.start()
+        startup_marks.append(("graph", time.perf_counter()))
+
+    def apply_plot_settings(self):
+        if self.plot_widget is not None:
+            self.plot_widget.crosshair_enabled = setting_crosshair
+            self.plot_widget.x_range_controller.offset_left = setting_graph_time
 
-        # Move worker to another thread and setup timer to call worker
-        self.thread = QtCore.QThread(self)
-        self.worker.moveToThread(self.thread)
-        self.do_work.connect(self.worker.work)
-        self.timer = QTimer()
-        self.timer.setInterval(1)
-        self.timer.timeout.connect(lambda: self.do_work.emit(self.data_connector_voltage, self.data_connector_current, self.data_connector_power))
+    def update_curve_visibility(self):  # only curves whose visibility changed, pglive fails on showing a shown curve
+        if self.plot_widget is not None:
+            for curve, checkbox in ((self.plot_curve_voltage, self.chk_show_voltage),
+                                    (self.plot_curve_current, self.chk_show_current),
+                                    (self.plot_curve_power, self.chk_show_power)):
+                if curve.isVisible() != checkbox.isChecked():
+                    curve.setVisible(checkbox.isChecked())
 
-        self.read_settings()
+    def clear_plot(self):
+        if self.plot_widget is not None:
+            self.data_connector_voltage.clear()
+            self.data_connector_current.clear()
+            self.data_connector_power.clear()
+
+    def update_plot(self):  # feed graph with decimated data of the samples in view, at most two points per pixel
+        columns = samples.view()
+        x = columns["time"]
+        if len(x) == 0:
+            return
+        if self.plot_widget.manual_range:  # zoomed or panned by user
+            x_min, x_max = self.plot_widget.getPlotItem().vb.viewRange()[0]
+        else:  # rolling with newest samples
+            x_min, x_max = x[-1] - self.plot_widget.x_range_controller.offset_left, x[-1]
+        buckets = max(self.plot_widget.width(), 100)
+        plot_state = (samples.total_length, x_min, x_max, buckets)
+        if plot_state == self.plot_state:  # nothing changed since last update
+            return
+        self.plot_state = plot_state
+        for name, (column, data_connector) in self.plot_columns.items():
+            column.update(x, columns[name], samples.offset)
+            plot_x, plot_y = column.decimate(x, columns[name], x_min, x_max, buckets)
+            data_connector.cb_set_data(plot_y, plot_x)
+
+    def add_program_setting(self, label_text: str, widget: QWidget):  # Add setting row below the ones from UI file and move save button down
+        y = self.btn_save_settings.y()
+        label = QLabel(label_text, self.groupBox_guisettings)
+        label.setGeometry(QtCore.QRect(10, y, 151, 31))
+        widget.setParent(self.groupBox_guisettings)
+        if isinstance(widget, QCheckBox):
+            widget.setGeometry(QtCore.QRect(210, y, 30, 30))
+        else:
+            widget.setGeometry(QtCore.QRect(180, y, 101, 32))
+        self.btn_save_settings.move(self.btn_save_settings.x(), y + 40)
+        return widget
+
+    def update_scheduler_metrics(self):
+        metrics = scheduler.metrics()
+        ticks = self.worker.pacer.metrics()
+        jitter = quality.live()
+        self.lbl_scheduler.setText("Serial queue: {0} (max {1}) | wait user {2:.1f}/{3:.1f} ms, poll {4:.1f}/{5:.1f} ms | ticks late {6}, skipped {7} | interval {8:.1f} ms, jitter {9:.1f} ms, p99 {10:.1f} ms, gaps {11}".format(
+            metrics["depth"], metrics["max_depth"], metrics["user_wait_mean"] * 1000, metrics["user_wait_max"] * 1000,
+            metrics["poll_wait_mean"] * 1000, metrics["poll_wait_max"] * 1000, ticks["late"], ticks["skipped"],
+            jitter["interval_mean"] * 1000, jitter["jitter"] * 1000, jitter["interval_p99"] * 1000, jitter["gaps"]))
+        self.lbl_scheduler.setToolTip("Commands waiting for serial connection, mean/max wait time for user commands and background polling\n"
+                                      "Measurements started late or skipped because the previous one took longer than the measure interval\n"
+                                      "Mean time between recorded samples, its standard deviation and 99th percentile of the newest samples, "
+                                      "gaps longer than two measure intervals in the current run")
+
+    def update_diagnostics(self):  # only while diagnostics tab is shown
+        if self.tabWidget.currentWidget() is not self.tab_diagnostics:
+            return
+        rows = serial_stats.snapshot()
+        self.table_diagnostics.setRowCount(len(rows))
+        for row_index, row in enumerate(rows):
+            values = [row["command"], str(row["count"]), f'{row["mean_ms"]:.2f}', f'{row["p50_ms"]:.2f}', f'{row["p90_ms"]:.2f}',
+                      f'{row["max_ms"]:.2f}', str(row["timeouts"]), str(row["errors"])] + [str(count) for count in row["histogram"]]
+            for column, value in enumerate(values):
+                self.table_diagnostics.setItem(row_index, column, QTableWidgetItem(value))
+        self.lbl_diagnostics.setText("Since {0}: {1} commands, {2} timeouts, {3} parse errors".format(
+            datetime.datetime.fromtimestamp(serial_stats.started).strftime("%H:%M:%S"), sum(row["count"] for row in rows),
+            sum(row["timeouts"] for row in rows), sum(row["errors"] for row in rows)))
+
+    def reset_diagnostics(self):
+        serial_stats.reset()
+        self.update_diagnostics()
+
+    def export_diagnostics(self):
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export diagnostics to...", "", "csv (*.csv)")
+        if file_name == "":
+            return
+        if not file_name.endswith(".csv"):
+            file_name += ".csv"
+        try:
+            serial_stats.write_csv(file_name)
+        except OSError as ex:
+            QMessageBox.critical(self, "Export error", "Error during export of diagnostics:\n" + str(ex))
+
+    def selected_device(self):
+        row = self.table_devices.currentRow()
+        if row < 0 or row >= len(device_manager):
+            return None
+        return device_manager.devices[row]
+
+    def update_devices(self):  # only while devices tab is shown
+        if self.tabWidget.currentWidget() is not self.tab_devices:
+            return
+        overview = device_manager.overview()
+        self.table_devices.setRowCount(len(overview))
+        for row_index, status in enumerate(overview):
+            if status["error"] is not None:
+                state = "Error: " + status["error"]
+            else:
+                state = "Logging" if status["running"] else "Stopped"
+            values = [status["port"], status["model"], status["mode"], "On" if status["input"] else "Off",
+                      f'{status["voltage"]:.3f} V', f'{status["current"]:.4f} A', f'{status["power"]:.3f} W', f'{status["ah"]:.5f}',
+                      f'{status["wh"]:.5f}', str(status["samples"]), "{0}/{1}".format(status["late"], status["skipped"]), state]
+            for column, value in enumerate(values):
+                self.table_devices.setItem(row_index, column, QTableWidgetItem(value))
+
+    @task
+    async def add_device(self):  # port is opened on the serial thread of the device, UI keeps running meanwhile
+        port = self.cmb_device_port.currentText()
+        if port == "":
+            return
+        if load.is_open and port == self.cmbBox_ports.currentText():
+            self.show_message(QMessageBox.critical, "Connection error", port + " is already connected in the main window")
+            return
+        self.btn_device_add.setEnabled(False)
+        try:
+            await device_manager.add_async(port, setting_baudrate, debug=setting_serial_debug, record=setting_record_runs,
+                                           run_directory=setting_run_directory,
+                                           frame_acquisition=setting_frame_acquisition, memory_window=setting_memory_window)
+        except (serial.serialutil.SerialException, ValueError) as ex:
+            self.show_message(QMessageBox.critical, "Connection error", "Could not connect to {0}:\n{1}".format(port, ex))
+            return
+        finally:
+            self.btn_device_add.setEnabled(True)
+        self.update_devices()
+
+    @task
+    async def remove_device(self):
+        device = self.selected_device()
+        if device is None:
+            return
+        try:
+            await device_manager.remove_async(device, setting_off_disconnect)
+        except (serial.serialutil.SerialException, ValueError) as ex:
+            self.display_error(ex)
+        self.update_devices()
+
+    @task
+    async def set_device_input(self, on: bool):
+        device = self.selected_device()
+        if device is None:
+            return
+        try:
+            await device.set_input_async(on)
+            if not device.running:  # acquisition stopped by an error before
+                device.start(device_manager.interval)
+        except (serial.serialutil.SerialException, ValueError, AttributeError) as ex:
+            self.display_error(ex)
+        self.update_devices()
 
-        self.thread.start()
+    def export_device(self):
+        device = self.selected_device()
+        if device is None:
+            return
+        if not self.confirm_incomplete_export(dropped_samples(device.samples, device.recorder), device.samples.max_length):
+            return
+        file_name, file_filter = QFileDialog.getSaveFileName(self, "Export {0} to...".format(device.port), "", "csv (*.csv);;session (*.npz)")
+        if file_name == "":
+            return
+        session = file_filter.startswith("session") or file_name.endswith(".npz")
+        extension = ".npz" if session else ".csv"
+        if not file_name.endswith(extension):
+            file_name += extension
+        columns = device.columns()
+        metadata = None
+        if session:
+            metadata = {"model": device.model, "mode": device.status()["mode"], "limits": None,
+                        "start_time": device.recorder.start_time if device.recorder is not None else None,
+                        "ah": integrate(columns["time"], columns["current"]), "wh": integrate(columns["time"], columns["power"]),
+                        "quality": device.quality.report(columns["time"]),
+                        "settings": {"measure_interval": device_manager.interval, "port": device.port}}
+        self.start_export(file_name, columns, ("time", "voltage", "current", "power"), metadata,
+                          None if session else device.quality.report(columns["time"]))
 
     def read_settings(self):
-        global setting_off_stop, setting_measure_interval, setting_serial_debug, setting_baudrate, setting_crosshair, setting_graph_time, setting_off_disconnect
+        global setting_off_stop, setting_measure_interval, setting_serial_debug, setting_baudrate, setting_crosshair, setting_graph_time, setting_off_disconnect, setting_frame_acquisition
+        global setting_record_runs, setting_run_directory, setting_memory_window, setting_auto_baudrate
 
         # Read settings from existing config file, otherwise set one up with default settings
         if not os.path.isfile(configfile_name):  # if no config exists - create new one
@@ -294,6 +740,11 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
             config.set('Settings', 'baudrate', '115200')
             config.set('Settings', 'crosshair', 'True')
             config.set('Settings', 'graph_time', '30.0')
+            config.set('Settings', 'frame_acquisition', 'True')
+            config.set('Settings', 'record_runs', 'False')
+            config.set('Settings', 'run_directory', 'runs')
+            config.set('Settings', 'memory_window', '1000000')
+            config.set('Settings', 'auto_baudrate', 'False')
             self.chk_off_close.setChecked(True)
             self.chk_off_disconnect.setChecked(False)
             self.val_measure_interval.setValue(self.val_measure_interval.value())
@@ -301,6 +752,11 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
             self.cmb_baudrate_soft.setCurrentText("115200")
             self.chk_crosshair.setChecked(True)
             self.val_graph_time.setValue(30)
+            self.chk_frame_acquisition.setChecked(True)
+            self.chk_record_runs.setChecked(False)
+            self.val_run_directory.setText("runs")
+            self.val_memory_window.setValue(1000000)
+            self.chk_auto_baudrate.setChecked(False)
             config.write(cfgfile)
             cfgfile.close()
         else:
@@ -313,16 +769,27 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
             setting_baudrate = BaudRate(config.getint('Settings', 'baudrate'))
             setting_crosshair = config.getboolean('Settings', 'crosshair')
             setting_graph_time = config.getfloat('Settings', 'graph_time')
+            setting_frame_acquisition = config.getboolean('Settings', 'frame_acquisition', fallback=True)
+            setting_record_runs = config.getboolean('Settings', 'record_runs', fallback=False)
+            setting_run_directory = config.get('Settings', 'run_directory', fallback="runs")
+            setting_memory_window = config.getint('Settings', 'memory_window', fallback=1000000)
+            setting_auto_baudrate = config.getboolean('Settings', 'auto_baudrate', fallback=False)
             self.chk_off_close.setChecked(setting_off_stop)
             self.chk_off_disconnect.setChecked(setting_off_disconnect)
             self.val_measure_interval.setValue(setting_measure_interval)
             self.chk_serial_debug.setChecked(setting_serial_debug)
             self.cmb_baudrate_soft.setCurrentText(setting_baudrate.b.__str__())
-            self.timer.setInterval((setting_measure_interval * 1000).__int__())
+            self.set_poll_interval.emit(setting_measure_interval)
+            device_manager.set_interval(setting_measure_interval)
             self.chk_crosshair.setChecked(setting_crosshair)
-            self.plot_widget.crosshair_enabled = setting_crosshair
             self.val_graph_time.setValue(setting_graph_time)
-            self.plot_widget.x_range_controller.offset_left = setting_graph_time
+            self.apply_plot_settings()
+            self.chk_frame_acquisition.setChecked(setting_frame_acquisition)
+            self.chk_record_runs.setChecked(setting_record_runs)
+            self.val_run_directory.setText(setting_run_directory)
+            self.val_memory_window.setValue(setting_memory_window)
+            samples.max_length = setting_memory_window
+            self.chk_auto_baudrate.setChecked(setting_auto_baudrate)
 
     def save_settings(self):  # Save settings to config file and then read back settings(which also sets saved settings)
         config = configparser.ConfigParser()
@@ -334,19 +801,54 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
         config.set('Settings', 'baudrate', self.cmb_baudrate_soft.currentText())
         config.set('Settings', 'crosshair', self.chk_crosshair.isChecked().__str__())
         config.set('Settings', 'graph_time', self.val_graph_time.value().__str__())
+        config.set('Settings', 'frame_acquisition', self.chk_frame_acquisition.isChecked().__str__())
+        config.set('Settings', 'record_runs', self.chk_record_runs.isChecked().__str__())
+        config.set('Settings', 'run_directory', self.val_run_directory.text().strip() or "runs")
+        config.set('Settings', 'memory_window', self.val_memory_window.value().__str__())
+        config.set('Settings', 'auto_baudrate', self.chk_auto_baudrate.isChecked().__str__())
         cfgfile = open(configfile_name, 'w')
         config.write(cfgfile)
         cfgfile.close()
 
         self.read_settings()
+        self.discovery.baudrate = setting_baudrate.b
+
+    def port_baudrate(self, port: str):  # baudrate detected before for port
+        config = configparser.ConfigParser()
+        config.read(configfile_name)
+        rate = config.getint('Baudrates', port, fallback=None)
+        return BaudRate(rate) if rate is not None else None
+
+    def remember_baudrate(self, port: str, baudrate: BaudRate = None):  # forgets baudrate of port if None
+        config = configparser.ConfigParser()
+        config.read(configfile_name)
+        if not config.has_section('Baudrates'):
+            config.add_section('Baudrates')
+        if baudrate is None:
+            config.remove_option('Baudrates', port)
+        else:
+            config.set('Baudrates', port, str(baudrate.b))
+        cfgfile = open(configfile_name, 'w')
+        config.write(cfgfile)
+        cfgfile.close()
+
+    async def connect_baudrate(self, port: str) -> BaudRate:  # baudrate to connect with, detected if enabled and not known yet
+        if not setting_auto_baudrate or port == SIMULATED_PORT or port.startswith(SIMULATED_PORT + ":"):
+            return setting_baudrate
+        baudrate = self.port_baudrate(port)
+        if baudrate is None:
+            self.statusbar.showMessage("Detecting baudrate of " + port)
+            rate, identity = await scheduler.run(detect_baudrate, port, [rate.b for rate in BaudRate])
+            self.statusbar.clearMessage()
+            if rate is None:
+                raise ValueError("No load answered on " + port + " at any baudrate")
+            baudrate = BaudRate(rate)
+            self.remember_baudrate(port, baudrate)
+        return baudrate
 
     def clear_lists(self):  # Clear data-logs and graph
-        volts_list.clear()
-        amps_list.clear()
-        watts_list.clear()
-        self.data_connector_power.clear()
-        self.data_connector_current.clear()
-        self.data_connector_voltage.clear()
+        clear_samples()
+        self.clear_plot()
 
     def selected_std_mode_changed(self):  # When dropdown in basic mode section changes also change suffix in SpinBox
         match self.cmbBox_stdModes.currentIndex():
@@ -361,82 +863,106 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
             case 4:
                 self.val_stdSet.setSuffix(" Short")
 
-    # Maybe a bit hacky, but works(and is fairly simple) - functions for blocking this thread from using serial connection while being used in other thread
-    def wait_and_set_block(self):
-        global blocking_serial
-        while blocking_serial:
-            time.sleep(0.05)
-        blocking_serial = True
-
-    def unset_block(self):
-        global blocking_serial
-        blocking_serial = False
+    @task
+    async def pressed_set_std_btn(self):  # Setting basic mode based on which item is selected in dropdown
+        index = self.cmbBox_stdModes.currentIndex()
+        value = self.val_stdSet.value()
 
-    def pressed_set_std_btn(self):  # Setting basic mode based on which item is selected in dropdown
-        try:
-            self.wait_and_set_block()
-            match self.cmbBox_stdModes.currentIndex():
+        def set_std():
+            match index:
                 case 0:
-                    load.current = self.val_stdSet.value()
+                    load.current = value
                 case 1:
-                    load.voltage = self.val_stdSet.value()
+                    load.voltage = value
                 case 2:
-                    load.resistance = self.val_stdSet.value()
+                    load.resistance = value
                 case 3:
-                    load.power = self.val_stdSet.value()
+                    load.power = value
                 case 4:
                     load.function = Mode.short
-            self.unset_block()
+
+        try:
+            await scheduler.run(set_std)
         except (serial.serialutil.PortNotOpenError, ValueError) as ex:
-            self.unset_block()
             self.display_error(ex)
             return
 
-    def pressed_connect_btn(self):  # Connect or Disconnect from load
+    @task
+    async def pressed_connect_btn(self):  # Connect or Disconnect from load
         global load
 
         if not self.btn_connect.isChecked():
-            print("Disconnect")
-            self.timer.stop()
+            self.stop_polling.emit()
             if setting_off_disconnect:
-                load.input.off()
+                await scheduler.run(load.input.off)
                 self.btn_startStop.setText("Start")
                 self.btn_startStop.setIcon(QIcon(os.path.join(basedir, "play.png")))
                 self.btn_startStop.setStyleSheet("color: rgb(0, 170, 0);")
                 self.btn_startStop.setChecked(False)
-            load.close()
+            await scheduler.run(load.close)
+            self.connected_port = None
+            device_state.invalidate()
             self.lbl_model.setText("Model:")
+            self.model = ""
             self.btn_connect.setText("Connect")
 
         else:
-            print("Connect")
+            self.btn_connect.setEnabled(False)  # no second connect while waiting for the load
+            self.connected_port = self.cmbBox_ports.currentText()  # not probed by discovery from now on
             try:
-                load = KELSerial(self.cmbBox_ports.currentText(), setting_baudrate, setting_serial_debug)
-                model = load.model
+                baudrate = await self.connect_baudrate(self.connected_port)
+                load = await scheduler.run(open_load, self.connected_port, baudrate, setting_serial_debug)
+                await scheduler.run(instrument, load, serial_stats)
+                model = await scheduler.run(lambda: load.model)
             except (serial.serialutil.PortNotOpenError, ValueError) as ex:
+                if setting_auto_baudrate:  # baudrate of load might have been changed, detect it again next time
+                    self.remember_baudrate(self.connected_port)
+                self.connected_port = None
                 self.display_error(ex)
                 return
+            finally:
+                self.btn_connect.setEnabled(True)
             print(model)
+            self.model = model
             self.lbl_model.setText("Model: " + model)
             self.btn_connect.setText("Disconnect")
-            self.get_limits()
-            self.timer.start()
+            self.build_plot()
+            device_state.invalidate()
+            await self.get_limits()
+            self.start_polling.emit(setting_measure_interval)
+            await self.get_settings()  # fills cache while polling already runs
 
-    def refresh_ports(self):  # Refresh list of serial ports and automatically select first port which could be load based on name
-        self.cmbBox_ports.clear()
-        ports = serial.tools.list_ports.comports()
-        for p in ports:
-            print(p)
-            self.cmbBox_ports.addItem(p.device)
-            if p.description.__contains__("KORAD"):
-                self.cmbBox_ports.setCurrentText(p.device)
+    def refresh_ports(self):  # Probe all serial ports again, list gets updated by discovery once done
+        self.discovery.rescan()
 
-    def pressed_start_btn(self):
-        global start_time, running
+    def busy_ports(self) -> list:  # called from discovery thread
+        return [self.connected_port] + [device.port for device in device_manager.devices]
 
+    def update_ports(self, ports: list):  # Update list of serial ports and select first port with a load
+        current = self.cmbBox_ports.currentText()
+        self.cmbBox_ports.clear()
+        self.device_ports = []
+        for index, port in enumerate(ports):
+            self.cmbBox_ports.addItem(port.device)
+            self.cmbBox_ports.setItemData(index, port.model if port.model else port.description, QtCore.Qt.ItemDataRole.ToolTipRole)
+            self.device_ports.append(port.device)
+        if simulated_port is not None:
+            self.cmbBox_ports.addItem(simulated_port)
+            self.device_ports.append(SIMULATED_PORT + ":2")  # additional in-process simulated load
+        preferred = simulated_port if simulated_port is not None else preferred_port(ports)
+        if self.btn_connect.isChecked() or (preferred is None and self.cmbBox_ports.findText(current) >= 0):
+            self.cmbBox_ports.setCurrentText(current)  # keep selection of user or of connected load
+        elif preferred is not None:
+            self.cmbBox_ports.setCurrentText(preferred)
+        if self.tab_devices not in self.tab_builders:
+            self.cmb_device_port.clear()
+            self.cmb_device_port.addItems(self.device_ports)
+
+    @task
+    async def pressed_start_btn(self):
         if self.btn_startStop.isChecked():
             try:
-                load.input.on()
+                await scheduler.run(load.input.on)
             except (serial.serialutil.PortNotOpenError, ValueError) as ex:
                 self.display_error(ex)
                 return
@@ -444,18 +970,13 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
             self.btn_startStop.setText("Stop")
             self.btn_startStop.setIcon(QIcon(os.path.join(basedir, "stop.png")))
             self.btn_startStop.setStyleSheet("color: rgb(170, 0, 0);")
-            start_time = datetime.datetime.now()
-            watts_list.clear()
-            amps_list.clear()
-            volts_list.clear()
-            self.data_connector_voltage.clear()
-            self.data_connector_current.clear()
-            self.data_connector_power.clear()
-            running = True
+            run_state.start()
+            clear_samples()
+            self.clear_plot()
 
         else:
             try:
-                load.input.off()
+                await scheduler.run(load.input.off)
             except (serial.serialutil.PortNotOpenError, ValueError) as ex:
                 self.display_error(ex)
                 return
@@ -465,32 +986,54 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
             self.btn_startStop.setStyleSheet("color: rgb(0, 170, 0);")
             self.lbl_current_out.setText("0 A")
             self.lbl_power_out.setText("0 W")
-            running = False
+            run_state.stop()
+
+    async def device_values(self, *names, progress=None) -> list:
+        """ Limits or settings from cache, missing ones are read from load in batches with acquisition ticks in between.
+
+        :param progress: optional callable getting the number of values read so far and the number of values to read
+        """
+        missing = device_state.missing(names)
+        if missing:
+            if setting_frame_acquisition:
+                for batch in batches(missing):
+                    device_state.update(await scheduler.run(read_values_pipelined, load, batch))
+                    if progress is not None:
+                        progress(len(missing) - len(device_state.missing(missing)), len(missing))
+            else:
+                device_state.update(await scheduler.run(read_values, load.settings, missing))
+        return [device_state[name] for name in names]
 
-    def get_limits(self):
+    @task
+    async def get_limits(self):  # refresh cached limits from load
+        device_state.invalidate(*LIMITS)
         try:
-            self.wait_and_set_block()
-            self.val_maxVoltLimit.setValue(load.settings.voltage_limit)
-            self.val_maxCurrLimit.setValue(load.settings.current_limit)
-            self.val_maxResLimit.setValue(load.settings.resistance_limit)
-            self.val_maxPowerLimit.setValue(load.settings.power_limit)
-            self.unset_block()
-        except serial.serialutil.PortNotOpenError as ex:
-            self.unset_block()
+            limits = await self.device_values(*LIMITS)
+        except (serial.serialutil.SerialException, ValueError) as ex:  # timeout or invalid response, polling starts anyway
             self.display_error(ex)
             return
 
+        self.val_maxVoltLimit.setValue(limits[0])
+        self.val_maxCurrLimit.setValue(limits[1])
+        self.val_maxResLimit.setValue(limits[2])
+        self.val_maxPowerLimit.setValue(limits[3])
+
         self.val_maxVoltLimit.setStyleSheet("")
         self.val_maxCurrLimit.setStyleSheet("")
         self.val_maxPowerLimit.setStyleSheet("")
         self.val_maxResLimit.setStyleSheet("")
 
-    def reset_limits(self):
-        try:
+    @task
+    async def reset_limits(self):
+        def reset():
             load.settings.voltage_limit = 120
             load.settings.current_limit = 30
             load.settings.power_limit = 300
             load.settings.resistance_limit = 7500
+
+        device_state.invalidate(*LIMITS)
+        try:
+            await scheduler.run(reset)
         except serial.serialutil.PortNotOpenError as ex:
             self.display_error(ex)
             return
@@ -500,45 +1043,45 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
         self.val_maxPowerLimit.setStyleSheet("")
         self.val_maxResLimit.setStyleSheet("")
 
-        self.get_limits()
-
-    def set_limits(self, btn_object: QPushButton):
-        try:
-            match btn_object:
-                case self.btn_setPowerLimit:
-                    load.settings.power_limit = self.val_maxPowerLimit.value()
-                    self.val_maxPowerLimit.setStyleSheet("")
-                case self.btn_setResLimit:
-                    load.settings.resistance_limit = self.val_maxResLimit.value()
-                    self.val_maxResLimit.setStyleSheet("")
-                case self.btn_setVoltLimit:
-                    load.settings.voltage_limit = self.val_maxVoltLimit.value()
-                    self.val_maxVoltLimit.setStyleSheet("")
-                case self.btn_setCurrLimit:
-                    load.settings.current_limit = self.val_maxCurrLimit.value()
-                    self.val_maxCurrLimit.setStyleSheet("")
+        await self.get_limits()
+
+    @task
+    async def set_limits(self, btn_object: QPushButton):
+        match btn_object:
+            case self.btn_setPowerLimit:
+                name, spin_box = "power_limit", self.val_maxPowerLimit
+            case self.btn_setResLimit:
+                name, spin_box = "resistance_limit", self.val_maxResLimit
+            case self.btn_setVoltLimit:
+                name, spin_box = "voltage_limit", self.val_maxVoltLimit
+            case _:
+                name, spin_box = "current_limit", self.val_maxCurrLimit
+        try:
+            await scheduler.run(setattr, load.settings, name, spin_box.value())
         except serial.serialutil.PortNotOpenError as ex:
             self.display_error(ex)
             return
+        finally:
+            device_state.invalidate(name)  # load might not have taken the value as sent
+        spin_box.setStyleSheet("")
 
-    def set_battery(self):
+    @task
+    async def set_battery(self):
         battery_list = BattList(self.val_battery_slot.value(), self.val_battery_current.value(),
                                 self.val_battery_current.value(), self.val_battery_voltage.value(),
                                 self.val_battery_capacity.value(),
                                 self.val_battery_hours.value() * 60 + self.val_battery_minutes.value() + self.val_battery_seconds.value() / 60)
         try:
-            load.set_batt(battery_list)
+            await scheduler.run(load.set_batt, battery_list)
         except Exception as ex:
             self.display_error(ex)
             return
 
-    def recall_battery(self):
+    @task
+    async def recall_battery(self):
         try:
-            self.wait_and_set_block()
-            battery_list = load.get_batt(self.val_battery_slot.value())
-            self.unset_block()
+            battery_list = await scheduler.run(load.get_batt, self.val_battery_slot.value())
         except (serial.serialutil.PortNotOpenError, ValueError) as ex:
-            self.unset_block()
             self.display_error(ex)
             return
 
@@ -551,79 +1094,209 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
         self.val_battery_minutes.setValue(math.trunc(battery_time))
         self.val_battery_seconds.setValue(round(battery_time % 1 * 60))
 
-    def export_data(self, value_type: str):  # export recorded data as csv file
-        file_name = QFileDialog.getSaveFileName(self, "Export to...", "", "csv (*.csv)")[0]
-        value_list = volts_list
+    def confirm_incomplete_export(self, dropped: int, window: int) -> bool:  # warn that oldest samples are not exported
+        if dropped == 0:
+            return True
+        answer = QMessageBox.warning(self, "Incomplete run",
+                                     "The oldest {0} samples of this run were dropped from memory(memory window of {1} samples) and were not recorded to disk, "
+                                     "the export only contains the newest samples.\n\nEnable \"Record runs to disk\" to export complete runs.\n\nExport anyway?".format(dropped, window),
+                                     QMessageBox.StandardButton.Cancel | QMessageBox.StandardButton.Ok, QMessageBox.StandardButton.Cancel)
+        return answer == QMessageBox.StandardButton.Ok
+
+    def export_data(self, value_type: str):  # export recorded data as csv or session file in background
+        if not self.confirm_incomplete_export(dropped_samples(samples, recorder), samples.max_length):
+            return
+        file_name, file_filter = QFileDialog.getSaveFileName(self, "Export to...", "", "csv (*.csv);;session (*.npz)")
+        session = file_filter.startswith("session") or file_name.endswith(".npz")
+        names = ("time", "voltage", "current", "power")
         match value_type:
             case "Voltage":
-                value_list = volts_list
+                names = ("time", "voltage")
             case "Current":
-                value_list = amps_list
+                names = ("time", "current")
             case "Power":
-                value_list = watts_list
-        if not file_name == "":
-            if not file_name.endswith(".csv"):
-                file_name += ".csv"
-            numpy.savetxt(fname=file_name, X=value_list, fmt='%f', delimiter=",", header="Time,Value", comments="")
+                names = ("time", "power")
+        if file_name == "":
+            return
+        extension = ".npz" if session else ".csv"
+        if not file_name.endswith(extension):
+            file_name += extension
+
+        if session:
+            self.export_session(file_name, names)
+        else:
+            columns = run_columns()
+            self.start_export(file_name, columns, names, quality_report=quality.report(columns["time"]))
+
+    @task
+    async def export_session(self, file_name: str, names: tuple):  # limits for the session metadata are read from the load first
+        columns = run_columns()
+        self.start_export(file_name, columns, names, await self.session_metadata(columns))
+
+    def start_export(self, file_name: str, columns: dict, names: tuple, session_metadata: dict = None, quality_report: dict = None):
+        self.set_export_enabled(False)
+        self.export_progress = QProgressDialog("Exporting data to " + os.path.basename(file_name), "Cancel", 0, len(columns["time"]), self)
+        self.export_progress.setWindowTitle("Export")
+        self.export_progress.setWindowModality(QtCore.Qt.WindowModality.WindowModal)
+        self.export_progress.setMinimumDuration(500)
+        self.export_thread = QtCore.QThread(self)
+        self.export_worker = ExportWorker(file_name, columns, names, session_metadata, quality_report)
+        self.export_worker.moveToThread(self.export_thread)
+        self.export_thread.started.connect(self.export_worker.run)
+        self.export_worker.progress.connect(self.export_progress.setValue)
+        self.export_worker.done.connect(self.export_done)
+        self.export_worker.failed.connect(self.export_failed)
+        self.export_progress.canceled.connect(self.export_worker.cancel, QtCore.Qt.ConnectionType.DirectConnection)
+        self.export_thread.start()
+
+    async def session_metadata(self, columns: dict) -> dict:  # context of recorded data stored in session files
+        try:
+            limits = dict(zip(("voltage", "current", "resistance", "power"), await self.device_values(*LIMITS)))
+        except (serial.serialutil.SerialException, ValueError):
+            limits = None
+        return {"model": self.model,
+                "mode": self.lbl_mode.text(),
+                "limits": limits,
+                "start_time": recorder.start_time if recorder is not None else None,
+                "ah": integrate(columns["time"], columns["current"]), "wh": integrate(columns["time"], columns["power"]),
+                "quality": quality.report(columns["time"]),
+                "settings": {"measure_interval": setting_measure_interval, "baudrate": setting_baudrate.b,
+                             "frame_acquisition": setting_frame_acquisition, "off_close": setting_off_stop,
+                             "off_disconnect": setting_off_disconnect}}
+
+    def export_finished(self):
+        self.export_thread.quit()
+        self.export_thread.wait()
+        self.export_progress.reset()
+        self.set_export_enabled(True)
+
+    def set_export_enabled(self, enabled: bool):  # only one export at a time
+        self.btn_export.setEnabled(enabled)
+        if self.tab_devices not in self.tab_builders:
+            self.btn_device_export.setEnabled(enabled)
+
+    def export_done(self, rows: int, duration: float):
+        self.export_finished()
+        self.statusbar.showMessage("Exported {0} rows in {1:.2f} s".format(rows, duration), 10000)
+
+    def export_failed(self, msg: str):
+        self.export_finished()
+        if msg == "":
+            self.statusbar.showMessage("Export cancelled", 10000)
+        else:
+            QMessageBox.critical(self, "Export error", "Error during export:\n" + msg)
 
     def factory_reset(self):  # Perform factory reset after confirmation from dialog
         confirmation_box = QMessageBox.warning(self.parent(), "Confirm Factory Reset",
                                                "Confirm Factory Reset?\n" + "This might cause interruption of connection!",
                                                QMessageBox.StandardButton.Cancel | QMessageBox.StandardButton.Ok,
                                                QMessageBox.StandardButton.Cancel)
+        if confirmation_box == QMessageBox.StandardButton.Ok:
+            device_state.invalidate()
+            self.run_command(load.settings.factoryreset)
+
+    @task
+    async def run_command(self, fn, *args):  # user command without result
         try:
-            if confirmation_box == QMessageBox.StandardButton.Ok:
-                load.settings.factoryreset()
-        except serial.serialutil.PortNotOpenError as ex:
+            await scheduler.run(fn, *args)
+        except (serial.serialutil.SerialException, ValueError) as ex:
             self.display_error(ex)
-            return
 
-    def get_settings(self):
-        try:
-            self.groupBox_settings.setTitle("Device Settings - Updating settings from device")
-            QtCore.QCoreApplication.processEvents()
-            self.wait_and_set_block()
-            self.cmb_baudrate.setCurrentText(str(load.settings.baudrate.b))
-            self.chk_beep.setChecked(load.settings.beep.get().value)
-            self.chk_lock.setChecked(load.settings.lock.get().value)
-            self.chk_trigger.setChecked(load.settings.trigger.get().value)
-            self.chk_comp.setChecked(load.settings.compensation.get().value)
-            self.chk_dhcp.setChecked(load.settings.dhcp.get().value)
-            self.val_ip_address.setText(load.settings.ipaddress)
-            self.val_subnetmask.setText(load.settings.subnetmask)
-            self.val_gateway.setText(load.settings.gateway)
-            self.val_mac_address.setText(load.settings.macaddress)
-            self.val_device_port.setValue(load.settings.port)
-            self.unset_block()
-            self.groupBox_settings.setTitle("Device Settings")
-        except serial.serialutil.PortNotOpenError as ex:
-            self.unset_block()
+    @task
+    async def get_settings(self):  # refresh cached settings from load, widgets are filled once all settings are read
+        device_state.invalidate(*SETTINGS)
+        self.btn_get_settings.setEnabled(False)
+        self.btn_set_settings.setEnabled(False)  # would diff against settings not read yet
+
+        def read_progress(done: int, count: int):
+            self.groupBox_settings.setTitle("Device Settings - Updating settings from device({0}/{1})".format(done, count))
+
+        try:
+            read_progress(0, len(SETTINGS))
+            start = time.perf_counter()
+            settings = await self.device_values(*SETTINGS, progress=read_progress)
+            self.cmb_baudrate.setCurrentText(str(settings[0].b))
+            self.chk_beep.setChecked(settings[1].value)
+            self.chk_lock.setChecked(settings[2].value)
+            self.chk_trigger.setChecked(settings[3].value)
+            self.chk_comp.setChecked(settings[4].value)
+            self.chk_dhcp.setChecked(settings[5].value)
+            self.val_ip_address.setText(settings[6])
+            self.val_subnetmask.setText(settings[7])
+            self.val_gateway.setText(settings[8])
+            self.val_mac_address.setText(settings[9])
+            self.val_device_port.setValue(settings[10])
+            self.statusbar.showMessage("Device settings read in {0:.0f} ms".format((time.perf_counter() - start) * 1000), 5000)
+        except (serial.serialutil.SerialException, ValueError) as ex:
             self.display_error(ex)
+        finally:
             self.groupBox_settings.setTitle("Device Settings")
-            return
+            self.btn_get_settings.setEnabled(True)
+            self.btn_set_settings.setEnabled(True)
 
-    def set_settings(self):
+    @task
+    async def set_settings(self):  # only settings which differ from the ones on the load are sent
         try:
             self.groupBox_settings.setTitle("Device Settings - Saving settings to device")
-            QtCore.QCoreApplication.processEvents()
-            load.settings.setting_baudrate = BaudRate(int(self.cmb_baudrate.currentText()))
-            load.settings.beep.on() if self.chk_beep.isChecked() else load.settings.beep.off()
-            load.settings.lock.on() if self.chk_lock.isChecked() else load.settings.lock.off()
-            load.settings.trigger.on() if self.chk_trigger.isChecked() else load.settings.trigger.off()
-            load.settings.compensation.on() if self.chk_comp.isChecked() else load.settings.compensation.off()
-            load.settings.ipaddress = self.val_ip_address.text()
-            load.settings.subnetmask = self.val_subnetmask.text()
-            load.settings.gateway = self.val_gateway.text()
-            load.settings.macaddress = self.val_mac_address.text()
-            load.settings.port = self.val_device_port.value()
-            load.settings.dhcp.on() if self.chk_dhcp.isChecked() else load.settings.dhcp.off()
+            wanted = {"baudrate": BaudRate(int(self.cmb_baudrate.currentText())), "beep": self.chk_beep.isChecked(),
+                      "lock": self.chk_lock.isChecked(), "trigger": self.chk_trigger.isChecked(),
+                      "compensation": self.chk_comp.isChecked(), "dhcp": self.chk_dhcp.isChecked(),
+                      "ipaddress": self.val_ip_address.text(), "subnetmask": self.val_subnetmask.text(),
+                      "gateway": self.val_gateway.text(), "macaddress": self.val_mac_address.text(),
+                      "port": self.val_device_port.value()}
+            current = dict(zip(SETTINGS, await self.device_values(*SETTINGS)))
+            changes = settings_diff(current, wanted)
+            summary = describe_diff(current, changes)
+            if changes:
+                try:
+                    await scheduler.run(write_values, load.settings, changes)
+                finally:
+                    device_state.invalidate(*changes)  # load might not have taken the values as sent
+            if "baudrate" in changes:  # connection only works at the new rate from now on
+                self.remember_baudrate(self.connected_port, changes["baudrate"])
+                self.show_message(QMessageBox.information, "Baudrate changed",
+                                  "The load communicates at {0} baud now, reconnect with this baudrate.".format(changes["baudrate"].b))
+            if self.chk_settings_devices.isChecked() and len(device_manager) > 0:
+                shared = {name: value for name, value in wanted.items() if name not in DEVICE_SPECIFIC}
+                sent, failed = await self.set_device_settings(shared)
+                summary.append("{0} devices: {1} settings sent{2}".format(
+                    len(device_manager) - len(failed), sent, ", {0} failed".format(len(failed)) if failed else ""))
+                if failed:
+                    self.show_message(QMessageBox.warning, "Device settings",
+                                      "Settings could not be set on these loads:\n" + "\n".join(
+                                          "{0}: {1}".format(port, ex) for port, ex in failed.items()))
+            self.statusbar.showMessage("Device settings: " + (", ".join(summary) if summary else "unchanged, nothing sent"), 10000)
             self.groupBox_settings.setTitle("Device Settings")
-        except serial.serialutil.PortNotOpenError as ex:
+        except (serial.serialutil.SerialException, ValueError) as ex:
             self.display_error(ex)
             self.groupBox_settings.setTitle("Device Settings")
             return
 
-    def set_ocp(self):
+    async def set_device_settings(self, wanted: dict) -> tuple:
+        """ Settings for loads of devices tab, each one diffed on its own. A load which fails does not stop the others.
+
+        :return: tuple of number of settings sent and dict of port and error of each load which failed
+        """
+        sent = 0
+        failed = {}
+        for device in device_manager.devices:
+            try:
+                if device.frame_acquisition:
+                    current = {}
+                    for batch in batches(wanted):
+                        current.update(await device.scheduler.run(read_values_pipelined, device.load, batch))
+                else:
+                    current = await device.scheduler.run(read_values, device.load.settings, tuple(wanted))
+                changes = settings_diff(current, wanted)
+                if changes:
+                    await device.scheduler.run(write_values, device.load.settings, changes)
+                    sent += len(changes)
+            except (serial.serialutil.SerialException, ValueError) as ex:
+                failed[device.port] = ex
+        return sent, failed
+
+    @task
+    async def set_ocp(self):
         ocp_list = OCPList(self.val_ocp_slot.value(), self.val_ocp_on_voltage.value(),
                            self.val_ocp_on_delay_seconds.value(), self.val_ocp_initial_current.value(),
                            self.val_ocp_initial_current.value(), self.val_ocp_step_current.value(),
@@ -631,18 +1304,16 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
                            self.val_ocp_test_voltage.value(), self.val_ocp_max_over_current.value(),
                            self.val_ocp_min_over_current.value())
         try:
-            load.set_ocp(ocp_list)
+            await scheduler.run(load.set_ocp, ocp_list)
         except Exception as ex:
             self.display_error(ex)
             return
 
-    def recall_ocp(self):
+    @task
+    async def recall_ocp(self):
         try:
-            self.wait_and_set_block()
-            ocp_list = load.get_ocp(self.val_ocp_slot.value())
-            self.unset_block()
+            ocp_list = await scheduler.run(load.get_ocp, self.val_ocp_slot.value())
         except (serial.serialutil.PortNotOpenError, ValueError) as ex:
-            self.unset_block()
             self.display_error(ex)
             return
         self.val_ocp_on_voltage.setValue(ocp_list.on_voltage)
@@ -659,11 +1330,15 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
         values = ""
         if isinstance(ex, ValueOutOfLimitError):
             values = "Affected value " + ex.value.__str__() + " being out of limit of " + ex.limit.__str__()
-        QMessageBox.critical(self, "Validation error", "Error during validation:\n" + str(ex) + "\n" + values)
+        self.show_message(QMessageBox.critical, "Validation error", "Error during validation:\n" + str(ex) + "\n" + values)
 
-    def display_error_thread(self, title: str, msg: str):  # For displaying error from worker thread
-        self.timer.stop()
-        QMessageBox.critical(self, title, msg)
+    def display_error_thread(self, title: str, msg: str):  # For displaying error from polling
+        self.stop_polling.emit()
+        self.show_message(QMessageBox.critical, title, msg)
+
+    def show_message(self, show, title: str, msg: str):
+        # Opened from the event loop instead of the calling coroutine, its modal loop would block all other coroutines
+        QTimer.singleShot(0, lambda: show(self, title, msg))
 
     def validate_ocp(self):
         ocp_list = OCPList(self.val_ocp_slot.value(), self.val_ocp_on_voltage.value(),
@@ -677,9 +1352,10 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
         except Exception as ex:
             self.display_error(ex)
         else:
-            QMessageBox.information(self, "Validation OK", "Validation passed")
+            self.show_message(QMessageBox.information, "Validation OK", "Validation passed")
 
-    def set_opp(self):
+    @task
+    async def set_opp(self):
         opp_list = OPPList(self.val_opp_slot.value(), self.val_opp_on_voltage.value(),
                            self.val_opp_on_delay_seconds.value(), self.val_opp_current_range.value(),
                            self.val_opp_initial_power.value(), self.val_opp_step_power.value(),
@@ -687,18 +1363,16 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
                            self.val_opp_test_voltage.value(), self.val_opp_max_over_power.value(),
                            self.val_opp_min_over_power.value())
         try:
-            load.set_opp(opp_list)
+            await scheduler.run(load.set_opp, opp_list)
         except Exception as ex:
             self.display_error(ex)
             return
 
-    def recall_opp(self):
+    @task
+    async def recall_opp(self):
         try:
-            self.wait_and_set_block()
-            opp_list = load.get_opp(self.val_opp_slot.value())
-            self.unset_block()
+            opp_list = await scheduler.run(load.get_opp, self.val_opp_slot.value())
         except (serial.serialutil.PortNotOpenError, ValueError) as ex:
-            self.unset_block()
             self.display_error(ex)
             return
         self.val_opp_on_voltage.setValue(opp_list.on_voltage)
@@ -724,160 +1398,136 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
         except Exception as ex:
             self.display_error(ex)
         else:
-            QMessageBox.information(self, "Validation OK", "Validation passed")
+            self.show_message(QMessageBox.information, "Validation OK", "Validation passed")
 
-    def validate_dcv(self):
+    @task
+    async def validate_dcv(self):
         dcv_list = CVList(self.val_dcv_voltage_1.value(), self.val_dcv_voltage_2.value(),
                           self.val_dcv_frequency.value(), self.val_dcv_duty.value())
         try:
-            self.wait_and_set_block()
-            dcv_list.validate(load.settings.voltage_limit)
-            self.unset_block()
+            dcv_list.validate(*await self.device_values("voltage_limit"))
         except Exception as ex:
-            self.unset_block()
             self.display_error(ex)
         else:
-            QMessageBox.information(self, "Validation OK", "Validation passed")
+            self.show_message(QMessageBox.information, "Validation OK", "Validation passed")
 
-    def set_dcv(self):
+    @task
+    async def set_dcv(self):
         dcv_list = CVList(self.val_dcv_voltage_1.value(), self.val_dcv_voltage_2.value(),
                           self.val_dcv_frequency.value(), self.val_dcv_duty.value())
         try:
-            self.wait_and_set_block()
-            load.set_dynamic_mode(dcv_list)
-            self.unset_block()
+            await scheduler.run(load.set_dynamic_mode, dcv_list)
         except Exception as ex:
-            self.unset_block()
             self.display_error(ex)
             return
 
-    def validate_dcc(self):
+    @task
+    async def validate_dcc(self):
         dcc_list = CCList(self.val_dcc_slope_1.value(), self.val_dcc_slope_2.value(), self.val_dcc_current_1.value(),
                           self.val_dcc_current_2.value(), self.val_dcc_frequency.value(), self.val_dcc_duty.value())
 
         try:
-            self.wait_and_set_block()
-            dcc_list.validate(load.settings.current_limit)
-            self.unset_block()
+            dcc_list.validate(*await self.device_values("current_limit"))
         except Exception as ex:
-            self.unset_block()
             self.display_error(ex)
         else:
-            QMessageBox.information(self, "Validation OK", "Validation passed")
+            self.show_message(QMessageBox.information, "Validation OK", "Validation passed")
 
-    def set_dcc(self):
+    @task
+    async def set_dcc(self):
         dcc_list = CCList(self.val_dcc_slope_1.value(), self.val_dcc_slope_2.value(), self.val_dcc_current_1.value(),
                           self.val_dcc_current_2.value(), self.val_dcc_frequency.value(), self.val_dcc_duty.value())
         try:
-            self.wait_and_set_block()
-            load.set_dynamic_mode(dcc_list)
-            self.unset_block()
+            await scheduler.run(load.set_dynamic_mode, dcc_list)
         except Exception as ex:
-            self.unset_block()
             self.display_error(ex)
             return
 
-    def validate_dcr(self):
+    @task
+    async def validate_dcr(self):
         dcr_list = CRList(self.val_dcr_resistance_1.value(), self.val_dcr_resistance_2.value(),
                           self.val_dcr_frequency.value(), self.val_dcr_duty.value())
         try:
-            self.wait_and_set_block()
-            dcr_list.validate(load.settings.resistance_limit)
-            self.unset_block()
+            dcr_list.validate(*await self.device_values("resistance_limit"))
         except Exception as ex:
-            self.unset_block()
             self.display_error(ex)
         else:
-            QMessageBox.information(self, "Validation OK", "Validation passed")
+            self.show_message(QMessageBox.information, "Validation OK", "Validation passed")
 
-    def set_dcr(self):
+    @task
+    async def set_dcr(self):
         dcr_list = CRList(self.val_dcr_resistance_1.value(), self.val_dcr_resistance_2.value(),
                           self.val_dcr_frequency.value(), self.val_dcr_duty.value())
         try:
-            self.wait_and_set_block()
-            load.set_dynamic_mode(dcr_list)
-            self.unset_block()
+            await scheduler.run(load.set_dynamic_mode, dcr_list)
         except Exception as ex:
-            self.unset_block()
             self.display_error(ex)
             return
 
-    def validate_dcp(self):
+    @task
+    async def validate_dcp(self):
         dcp_list = CWList(self.val_dcp_power_1.value(), self.val_dcp_power_2.value(), self.val_dcp_frequency.value(),
                           self.val_dcp_duty.value())
         try:
-            self.wait_and_set_block()
-            dcp_list.validate(load.settings.power_limit)
-            self.unset_block()
+            dcp_list.validate(*await self.device_values("power_limit"))
         except Exception as ex:
-            self.unset_block()
             self.display_error(ex)
         else:
-            QMessageBox.information(self, "Validation OK", "Validation passed")
+            self.show_message(QMessageBox.information, "Validation OK", "Validation passed")
 
-    def set_dcp(self):
+    @task
+    async def set_dcp(self):
         dcp_list = CWList(self.val_dcp_power_1.value(), self.val_dcp_power_2.value(), self.val_dcp_frequency.value(),
                           self.val_dcp_duty.value())
         try:
-            self.wait_and_set_block()
-            load.set_dynamic_mode(dcp_list)
-            self.unset_block()
+            await scheduler.run(load.set_dynamic_mode, dcp_list)
         except Exception as ex:
-            self.unset_block()
             self.display_error(ex)
             return
 
-    def validate_pulse(self):
+    @task
+    async def validate_pulse(self):
         pulse_list = PulseList(self.val_pulse_slope_1.value(), self.val_pulse_slope_2.value(),
                                self.val_pulse_current_1.value(), self.val_pulse_current_2.value(),
                                self.val_pulse_duration.value())
 
         try:
-            self.wait_and_set_block()
-            pulse_list.validate(load.settings.current_limit)
-            self.unset_block()
+            pulse_list.validate(*await self.device_values("current_limit"))
         except Exception as ex:
-            self.unset_block()
             self.display_error(ex)
         else:
-            QMessageBox.information(self, "Validation OK", "Validation passed")
+            self.show_message(QMessageBox.information, "Validation OK", "Validation passed")
 
-    def set_pulse(self):
+    @task
+    async def set_pulse(self):
         pulse_list = PulseList(self.val_pulse_slope_1.value(), self.val_pulse_slope_2.value(),
                                self.val_pulse_current_1.value(), self.val_pulse_current_2.value(),
                                self.val_pulse_duration.value())
         try:
-            self.wait_and_set_block()
-            load.set_dynamic_mode(pulse_list)
-            self.unset_block()
+            await scheduler.run(load.set_dynamic_mode, pulse_list)
         except Exception as ex:
-            self.unset_block()
             self.display_error(ex)
             return
 
-    def validate_toggle(self):
+    @task
+    async def validate_toggle(self):
         toggle_list = ToggleList(self.val_toggle_slope_1.value(), self.val_toggle_slope_2.value(),
                                  self.val_toggle_current_1.value(), self.val_toggle_current_2.value())
 
         try:
-            self.wait_and_set_block()
-            toggle_list.validate(load.settings.current_limit)
-            self.unset_block()
+            toggle_list.validate(*await self.device_values("current_limit"))
         except Exception as ex:
-            self.unset_block()
             self.display_error(ex)
         else:
-            QMessageBox.information(self, "Validation OK", "Validation passed")
+            self.show_message(QMessageBox.information, "Validation OK", "Validation passed")
 
-    def set_toggle(self):
+    @task
+    async def set_toggle(self):
         toggle_list = ToggleList(self.val_toggle_slope_1.value(), self.val_toggle_slope_2.value(),
                                  self.val_toggle_current_1.value(), self.val_toggle_current_2.value())
         try:
-            self.wait_and_set_block()
-            load.set_dynamic_mode(toggle_list)
-            self.unset_block()
+            await scheduler.run(load.set_dynamic_mode, toggle_list)
         except Exception as ex:
-            self.unset_block()
             self.display_error(ex)
             return
 
@@ -888,7 +1538,8 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
 
         return True if all_empty is False else False
 
-    def set_list(self):
+    @task
+    async def set_list(self):
         steps = []
         highest_current = 0
         for r in range(self.table_list.rowCount()):
@@ -899,15 +1550,86 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
                 duration = float(self.table_list.item(r, 2).text())
                 steps.append(ListStep(current, current_slope, duration))
             elif self.table_row_incomplete(r):
-                QMessageBox.warning(self, "Incomplete entry", "Incomplete entry on row " + (r + 1).__str__())
+                self.show_message(QMessageBox.warning, "Incomplete entry", "Incomplete entry on row " + (r + 1).__str__())
                 return
 
         try:
-            load.set_list(LoadList(self.val_list_slot.value(), highest_current, steps, self.val_list_loops.value()))
+            await scheduler.run(load.set_list, LoadList(self.val_list_slot.value(), highest_current, steps, self.val_list_loops.value()))
         except Exception as ex:
             self.display_error(ex)
             return
 
+    def host_list(self):  # start or stop a list program played from the host
+        if not self.btn_list_host.isChecked():  # running sequence sees the button unchecked and stops
+            return
+        file_name, _ = QFileDialog.getOpenFileName(self, "Run list program from...", "", "csv (*.csv)")
+        if file_name == "":
+            self.btn_list_host.setChecked(False)
+            return
+        self.run_host_list(file_name)
+
+    @task
+    async def run_host_list(self, file_name: str):
+        await self.play_sequence(lambda: list_sequence(read_program(file_name), self.val_list_loops.value()), file_name,
+                                 self.btn_list_host, "Run on host", "Host list")
+
+    def waveform(self):  # start or stop playing a waveform file in the mode selected for basic mode
+        if not self.btn_waveform.isChecked():  # running sequence sees the button unchecked and stops
+            return
+        mode = (Mode.constant_current, Mode.constant_voltage, Mode.constant_resistance, Mode.constant_power,
+                Mode.short)[self.cmbBox_stdModes.currentIndex()]
+        if mode not in COMMANDS:  # checked before the interval gets measured on the connection
+            self.btn_waveform.setChecked(False)
+            self.display_error(ValueError("Waveforms can only be played in CC, CV, CR or CW mode"))
+            return
+        file_name, _ = QFileDialog.getOpenFileName(self, "Play waveform from...", "", "waveform (*.csv *.npz)")
+        if file_name == "":
+            self.btn_waveform.setChecked(False)
+            return
+        self.play_waveform(file_name, mode)
+
+    @task
+    async def play_waveform(self, file_name: str, mode: Mode):
+        try:
+            interval = await scheduler.run(update_interval, load)
+        except (serial.serialutil.SerialException, ValueError):
+            interval = MIN_INTERVAL  # errors of the connection are shown once playing
+        await self.play_sequence(lambda: waveform_sequence(*read_waveform(file_name, mode), interval, mode),
+                                 file_name, self.btn_waveform, "Play waveform", "Waveform")
+
+    async def play_sequence(self, make_sequence, file_name: str, button: QPushButton, idle_text: str, name: str):
+        """ Play a host driven sequence, steps are placed on the runtime of the recorded samples.
+
+        :param make_sequence: callable creating the Sequencer, errors while reading the file are shown like other errors
+        :param button: checkable button which stops the sequence when unchecked
+        """
+        try:
+            sequence = make_sequence()
+            sequence.validate(*await self.device_values(SETPOINT_LIMITS[sequence.mode]))
+            await scheduler.run(send_setpoint, load, COMMANDS[sequence.mode], float(sequence.values[0]))  # run starts with the first step
+            if not run_state.running:
+                self.btn_startStop.setChecked(True)
+                await self.pressed_start_btn()
+                if not run_state.running:
+                    return
+
+            def step_done(done: int, count: int):
+                button.setText("Stop {0}/{1}".format(done, count))
+
+            await sequence.run(scheduler, load, origin=run_state.start_timestamp, progress=step_done,
+                               cancelled=lambda: not button.isChecked())
+            write_step_table(step_table_path(file_name), sequence.step_table(run_columns()["time"]))
+            report = sequence.report()
+            self.statusbar.showMessage("{0}: {1}/{2} steps sent, {3} skipped, lateness mean {4:.1f} ms p99 {5:.1f} ms max {6:.1f} ms, interval {7:.1f} ms achieved of {8:.1f} ms{9}".format(
+                name, report["sent"], report["steps"], report["skipped"], report["lateness_mean"] * 1000, report["lateness_p99"] * 1000,
+                report["lateness_max"] * 1000, report["interval_achieved"] * 1000, report["interval_requested"] * 1000,
+                ", cancelled" if report["cancelled"] else ""))
+        except (OSError, serial.serialutil.SerialException, ValueError, ValueOutOfLimitError) as ex:
+            self.display_error(ex)
+        finally:
+            button.setChecked(False)
+            button.setText(idle_text)
+
     def validate_list(self):
         steps = []
         highest_current = 0
@@ -921,7 +1643,7 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
                 duration = float(self.table_list.item(r, 2).text())
                 steps.append(ListStep(current, current_slope, duration))
             elif self.table_row_incomplete(r):
-                QMessageBox.warning(self, "Incomplete entry", "Incomplete entry on row " + (r + 1).__str__())
+                self.show_message(QMessageBox.warning, "Incomplete entry", "Incomplete entry on row " + (r + 1).__str__())
                 return
 
         try:
@@ -929,16 +1651,14 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
         except Exception as ex:
             self.display_error(ex)
         else:
-            QMessageBox.information(self, "Validation OK", "Validation passed")
+            self.show_message(QMessageBox.information, "Validation OK", "Validation passed")
 
-    def recall_list(self):
+    @task
+    async def recall_list(self):
         self.table_list.clearContents()
         try:
-            self.wait_and_set_block()
-            load_list: LoadList = load.get_list(self.val_list_slot.value())
-            self.unset_block()
+            load_list: LoadList = await scheduler.run(load.get_list, self.val_list_slot.value())
         except (serial.serialutil.PortNotOpenError, ValueError) as ex:
-            self.unset_block()
             self.display_error(ex)
             return
 
@@ -982,34 +1702,64 @@ class MainWindow(QMainWindow, ui_mainwindow.Ui_MainWindow):
             self.table_list.takeItem(selection[selection.__len__() - 1].row(), selection.pop().column())
 
     def init_saves(self):
-        confirmation_box = QMessageBox.warning(self.parent(), "Confirm Initialization",
-                                               "Confirm Initialization of all save slots?\n\n" + "This will set values in all available save slots(memory, lists,...) and OVERWRITE all saved values.\n\nThis might take a while!",
-                                               QMessageBox.StandardButton.Cancel | QMessageBox.StandardButton.Ok,
-                                               QMessageBox.StandardButton.Cancel)
-        try:
-            if confirmation_box == QMessageBox.StandardButton.Ok:
-                self.groupBox_settings.setTitle("Device Settings - Initializing Saves")
-                QtCore.QCoreApplication.processEvents()
-                for i in range(1, 11):
-                    load.set_batt(BattList(i, 1, 1, 1, 1, 1), False)
-                    load.set_ocp(OCPList(i, 5, 1, 1, 1, 0.1, 0.1, 0.1, 1, 0.3, 0.2), False)
-                    load.set_opp(OPPList(i, 5, 1, 1, 1, 0.1, 0.1, 0.1, 2, 0.3, 0.2), False)
-                    if i < 8:
-                        load.set_list(LoadList(i, 2, [ListStep(1, 0.1, 1), ListStep(2, 0.2, 2)], 3), False)
-                self.groupBox_settings.setTitle("Device Settings")
+        confirmation_box = QMessageBox(QMessageBox.Icon.Warning, "Confirm Initialization",
+                                       "Confirm Initialization of all save slots?\n\n" + "This will set values in all available save slots(memory, lists,...) and OVERWRITE all saved values.\n\nThis might take a while!",
+                                       QMessageBox.StandardButton.Cancel | QMessageBox.StandardButton.Ok, self.parent())
+        confirmation_box.setDefaultButton(QMessageBox.StandardButton.Cancel)
+        if not run_state.running:  # reading a slot back recalls it, which would switch the function of a running load
+            confirmation_box.setCheckBox(QCheckBox("Skip slots which already hold these values(reads each slot first)"))
+        if confirmation_box.exec() == QMessageBox.StandardButton.Ok:
+            self.write_init_saves(confirmation_box.checkBox() is not None and confirmation_box.checkBox().isChecked())
+
+    @task
+    async def write_init_saves(self, skip_identical: bool):  # polling and UI keep running in between the slots
+        writes = init_slot_writes()
+        progress = QProgressDialog("Initializing save slots", "Cancel", 0, len(writes), self)
+        progress.setWindowTitle("Init Saves")
+        progress.setMinimumDuration(0)
+        self.btn_init_saves.setEnabled(False)
+
+        def slot_done(count: int, write):
+            progress.setValue(count)
+            progress.setLabelText("Initializing save slots - {0} done".format(write))
 
-        except serial.serialutil.PortNotOpenError as ex:
+        try:
+            self.groupBox_settings.setTitle("Device Settings - Initializing Saves")
+            result = await write_slots(scheduler, load, writes, skip_identical, slot_done, progress.wasCanceled)
+            self.statusbar.showMessage("Save slots: {0} of {1} written, {2} already up to date{3}".format(
+                result["written"], len(writes), result["skipped"], ", cancelled" if result["cancelled"] else ""), 10000)
+        except (serial.serialutil.SerialException, ValueError) as ex:
             self.display_error(ex)
+        finally:
+            progress.reset()
+            self.btn_init_saves.setEnabled(True)
             self.groupBox_settings.setTitle("Device Settings")
-            return
+
+
+def startup_report() -> str:  # time of each startup phase and until first window
+    lines = []
+    for (_, previous), (name, mark) in zip(startup_marks, startup_marks[1:]):
+        lines.append("{0:<14} {1:8.1f} ms {2:8.1f} ms".format(name, (mark - previous) * 1000, (mark - startup_marks[0][1]) * 1000))
+    return "\n".join(["{0:<14} {1:>11} {2:>11}".format("phase", "duration", "total")] + lines)
 
 
 def main():
-    app = QtWidgets.QApplication(sys.argv)
+    global simulated_port
+    if "--simulate" in sys.argv:  # simulated load for testing without hardware
+        simulated_port = start_simulated_port()
+    QtWidgets.QApplication(sys.argv)  # kept by Qt as the application instance, QtAsyncio runs its event loop
+    startup_marks.append(("application", time.perf_counter()))
     window = MainWindow()
+    startup_marks.append(("main window", time.perf_counter()))
     window.show()
+    if "--profile-startup" in sys.argv:
+        def first_window():  # first pass of the event loop, after window got painted
+            startup_marks.append(("first window", time.perf_counter()))
+            print(startup_report())
+
+        QTimer.singleShot(0, first_window)
     atexit.register(exit_handler, window)
-    sys.exit(app.exec())
+    QtAsyncio.run(keep_running=True, quit_qapp=True)  # Qt event loop as asyncio event loop for the coroutines
 
 
 # python bit to figure how who started This
@@ -0,0 +1,67 @@
+"""
+Deadline based pacing of the acquisition loop.
+
+Ticks are scheduled on a fixed grid of deadlines(start + n * interval), so the loop does not drift when an acquisition
+takes part of the interval. The next tick is only scheduled after the previous acquisition finished, so there is never
+more than one outstanding acquisition. If an acquisition takes longer than the interval the next tick starts right away
+and is counted as late, deadlines that passed completely in the meantime are skipped and counted as such instead of
+being caught up with a burst of acquisitions.
+"""
+
+import math
+import time
+
+
+class DeadlinePacer(object):
+    def __init__(self, interval: float, tolerance: float = 0.1):
+        """
+        :param interval: time between deadlines in seconds
+        :param tolerance: fraction of the interval a tick may start after its deadline without counting as late
+        """
+        self.interval = interval
+        self.tolerance = tolerance
+        self.deadline = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.late = 0
+        self.skipped = 0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+
+    def start(self, now: float = None):  # first deadline is right away
+        self.deadline = time.monotonic() if now is None else now
+
+    def begin(self, now: float = None) -> float:
+        """ Mark start of the tick for the current deadline.
+
+        :return: time in seconds the tick started after its deadline
+        """
+        now = time.monotonic() if now is None else now
+        lateness = max(now - self.deadline, 0.0)
+        self.ticks += 1
+        self.last_lateness = lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        if lateness > self.interval * self.tolerance:
+            self.late += 1
+
+        return lateness
+
+    def end(self, now: float = None) -> float:
+        """ Mark end of the tick and advance to the next deadline.
+
+        :return: time in seconds until the next tick should begin, 0 if it is already due
+        """
+        now = time.monotonic() if now is None else now
+        self.deadline += self.interval
+        if now >= self.deadline + self.interval:  # more than one deadline passed, only the latest one gets a tick
+            missed = math.floor((now - self.deadline) / self.interval)
+            self.skipped += missed
+            self.deadline += missed * self.interval
+
+        return max(self.deadline - now, 0.0)
+
+    def metrics(self) -> dict:
+        return {"ticks": self.ticks, "late": self.late, "skipped": self.skipped, "last_lateness": self.last_lateness,
+                "max_lateness": self.max_lateness}
@@ -0,0 +1,122 @@
+"""
+Writing of many save slots at once, e.g. initializing all battery/OCP/OPP/list slots of the load.
+
+Each slot is one job on the serial scheduler, which optionally reads the slot back first and only writes it if it does
+not already hold the values. A few jobs are queued ahead, so the serial thread runs them back to back without waiting
+for the event loop in between. Jobs are queued with polling priority, so measurements continue in between slots.
+
+Slots are written without recalling them. Reading a slot back can only be done by recalling it, which switches the
+function of the load, so slots are only compared while the input is off(otherwise they are just written) and the
+function active before is set again afterward. Comparing takes longer than writing, it only saves wear of the persistent
+storage of the load.
+"""
+
+import asyncio
+import collections
+import math
+from kelctl import *
+from scheduler import PRIORITY_POLL
+
+
+class SlotWrite(object):  # values for one save slot
+    __slots__ = ("kind", "slot", "values")
+    SETTERS = {"Battery": "set_batt", "OCP": "set_ocp", "OPP": "set_opp", "List": "set_list"}
+    GETTERS = {"Battery": "get_batt", "OCP": "get_ocp", "OPP": "get_opp", "List": "get_list"}
+
+    def __init__(self, kind: str, slot: int, values):
+        self.kind = kind
+        self.slot = slot
+        self.values = values
+
+    def __repr__(self):
+        return "{0} slot {1}".format(self.kind, self.slot)
+
+
+def init_slot_writes() -> list:  # predefined values for every slot, so recalling unused slots does not cause errors
+    writes = []
+    for i in range(1, 11):
+        writes.append(SlotWrite("Battery", i, BattList(i, 1, 1, 1, 1, 1)))
+        writes.append(SlotWrite("OCP", i, OCPList(i, 5, 1, 1, 1, 0.1, 0.1, 0.1, 1, 0.3, 0.2)))
+        writes.append(SlotWrite("OPP", i, OPPList(i, 5, 1, 1, 1, 0.1, 0.1, 0.1, 2, 0.3, 0.2)))
+        if i < 8:
+            writes.append(SlotWrite("List", i, LoadList(i, 2, [ListStep(1, 0.1, 1), ListStep(2, 0.2, 2)], 3)))
+    return writes
+
+
+def same_values(a, b) -> bool:  # lists read back from the load have the same values(up to the precision of the load)
+    if isinstance(a, (list, tuple)):
+        return isinstance(b, (list, tuple)) and len(a) == len(b) and all(same_values(x, y) for x, y in zip(a, b))
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)) and not isinstance(a, bool):
+        return math.isclose(a, b, rel_tol=1e-4, abs_tol=1e-4)
+    if hasattr(a, "__dict__") and hasattr(b, "__dict__"):
+        return type(a) is type(b) and vars(a).keys() == vars(b).keys() and all(same_values(vars(a)[name], vars(b)[name]) for name in vars(a))
+    return a == b
+
+
+def write_slot(load: KELSerial, write: SlotWrite, skip_identical: bool = False) -> bool:
+    """ Write one slot, runs on the serial thread.
+
+    :param skip_identical: read the slot back first(recalls it) if the input is off and skip it if it holds the values
+    :return: False if the slot already held the values and was skipped
+    """
+    if skip_identical and load.input.get() == OnOffState.off:
+        try:
+            current = getattr(load, SlotWrite.GETTERS[write.kind])(write.slot)
+        except (ValueError, IndexError):  # unused slot can not be recalled
+            current = None
+        if current is not None and same_values(current, write.values):
+            return False
+    getattr(load, SlotWrite.SETTERS[write.kind])(write.values, False)
+    return True
+
+
+def restore_function(load: KELSerial, mode: Mode):  # function active before slots were recalled, runs on serial thread
+    if mode in settableModes and load.function != mode:
+        load.function = mode
+
+
+async def write_slots(scheduler, load: KELSerial, writes: list, skip_identical: bool = False, progress=None,
+                      cancelled=None, ahead: int = 2) -> dict:
+    """ Write save slots in the background.
+
+    :param skip_identical: skip slots which already hold the values, see write_slot
+    :param progress: optional callable getting the number of finished slots and the SlotWrite finished last
+    :param cancelled: optional callable, no further slots are started once it returns True
+    :param ahead: number of slots queued on the scheduler ahead of the one being written
+    :return: dict with number of slots written and skipped, and whether it was cancelled
+    """
+    pending = collections.deque()
+    result = {"written": 0, "skipped": 0, "cancelled": False}
+    mode = await scheduler.run(getattr, load, "function") if skip_identical else None
+
+    async def finish_one():
+        write, future = pending.popleft()
+        if future.cancelled():
+            return
+        if await asyncio.wrap_future(future):
+            result["written"] += 1
+        else:
+            result["skipped"] += 1
+        if progress is not None:
+            progress(result["written"] + result["skipped"], write)
+
+    try:
+        for write in writes:
+            if cancelled is not None and cancelled():
+                break
+            pending.append((write, scheduler.submit(write_slot, load, write, skip_identical, priority=PRIORITY_POLL)))
+            if len(pending) > ahead:
+                await finish_one()
+        while pending:
+            if cancelled is not None and cancelled():
+                for _, future in pending:
+                    future.cancel()  # only drops slots not started yet
+            await finish_one()
+    finally:
+        for _, future in pending:  # error or task cancelled
+            future.cancel()
+        if mode is not None:
+            scheduler.submit(restore_function, load, mode)  # queued behind the slots, also if cancelled
+    result["cancelled"] = cancelled is not None and cancelled()
+
+    return result
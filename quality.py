@@ -0,0 +1,99 @@
+"""
+Sampling quality of a run.
+
+The acquisition loop records every sample into a QualityIndex: the interval since the previous sample, deadlines that
+were skipped in between and errors that interrupted the acquisition. Intervals longer than gap_factor times the measure
+interval are kept as gaps with their reason. Live jitter statistics are taken from a window of the newest intervals,
+the report of a complete run is computed from its recorded time column, so it also covers samples which are only still
+in the run file.
+"""
+
+import collections
+import json
+import numpy
+
+
+class QualityIndex(object):
+    def __init__(self, interval: float, gap_factor: float = 2.0, window: int = 1000):
+        """
+        :param interval: measure interval in seconds
+        :param gap_factor: intervals longer than this many measure intervals are gaps
+        :param window: number of newest intervals live statistics are taken from
+        """
+        self.interval = interval
+        self.gap_factor = gap_factor
+        self._window = collections.deque(maxlen=window)
+        self.reset()
+
+    def reset(self):  # new run
+        self._window.clear()
+        self.previous = None  # timestamp of the previous sample
+        self.samples = 0
+        self.skipped = 0
+        self.gaps = []
+        self.errors = []
+        self._error = None
+
+    def sample(self, timestamp: float, skipped: int = 0):
+        """ Record a sample.
+
+        :param timestamp: runtime of the sample in seconds, as recorded
+        :param skipped: number of deadlines skipped since the previous sample
+        """
+        if self.previous is not None and timestamp > self.previous:  # runtime starts at 0 again with a new run
+            interval = timestamp - self.previous
+            self._window.append(interval)
+            if self._error is not None or interval > self.interval * self.gap_factor:
+                reason = self._error if self._error is not None else "skipped" if skipped else "late"
+                self.gaps.append({"start": self.previous, "end": timestamp, "duration": interval, "reason": reason})
+        self.samples += 1
+        self.skipped += skipped
+        self.previous = timestamp
+        self._error = None
+
+    def error(self, message: str):  # acquisition interrupted, the time until the next sample is a gap for this reason
+        self.errors.append({"time": self.previous, "message": message})
+        self._error = "error: " + message
+
+    def live(self) -> dict:  # jitter statistics of the newest intervals
+        intervals = numpy.fromiter(self._window, dtype=numpy.float64, count=len(self._window))
+        if len(intervals) == 0:
+            return {"interval_mean": 0.0, "jitter": 0.0, "interval_p99": 0.0, "interval_max": 0.0,
+                    "gaps": len(self.gaps), "errors": len(self.errors)}
+        return {"interval_mean": float(intervals.mean()), "jitter": float(intervals.std()),
+                "interval_p99": float(numpy.percentile(intervals, 99)), "interval_max": float(intervals.max()),
+                "gaps": len(self.gaps), "errors": len(self.errors)}
+
+    def report(self, time_column: numpy.ndarray) -> dict:
+        """ Quality summary of a run from its recorded time column, gaps keep the reason recorded while measuring.
+
+        :return: dict with mean rate, interval statistics, list of gaps and list of errors
+        """
+        intervals = numpy.diff(numpy.asarray(time_column, dtype=numpy.float64))
+        starts = numpy.asarray(time_column[:-1], dtype=numpy.float64)
+        valid = intervals > 0
+        intervals, starts = intervals[valid], starts[valid]
+        report = {"samples": len(time_column), "measure_interval": self.interval, "duration": float(intervals.sum()),
+                  "mean_rate": 0.0, "interval_mean": 0.0, "interval_p50": 0.0, "interval_p99": 0.0, "interval_max": 0.0,
+                  "jitter": 0.0, "skipped": self.skipped, "gaps": [], "errors": list(self.errors)}
+        if len(intervals) == 0:
+            return report
+
+        report.update(mean_rate=float(len(intervals) / intervals.sum()), interval_mean=float(intervals.mean()),
+                      interval_p50=float(numpy.percentile(intervals, 50)), interval_p99=float(numpy.percentile(intervals, 99)),
+                      interval_max=float(intervals.max()), jitter=float(intervals.std()))
+        reasons = {gap["start"]: gap["reason"] for gap in self.gaps}
+        gap = intervals > self.interval * self.gap_factor
+        report["gaps"] = [{"start": float(start), "end": float(start + interval), "duration": float(interval),
+                           "reason": reasons.get(float(start), "late")} for start, interval in zip(starts[gap], intervals[gap])]
+        return report
+
+
+def write_report(path: str, report: dict):  # quality report next to an exported file
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+
+
+def report_path(path: str) -> str:  # run.csv -> run.quality.json
+    base = path[:-4] if path.endswith(".csv") else path
+    return base + ".quality.json"
@@ -0,0 +1,114 @@
+"""
+Recording of runs to disk.
+
+Every sample is appended to a memory-mapped binary file per run, so the history of a run is not limited by memory
+and survives a crash of the app. The file consists of a fixed size header followed by fixed size records:
+
+    header: magic(8s) header_size(u4) record_size(u4) count(u8) start_time(f8) padding
+    record: time(f8) voltage(f4) current(f4) power(f4)
+
+The count in the header is updated on every flush, after a crash the file is readable up to the last flushed sample.
+"""
+
+import datetime
+import mmap
+import os
+import struct
+import threading
+import time
+import numpy
+
+MAGIC = b"KELRUN1\0"
+HEADER = struct.Struct("<8sIIQd")
+HEADER_SIZE = 64
+RECORD = struct.Struct("<dfff")
+RECORD_DTYPE = numpy.dtype([("time", "<f8"), ("voltage", "<f4"), ("current", "<f4"), ("power", "<f4")])
+
+
+def new_run_path(directory: str = "runs") -> str:
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, datetime.datetime.now().strftime("run-%Y%m%d-%H%M%S-%f.kelrun"))
+
+
+class RunRecorder(object):
+    def __init__(self, path: str, chunk_records: int = 65536, flush_interval: float = 1.0):
+        self.path = path
+        self.chunk_records = chunk_records
+        self.flush_interval = flush_interval
+        self.start_time = time.time()
+        self.count = 0
+        self.closed = False
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+        self._file = open(path, "w+b")
+        self._capacity = chunk_records
+        self._file.truncate(HEADER_SIZE + self._capacity * RECORD.size)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        self._write_header()
+
+    def __len__(self):
+        return self.count
+
+    def _write_header(self):
+        HEADER.pack_into(self._mmap, 0, MAGIC, HEADER_SIZE, RECORD.size, self.count, self.start_time)
+
+    def _grow(self):  # file is extended chunk wise and mapped again, since not every platform can resize a mapping
+        self._mmap.flush()
+        self._mmap.close()
+        self._capacity += self.chunk_records
+        self._file.truncate(HEADER_SIZE + self._capacity * RECORD.size)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+    def append(self, timestamp: float, voltage: float, current: float, power: float):
+        with self._lock:
+            if self.closed:
+                return
+            if self.count == self._capacity:
+                self._grow()
+            RECORD.pack_into(self._mmap, HEADER_SIZE + self.count * RECORD.size, timestamp, voltage, current, power)
+            self.count += 1
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def _flush(self):
+        self._write_header()
+        self._mmap.flush()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            if not self.closed:
+                self._flush()
+
+    def read(self, start: int = 0, stop: int = None) -> numpy.ndarray:
+        """ Page records from the file.
+
+        :return: copy of records start to stop as structured array with fields of RECORD_DTYPE
+        """
+        with self._lock:
+            stop = self.count if stop is None else min(stop, self.count)
+            start = min(max(start, 0), stop)
+            if self.closed:
+                return read_run(self.path)[start:stop]
+            return numpy.frombuffer(self._mmap, RECORD_DTYPE, stop - start, HEADER_SIZE + start * RECORD.size).copy()
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self._flush()
+            self._mmap.close()
+            self._file.truncate(HEADER_SIZE + self.count * RECORD.size)  # remove unused preallocated space
+            self._file.close()
+            self.closed = True
+
+
+def read_run(path: str) -> numpy.ndarray:
+    """ Read all records of a run file, including files of crashed runs that were not closed properly. """
+    with open(path, "rb") as file:
+        magic, header_size, record_size, count, start_time = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or record_size != RECORD_DTYPE.itemsize:
+            raise ValueError("Not a run file: " + path)
+        available = (os.path.getsize(path) - header_size) // record_size
+        return numpy.fromfile(file, RECORD_DTYPE, min(count, available), offset=header_size - HEADER.size)
@@ -0,0 +1,109 @@
+"""
+Columnar storage of recorded samples.
+
+All channels share one float64 time column, values are stored in their own columns(float32 by default). Columns are
+preallocated NumPy buffers which grow by doubling, so appending is amortized O(1) and reading gives views without copying.
+
+With max_length set the store only keeps a window of the newest samples in memory, once full the oldest quarter is
+dropped(the complete run is kept on disk by the recorder). Dropping moves data within the buffers, so views taken before
+are only valid until the next append.
+"""
+
+import numpy
+
+CHANNELS = ("voltage", "current", "power")
+
+
+class SampleStore(object):
+    def __init__(self, initial_capacity: int = 4096, value_dtype=numpy.float32, max_length: int = None):
+        self.value_dtype = numpy.dtype(value_dtype)
+        self.max_length = max_length
+        self.offset = 0  # number of samples dropped from the start of the window
+        self._length = 0
+        if max_length is not None:
+            initial_capacity = min(initial_capacity, max_length)
+        self._time = numpy.empty(initial_capacity, dtype=numpy.float64)
+        self._values = {name: numpy.empty(initial_capacity, dtype=self.value_dtype) for name in CHANNELS}
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def capacity(self):
+        return self._time.shape[0]
+
+    def append(self, timestamp: float, voltage: float, current: float, power: float):
+        if self._length == self.capacity:
+            if self.max_length is not None and self.capacity >= self.max_length:
+                self._drop(self._length - self.max_length * 3 // 4)
+            else:
+                self._grow(self.capacity * 2 if self.max_length is None else min(self.capacity * 2, self.max_length))
+        n = self._length
+        self._time[n] = timestamp
+        self._values["voltage"][n] = voltage
+        self._values["current"][n] = current
+        self._values["power"][n] = power
+        self._length = n + 1  # only set after values are written, so readers never see a partial sample
+
+    def _grow(self, capacity: int):
+        n = self._length
+        time = numpy.empty(capacity, dtype=numpy.float64)
+        time[:n] = self._time[:n]
+        values = {}
+        for name, column in self._values.items():
+            values[name] = numpy.empty(capacity, dtype=self.value_dtype)
+            values[name][:n] = column[:n]
+        self._values = values
+        self._time = time
+
+    def _drop(self, count: int):  # drop oldest samples by moving the newest to the start of the buffers
+        keep = self._length - count
+        self._time[:keep] = self._time[count:self._length]
+        for column in self._values.values():
+            column[:keep] = column[count:self._length]
+        self._length = keep
+        self.offset += count
+
+    def clear(self):
+        self._length = 0
+        self.offset = 0
+
+    @property
+    def total_length(self):  # number of samples since last clear, including dropped ones
+        return self.offset + self._length
+
+    # Views of the valid part of each column, these share memory with the store and stay valid after it grows
+    @property
+    def time(self) -> numpy.ndarray:
+        return self._time[:self._length]
+
+    @property
+    def voltage(self) -> numpy.ndarray:
+        return self._values["voltage"][:self._length]
+
+    @property
+    def current(self) -> numpy.ndarray:
+        return self._values["current"][:self._length]
+
+    @property
+    def power(self) -> numpy.ndarray:
+        return self._values["power"][:self._length]
+
+    def column(self, name: str) -> numpy.ndarray:
+        return self.time if name == "time" else self._values[name][:self._length]
+
+    def view(self) -> dict:  # consistent views of all columns with the same length
+        n = self._length
+        columns = {"time": self._time[:n]}
+        for name, column in self._values.items():
+            columns[name] = column[:n]
+
+        return columns
+
+    @property
+    def nbytes(self) -> int:  # allocated memory of all columns
+        return self._time.nbytes + sum(column.nbytes for column in self._values.values())
+
+    @property
+    def bytes_per_sample(self) -> int:
+        return self._time.itemsize + len(self._values) * self.value_dtype.itemsize
@@ -0,0 +1,110 @@
+"""
+Scheduling of all access to the serial connection of a load.
+
+A single thread owns the serial connection and executes submitted commands one after another from a priority queue,
+so commands from the user interface preempt queued background polling instead of waiting for a flag to be released.
+Results are returned through futures(or callbacks added to them), which coroutines can await with run(), so the asyncio
+event loop(in the app the Qt event loop through QtAsyncio) keeps running while the serial thread is busy.
+"""
+
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+PRIORITY_USER = 0  # commands triggered by user
+PRIORITY_POLL = 10  # background polling of values
+
+
+class WaitStats(object):  # wait time statistics for commands of one priority
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, wait: float):
+        self.count += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+        self.last = wait
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class SerialScheduler(object):
+    def __init__(self, name="serial"):
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()  # keeps FIFO order for same priority
+        self._lock = threading.Lock()
+        self.max_depth = 0
+        self.wait_stats = {PRIORITY_USER: WaitStats(), PRIORITY_POLL: WaitStats()}
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, priority: int = PRIORITY_USER, callback=None) -> Future:
+        """ Queue fn(*args) for execution on the serial thread.
+
+        :param callback: optional callable getting the finished future, called on the serial thread
+        :return: future for the result of fn
+        """
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        self._queue.put((priority, next(self._sequence), time.perf_counter(), fn, args, future))
+        with self._lock:
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+
+        return future
+
+    def call(self, fn, *args, priority: int = PRIORITY_USER):
+        """ Execute fn(*args) on the serial thread and wait for the result, exceptions are raised in the caller. """
+        if threading.current_thread() is self._thread:  # already on serial thread, waiting for itself would deadlock
+            return fn(*args)
+
+        return self.submit(fn, *args, priority=priority).result()
+
+    async def run(self, fn, *args, priority: int = PRIORITY_USER):
+        """ Execute fn(*args) on the serial thread and await the result, exceptions are raised in the awaiting coroutine.
+        Cancelling the awaiting task drops the command if it did not start yet. """
+        return await asyncio.wrap_future(self.submit(fn, *args, priority=priority))
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = {"depth": self.depth, "max_depth": self.max_depth}
+            for priority, name in ((PRIORITY_USER, "user"), (PRIORITY_POLL, "poll")):
+                stats = self.wait_stats[priority]
+                metrics[name + "_count"] = stats.count
+                metrics[name + "_wait_mean"] = stats.mean
+                metrics[name + "_wait_max"] = stats.max
+                metrics[name + "_wait_last"] = stats.last
+
+        return metrics
+
+    def stop(self, timeout: float = 1.0):
+        self._queue.put((PRIORITY_USER - 1, next(self._sequence), 0.0, None, (), None))
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            priority, _, queued, fn, args, future = self._queue.get()
+            if fn is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self._lock:
+                self.wait_stats.setdefault(priority, WaitStats()).add(time.perf_counter() - queued)
+            try:
+                result = fn(*args)
+            except BaseException as ex:
+                future.set_exception(ex)
+            else:
+                future.set_result(result)
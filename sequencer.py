@@ -0,0 +1,203 @@
+"""
+Host driven setpoint sequences.
+
+List mode of the load is limited to the 7 slots with at most 84 steps it stores and its dynamic modes to a few fixed
+shapes. A Sequencer plays sequences of any length by sending the setpoint(current, voltage, resistance or power) of
+each step from the host instead, list programs as well as waveforms(see waveform.py). Steps are due on a fixed grid of deadlines
+(start plus the durations of all previous steps), so timing errors of single steps do not add up over the sequence. The
+sequence waits for the deadline of each step on the event loop and only then queues the write on the serial scheduler
+with user priority, so the serial thread is never held up waiting and a step is delayed by at most the command or
+acquisition tick running at its deadline. If a step is so late that the deadline of the next one passed as well, the
+steps in between are skipped and counted instead of being sent in a burst.
+
+Deadlines use the clock measurement frames are stamped with and are kept relative to the origin of the recorded
+runtime(RunTracker.start_timestamp), so every step lies on the time axis of the samples and each sample can be mapped
+to the step that was active when it was measured.
+
+The slope of a step is kept for compatibility with list files, but only the list mode of the load ramps(in A/us, far
+faster than setpoints can be sent), host steps are applied as jumps.
+"""
+
+import asyncio
+import csv
+import numpy
+from kelctl import *
+from acquisition import clock, raw_serial
+
+COMMANDS = {Mode.constant_current: ":CURR {0:5.4f}A", Mode.constant_voltage: ":VOLT {0:5.4f}V",
+            Mode.constant_resistance: ":RES {0:5.4f}OHM", Mode.constant_power: ":POW {0:5.4f}W"}
+LIMITS = {Mode.constant_current: "current_limit", Mode.constant_voltage: "voltage_limit",
+          Mode.constant_resistance: "resistance_limit", Mode.constant_power: "power_limit"}  # limit of setpoints by mode
+CANCEL_CHECK = 0.1  # longest wait before checking for cancellation
+
+
+def read_program(path: str) -> list:
+    """ Steps from a CSV file with current(A), slope(A/us) and duration(s) per row.
+
+    A header row and lines starting with # are ignored.
+    """
+    steps = []
+    with open(path, newline="") as file:
+        reader = csv.reader(file)
+        for row in reader:
+            if not row or row[0].strip().startswith("#"):
+                continue
+            try:
+                steps.append(ListStep(*row[:3]))
+            except (ValueError, TypeError):
+                if steps:  # only the first row may be a header
+                    raise ValueError("Invalid step in line {0} of {1}".format(reader.line_num, path))
+    return steps
+
+
+def send_setpoint(load: KELSerial, command: str, value: float) -> float:
+    """ Send a setpoint, runs on the serial thread.
+
+    Written to the port directly, the setters of KELSerial read the limit before every setpoint and sleep after sending.
+
+    :param command: format of the setpoint command, see COMMANDS
+
+    :return: time the setpoint was sent
+    """
+    kel_serial = raw_serial(load)
+    command = command.format(value)
+    if kel_serial.debug:
+        print("_send: ", command)
+    kel_serial.port.write((command + "\n").encode('ascii'))
+    return clock()
+
+
+class Sequencer(object):
+    def __init__(self, values, durations, loops: int = 1, mode: Mode = Mode.constant_current):
+        """
+        :param values: setpoint of each step
+        :param durations: duration of each step in seconds
+        :param loops: number of times the steps are played
+        :param mode: mode the setpoints are for, one of COMMANDS
+        """
+        self.mode = mode
+        self.loops = loops
+        self.values = numpy.tile(numpy.asarray(values, dtype=numpy.float64), loops)
+        durations = numpy.tile(numpy.asarray(durations, dtype=numpy.float64), loops)
+        self.offsets = numpy.concatenate(([0.0], numpy.cumsum(durations)))  # start of each step and end of the last one
+        self.start = 0.0  # start of the first step, in runtime of the recorded samples
+        self.sent = numpy.full(len(self), numpy.nan)  # runtime each step was sent at, NaN if not sent
+        self.skipped = 0
+        self.cancelled = False
+
+    def __len__(self):  # number of steps including loops
+        return self.values.shape[0]
+
+    @property
+    def duration(self) -> float:
+        return float(self.offsets[-1])
+
+    @property
+    def planned(self) -> numpy.ndarray:  # runtime each step is due at
+        return self.start + self.offsets[:-1]
+
+    def validate(self, limit: float):  # limit of the mode, see LIMITS
+        if len(self) == 0:
+            raise ValueError("Sequence has no steps")
+        if numpy.any(numpy.diff(self.offsets) <= 0):
+            raise ValueError("Duration of every step has to be positive")
+        if numpy.any(self.values < 0):
+            raise ValueError("Setpoints can not be negative")
+        highest = float(self.values.max())
+        if highest > limit:
+            raise ValueOutOfLimitError(highest, limit, "setpoint of a step is above limit")
+
+    async def run(self, scheduler, load: KELSerial, origin: float = None, start: float = None, progress=None,
+                  cancelled=None):
+        """ Play the sequence, setpoints are sent through the scheduler of the load.
+
+        :param origin: clock time runtime of the recorded samples starts at, default is the start of the sequence
+        :param start: clock time of the first step, default is right away
+        :param progress: optional callable getting the number of steps done and the number of steps
+        :param cancelled: optional callable, the sequence stops once it returns True
+        """
+        now = clock()
+        start = now if start is None else start
+        origin = start if origin is None else origin
+        self.start = start - origin
+        self.sent[:] = numpy.nan
+        self.skipped = 0
+        self.cancelled = False
+
+        index = 0
+        while index < len(self):
+            if now >= start + self.offsets[index + 1]:  # step is over already, continue with the one due now
+                due = min(int(numpy.searchsorted(self.offsets, now - start, side="right")) - 1, len(self))
+                self.skipped += due - index
+                index = due
+                continue
+            if not await self._wait(start + self.offsets[index], cancelled):
+                break
+            sent = await scheduler.run(send_setpoint, load, COMMANDS[self.mode], float(self.values[index]))
+            self.sent[index] = sent - origin
+            index += 1
+            if progress is not None:
+                progress(index, len(self))
+            now = clock()
+        if index == len(self):
+            await self._wait(start + self.duration, cancelled)  # last step lasts for its duration as well
+
+    async def _wait(self, until: float, cancelled) -> bool:  # False if cancelled while waiting
+        while True:
+            if cancelled is not None and cancelled():
+                self.cancelled = True
+                return False
+            remaining = until - clock()
+            if remaining <= 0:
+                return True
+            await asyncio.sleep(min(remaining, CANCEL_CHECK))
+
+    def step_index(self, time_column: numpy.ndarray) -> numpy.ndarray:  # step active at each sample, -1 before first
+        index = numpy.searchsorted(self.planned, numpy.asarray(time_column, dtype=numpy.float64), side="right") - 1
+        index[numpy.asarray(time_column) >= self.start + self.duration] = -1  # after end of the last step
+        return index
+
+    def step_table(self, time_column: numpy.ndarray = None) -> dict:
+        """ Timing of each step, with samples per step if the time column of the recorded run is given.
+
+        :return: dict of columns step, setpoint, planned, sent, lateness(all times as runtime in seconds) and samples
+        """
+        lateness = self.sent - self.planned
+        table = {"step": numpy.arange(len(self)), "setpoint": self.values, "planned": self.planned, "sent": self.sent,
+                 "lateness": lateness}
+        if time_column is not None:
+            index = self.step_index(time_column)
+            table["samples"] = numpy.bincount(index[index >= 0], minlength=len(self))
+        return table
+
+    def report(self) -> dict:  # timing accuracy of the steps sent, achieved compared to requested
+        sent = ~numpy.isnan(self.sent)
+        lateness = (self.sent - self.planned)[sent]
+        report = {"steps": len(self), "sent": int(lateness.shape[0]), "skipped": self.skipped,
+                  "cancelled": self.cancelled, "lateness_mean": 0.0, "lateness_p99": 0.0, "lateness_max": 0.0,
+                  "interval_requested": 0.0, "interval_achieved": 0.0, "interval_error_max": 0.0}
+        if lateness.shape[0] > 0:
+            report.update(lateness_mean=float(lateness.mean()), lateness_p99=float(numpy.percentile(lateness, 99)),
+                          lateness_max=float(lateness.max()))
+        consecutive = sent[1:] & sent[:-1]  # intervals between steps which were both sent
+        if numpy.any(consecutive):
+            requested = numpy.diff(self.planned)[consecutive]
+            achieved = numpy.diff(self.sent)[consecutive]
+            report.update(interval_requested=float(requested.mean()), interval_achieved=float(achieved.mean()),
+                          interval_error_max=float(numpy.abs(achieved - requested).max()))
+        return report
+
+
+def list_sequence(steps: list, loops: int = 1) -> Sequencer:  # sequence of a list program, steps are ListStep
+    return Sequencer([step.current for step in steps], [step.duration for step in steps], loops)
+
+
+def write_step_table(path: str, table: dict):  # timing of each step as CSV
+    names = list(table)
+    numpy.savetxt(path, numpy.column_stack([table[name] for name in names]), delimiter=",", header=",".join(names),
+                  comments="", fmt=["%d" if name in ("step", "samples") else "%.6f" for name in names])
+
+
+def step_table_path(path: str) -> str:  # profile.csv -> profile.steps.csv
+    base = path[:-4] if path.endswith(".csv") else path
+    return base + ".steps.csv"
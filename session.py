@@ -0,0 +1,64 @@
+"""
+Binary session files.
+
+A session stores all channels of a run as columns in a NumPy NPZ container together with metadata about the device and
+app settings(as JSON), which is much faster to write and read than CSV and keeps full precision.
+
+Sessions(and run files from the recorder) can be converted to CSV from the command line:
+
+    python session.py run.npz run.csv
+"""
+
+import argparse
+import json
+import numpy
+from export import write_csv
+from recorder import read_run, MAGIC
+
+SESSION_VERSION = 1
+COLUMNS = ("time", "voltage", "current", "power")
+
+
+def save_session(path: str, columns: dict, metadata: dict):
+    """ Save columns(as returned by SampleStore.view()) and metadata to an NPZ session file. """
+    metadata = dict(metadata, version=SESSION_VERSION)
+    arrays = {name: numpy.asarray(columns[name]) for name in COLUMNS}
+    with open(path, "wb") as file:  # file object, otherwise numpy would append .npz to other file names
+        numpy.savez(file, metadata=numpy.array(json.dumps(metadata)), **arrays)
+
+
+def load_session(path: str):
+    """ Load a session file.
+
+    :return: tuple of dict of columns and dict of metadata
+    """
+    with numpy.load(path, allow_pickle=False) as data:
+        metadata = json.loads(str(data["metadata"]))
+        if metadata.get("version", 0) > SESSION_VERSION:
+            raise ValueError("Session file was created by a newer version")
+        columns = {name: data[name] for name in COLUMNS}
+
+    return columns, metadata
+
+
+def load_columns(path: str) -> dict:  # columns from either a session or a run file(detected by content, not file name)
+    with open(path, "rb") as file:
+        is_run = file.read(len(MAGIC)) == MAGIC
+    if is_run:
+        records = read_run(path)
+        return {name: records[name] for name in COLUMNS}
+    return load_session(path)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a KELgui session(.npz) or run file(.kelrun) to CSV")
+    parser.add_argument("input", help="session or run file")
+    parser.add_argument("output", help="CSV file to write")
+    args = parser.parse_args()
+
+    rows = write_csv(args.output, load_columns(args.input))
+    print("Wrote {0} rows to {1}".format(rows, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+"""
+Simulated KEL103 for testing and benchmarking without hardware.
+
+SimulatedKEL103 answers the commands KELSerial uses(measurements, modes and set values, input, limits, system settings,
+battery/list/OCP/OPP save slots, dynamic modes and memories) with the same response format as the device. The load is
+connected to a simulated battery with internal resistance, which discharges while the input is on.
+
+The device is reachable in two ways:
+ - in-process: SimulatedPort replaces the pyserial port of a KELSerial(see simulated_load), no OS support needed
+ - pseudo-terminal: PtyServer serves the device on a pty(Linux/macOS), which can be opened like any serial port
+
+Both add the timing of a serial line(10 bits per byte at the set baudrate) and a per-command latency of the device.
+Run ``python simulator.py`` to serve a simulated load on a pty until stopped with Ctrl+C.
+"""
+
+import argparse
+import collections
+import math
+import os
+import random
+import threading
+import time
+from kelctl import *
+from acquisition import raw_serial
+
+SIMULATED_PORT = "simulated"  # port name for the in-process simulated load
+DEFAULT_MODEL = "KORAD-KEL103 V3.30 SN:SIM00001"
+DEFAULT_SYSTEM = {"BEEP": "ON", "LOCK": "OFF", "EXIT": "OFF", "COMP": "OFF", "DHCP": "0", "IPAD": "192.168.1.198",
+                  "SMASK": "255.255.255.0", "GATE": "192.168.1.1", "MAC": "70-2f-eb-48-4d-56", "PORT": "18190",
+                  "BAUD": "115200"}
+DYNAMIC_MODES = {1: Mode.dynamic_cv, 2: Mode.dynamic_cc, 3: Mode.dynamic_cr, 4: Mode.dynamic_cw, 5: Mode.dynamic_pulse,
+                 6: Mode.dynamic_toggle}
+SLOT_MODES = {"LIST": Mode.LIST, "OCP": Mode.OCP, "OPP": Mode.OPP, "BATT": Mode.battery}
+
+
+def parse_number(value: str) -> float:  # strip unit of a value like 1.0000A or 2.5000A/uS
+    return float(value.strip().rstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz/%"))
+
+
+class SimulatedKEL103(object):
+    def __init__(self, model: str = DEFAULT_MODEL, source_voltage: float = 12.6, internal_resistance: float = 0.05,
+                 capacity: float = 10.0, noise: float = 0.001, latency: float = 0.002, time_scale: float = 1.0,
+                 seed: int = None):
+        """
+        :param source_voltage: open circuit voltage of the simulated battery when full, drops by a quarter when empty
+        :param internal_resistance: internal resistance of the battery in ohm
+        :param capacity: capacity of the battery in Ah
+        :param noise: standard deviation of measurement noise, relative to the value
+        :param latency: time in seconds the device takes to answer a command
+        :param time_scale: factor for simulated time, >1 to speed up discharging
+        """
+        self.model = model
+        self.source_voltage = source_voltage
+        self.internal_resistance = internal_resistance
+        self.capacity = capacity
+        self.noise = noise
+        self.latency = latency
+        self.time_scale = time_scale
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.drawn = 0.0  # Ah drawn from battery
+        self.factory_reset()
+
+    def factory_reset(self):
+        self.mode = Mode.constant_current
+        self.input_on = False
+        self.set_values = {"CURR": 1.0, "VOLT": 5.0, "RES": 10.0, "POW": 10.0}
+        self.limits = {"CURR": 30.0, "VOLT": 120.0, "RES": 7500.0, "POW": 300.0}
+        self.system = dict(DEFAULT_SYSTEM)
+        self.slots = {name: {} for name in SLOT_MODES}  # saved lists as their parameter string without slot number
+        self.recalled = {name: None for name in SLOT_MODES}
+        self.dynamic = "2,0.1000A/uS,0.1000A/uS,1.0000A,2.0000A,1.0000HZ,50.0000%"
+        self.memories = {}
+        self.batt_time = 0.0  # minutes
+        self.batt_cap = 0.0  # Ah
+        self.input_time = 0.0  # seconds since input was switched on
+        self._last_update = time.monotonic()
+
+    # Electrical model
+    def open_circuit_voltage(self) -> float:
+        return self.source_voltage * (1 - 0.25 * min(self.drawn / self.capacity, 1.0))
+
+    def _list_current(self) -> float:  # current of the list step active at input_time
+        parameters = self.slots["LIST"].get(self.recalled["LIST"])
+        if parameters is None:
+            return 0.0
+        values = parameters.split(",")
+        steps = [(parse_number(values[i]), parse_number(values[i + 2])) for i in range(2, len(values) - 3, 3)]
+        period = sum(duration for _, duration in steps)
+        if not steps or period <= 0 or self.input_time >= period * int(values[-1]):
+            return 0.0
+        position = self.input_time % period
+        for current, duration in steps:
+            if position < duration:
+                return current
+            position -= duration
+        return steps[-1][0]
+
+    def operating_point(self):
+        """ Voltage and current at the input without measurement noise. """
+        source, resistance = self.open_circuit_voltage(), self.internal_resistance
+        if not self.input_on:
+            return source, 0.0
+        max_current = min(self.limits["CURR"], source / resistance)
+        match self.mode:
+            case Mode.constant_voltage:
+                current = max((source - self.set_values["VOLT"]) / resistance, 0.0)
+            case Mode.constant_resistance:
+                current = source / (self.set_values["RES"] + resistance)
+            case Mode.constant_power:
+                discriminant = source * source - 4 * resistance * self.set_values["POW"]
+                current = (source - math.sqrt(max(discriminant, 0.0))) / (2 * resistance)
+            case Mode.short:
+                current = max_current
+            case Mode.battery:
+                batt = self.slots["BATT"].get(self.recalled["BATT"])
+                current = parse_number(batt.split(",")[1]) if batt else 0.0
+            case Mode.LIST:
+                current = self._list_current()
+            case _:  # OCP/OPP and dynamic modes are approximated by their set current
+                current = self.set_values["CURR"]
+        current = min(current, max_current)
+
+        return source - current * resistance, current
+
+    def _advance(self):  # integrate discharge since last command
+        now = time.monotonic()
+        elapsed = (now - self._last_update) * self.time_scale
+        self._last_update = now
+        if not self.input_on or elapsed <= 0:
+            return
+        voltage, current = self.operating_point()
+        self.input_time += elapsed
+        self.drawn += current * elapsed / 3600
+        if self.mode == Mode.battery:
+            self.batt_time += elapsed / 60
+            self.batt_cap += current * elapsed / 3600
+            batt = self.slots["BATT"].get(self.recalled["BATT"])
+            if batt:
+                _, _, cutoff_voltage, cutoff_capacity, cutoff_time = [parse_number(v) for v in batt.split(",")]
+                if voltage <= cutoff_voltage or 0 < cutoff_capacity <= self.batt_cap or 0 < cutoff_time <= self.batt_time:
+                    self.input_on = False
+
+    def _measure(self, value: float) -> float:
+        return value * (1 + self.random.gauss(0, self.noise)) if self.noise else value
+
+    # Command handling
+    def handle(self, command: str):
+        """ Execute one command line.
+
+        :return: response line without line ending, None for commands without response(and unknown commands, which
+            the device does not answer either)
+        """
+        with self._lock:
+            self._advance()
+            head, _, argument = command.strip().partition(" ")
+            head = head.upper()
+            if head.endswith("?"):
+                return self._query(head)
+            self._set(head, argument.strip())
+            return None
+
+    def _query(self, head: str):
+        if head in (":MEAS:VOLT?", ":MEAS:CURR?", ":MEAS:POW?"):
+            voltage, current = self.operating_point()
+            voltage, current = self._measure(voltage), self._measure(current) if current else 0.0
+            return {":MEAS:VOLT?": "{0:.4f}V".format(voltage), ":MEAS:CURR?": "{0:.4f}A".format(current),
+                    ":MEAS:POW?": "{0:.4f}W".format(voltage * current)}[head]
+        units = {"CURR": "A", "VOLT": "V", "RES": "OHM", "POW": "W"}
+        name = head[1:-1]
+        if name in units:
+            return "{0:.4f}{1}".format(self.set_values[name], units[name])
+        if name.endswith(":UPP") and name[:-4] in units:
+            return "{0:.4f}{1}".format(self.limits[name[:-4]], units[name[:-4]])
+        if name.startswith("SYST:") and name[5:] in self.system:
+            return self.system[name[5:]]
+        if name.startswith("RCL:") and name[4:] in SLOT_MODES:
+            slot = name[4:]
+            return self.slots[slot].get(self.recalled[slot], "")
+        match head:
+            case "*IDN?":
+                return self.model
+            case ":FUNC?":
+                return self.mode.value
+            case ":INP?":
+                return "ON" if self.input_on else "OFF"
+            case ":BATT:TIM?":
+                return "{0:.4f}M".format(self.batt_time)
+            case ":BATT:CAP?":
+                return "{0:.4f}AH".format(self.batt_cap)
+            case ":DYN?":
+                return self.dynamic
+            case ":STAT?":
+                baudrate = BaudRate(int(self.system["BAUD"]))
+                flags = [OnOffState(self.system[name]).a for name in ("BEEP", "LOCK", "EXIT")]
+                return "{0},{1},{2},{3},0,0".format(flags[0], baudrate.a, flags[1], flags[2])
+            case ":SYST:DEVINFO?":
+                return "\n".join(("DHCP:" + self.system["DHCP"], "IP:" + self.system["IPAD"],
+                                  "NETMASK:" + self.system["SMASK"], "GateWay:" + self.system["GATE"],
+                                  "MAC:" + self.system["MAC"], "PORT:" + self.system["PORT"],
+                                  "BAUDRATE:" + self.system["BAUD"]))
+        return None
+
+    def _set(self, head: str, argument: str):
+        name = head[1:]
+        if name in self.set_values:
+            self.set_values[name] = min(parse_number(argument), self.limits[name])
+        elif name.endswith(":UPP") and name[:-4] in self.limits:
+            self.limits[name[:-4]] = parse_number(argument)
+        elif name.startswith("SYST:") and name[5:] in self.system:
+            self.system[name[5:]] = argument
+        elif name in SLOT_MODES:  # save list to slot, e.g. :BATT 1,<parameters>
+            slot, _, parameters = argument.partition(",")
+            self.slots[name][int(slot)] = parameters
+        elif name.startswith("RCL:") and name[4:] in SLOT_MODES:
+            self.recalled[name[4:]] = int(argument)
+            self.mode = SLOT_MODES[name[4:]]
+        elif head == ":FUNC":
+            self.mode = Mode(argument)
+        elif head == ":INP":
+            self._switch_input(OnOffState(argument) == OnOffState.on)
+        elif head == ":DYN":
+            self.dynamic = argument
+            self.mode = DYNAMIC_MODES[int(argument.split(",")[0])]
+        elif head == "*SAV":
+            self.memories[int(argument)] = (self.mode, dict(self.set_values))
+        elif head == "*RCL" and int(argument) in self.memories:
+            mode, values = self.memories[int(argument)]
+            self.mode, self.set_values = mode, dict(values)
+        elif head == ":SYST:FACTRESET":
+            self.factory_reset()
+
+    def _switch_input(self, on: bool):
+        if on and not self.input_on:
+            self.input_time = 0.0
+            if self.mode == Mode.battery:
+                self.batt_time = 0.0
+                self.batt_cap = 0.0
+        self.input_on = on
+
+
+class SerialLine(object):  # timing of responses on a serial line at given baudrate
+    def __init__(self, device: SimulatedKEL103, baudrate: int):
+        self.device = device
+        self.byte_time = 10 / baudrate
+        self.line_free = 0.0  # time the device is done sending the previous response
+
+    def respond(self, line: str, received: float):
+        """ Let device handle a received line.
+
+        :return: tuple of time the response is completely sent and the response, None if there is no response
+        """
+        response = self.device.handle(line)
+        if response is None:
+            return None
+        response = (response + "\n").encode('ascii')
+        start = max(received + self.device.latency, self.line_free)
+        self.line_free = start + len(response) * self.byte_time
+        return self.line_free, response
+
+
+class SimulatedPort(object):  # in-process replacement of the pyserial port of a KELSerial
+    def __init__(self, device: SimulatedKEL103, baudrate: int = 115200, timeout: float = 1):
+        self.line = SerialLine(device, baudrate)
+        self.timeout = timeout
+        self.is_open = True
+        self.pending = collections.deque()  # lines of responses with time they are completely received
+
+    def write(self, data: bytes):
+        received = time.perf_counter()
+        for line in data.decode('ascii').split("\n")[:-1]:
+            received += (len(line) + 1) * self.line.byte_time
+            response = self.line.respond(line, received)
+            if response is not None:
+                ready, text = response
+                for part in text.splitlines(keepends=True):
+                    self.pending.append((ready, part))
+        return len(data)
+
+    def readline(self):
+        if not self.pending:
+            time.sleep(self.timeout)
+            return b""
+        ready, response = self.pending.popleft()
+        delay = ready - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return response
+
+    def reset_input_buffer(self):
+        self.pending.clear()
+
+    def isOpen(self):
+        return self.is_open
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+
+def simulated_load(device: SimulatedKEL103 = None, baudrate: BaudRate = BaudRate.R115200, debug: bool = False,
+                   send_sleep_time: float = 0.1) -> KELSerial:
+    load = KELSerial(None, baudrate, debug, send_sleep_time)
+    raw_serial(load).port = SimulatedPort(device if device is not None else SimulatedKEL103(), baudrate.b)
+    return load
+
+
+def open_load(port: str, baudrate: BaudRate, debug: bool = False) -> KELSerial:  # real load or in-process simulated load
+    if port == SIMULATED_PORT or port.startswith(SIMULATED_PORT + ":"):  # "simulated:2" etc. for several simulated loads
+        return simulated_load(baudrate=baudrate, debug=debug)
+    return KELSerial(port, baudrate, debug)
+
+
+class PtyServer(object):  # serves a simulated device on a pseudo-terminal, only available on Linux/macOS
+    def __init__(self, device: SimulatedKEL103, baudrate: int = 115200):
+        import tty
+        self.line = SerialLine(device, baudrate)
+        self._master, self._slave = os.openpty()  # slave stays open, so the pty survives clients closing it
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="simulator", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        buffer = b""
+        while self._running:
+            try:
+                data = os.read(self._master, 1024)
+            except OSError:
+                break
+            received = time.perf_counter()
+            buffer += data
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                received += (len(line) + 1) * self.line.byte_time
+                response = self.line.respond(line.decode('ascii', 'replace'), received)
+                if response is not None:
+                    ready, text = response
+                    delay = ready - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    os.write(self._master, text)
+
+    def stop(self):
+        self._running = False
+        os.close(self._slave)
+        os.close(self._master)
+
+
+def start_simulated_port(device: SimulatedKEL103 = None) -> str:
+    """ Serve a simulated load on a pty if the platform supports it.
+
+    :return: port name to connect to, SIMULATED_PORT if the load is only available in-process
+    """
+    if not hasattr(os, "openpty"):
+        return SIMULATED_PORT
+    return PtyServer(device if device is not None else SimulatedKEL103()).port
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a simulated KEL103 on a pseudo-terminal")
+    parser.add_argument("--baudrate", type=int, default=115200, help="baudrate used for timing of responses")
+    parser.add_argument("--latency", type=float, default=0.002, help="response time of the device per command in seconds")
+    parser.add_argument("--noise", type=float, default=0.001, help="relative standard deviation of measurements")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="speed up discharging by this factor")
+    args = parser.parse_args()
+
+    server = PtyServer(SimulatedKEL103(noise=args.noise, latency=args.latency, time_scale=args.time_scale), args.baudrate)
+    print("Simulated KEL103 on " + server.port + ", stop with Ctrl+C")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
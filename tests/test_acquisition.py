@@ -0,0 +1,81 @@
+import numpy
+import pytest
+from kelctl import *
+from acquisition import integrate, RunTracker, MeasurementFrame, read_frame, raw_serial
+from simulator import simulated_load, SimulatedKEL103
+
+
+def frame(timestamp: float, current: float = 1.0, power: float = 12.0, on: bool = True) -> MeasurementFrame:
+    return MeasurementFrame(timestamp, Mode.constant_current, 12.0, power, OnOffState.on if on else OnOffState.off, current)
+
+
+def test_integrate_trapezoidal():
+    time_column = numpy.array([0.0, 1800.0, 3600.0])
+    assert integrate(time_column, numpy.array([1.0, 1.0, 1.0])) == pytest.approx(1.0)
+    assert integrate(time_column, numpy.array([0.0, 1.0, 2.0])) == pytest.approx(1.0)
+
+
+def test_integrate_skips_time_going_backwards():  # runtime starts at 0 again with every run
+    time_column = numpy.array([0.0, 3600.0, 0.0, 3600.0])
+    values = numpy.array([1.0, 1.0, 2.0, 2.0], dtype=numpy.float32)
+    assert integrate(time_column, values) == pytest.approx(3.0)
+
+
+def test_integrate_single_sample():
+    assert integrate(numpy.array([5.0]), numpy.array([1.0])) == 0.0
+
+
+def test_run_tracker_matches_integrate():
+    timestamps = numpy.cumsum(numpy.random.default_rng(1).uniform(0.1, 0.9, 200))
+    currents = numpy.random.default_rng(2).uniform(0.0, 5.0, 200)
+    tracker = RunTracker()
+    for timestamp, current in zip(timestamps, currents):
+        tracker.update(frame(timestamp, current, current * 12.0))
+    assert tracker.ah_value == pytest.approx(integrate(timestamps, currents))
+    assert tracker.wh_value == pytest.approx(integrate(timestamps, currents * 12.0))
+    assert tracker.run_time.total_seconds() == pytest.approx(timestamps[-1] - timestamps[0])
+
+
+def test_run_tracker_ignores_time_going_backwards():
+    tracker = RunTracker()
+    for timestamp in (10.0, 11.0, 10.5, 12.0):
+        tracker.update(frame(timestamp))
+    assert tracker.ah_value == pytest.approx(2.5 / 3600)  # 10 s to 11 s and 10.5 s to 12 s
+    assert tracker.run_time.total_seconds() >= 0
+
+
+def test_run_tracker_input_off_ends_run():
+    tracker = RunTracker()
+    assert tracker.update(frame(0.0))
+    assert tracker.update(frame(3600.0))
+    assert not tracker.update(frame(7200.0, on=False))
+    assert not tracker.running
+    assert tracker.update(frame(10800.0))  # run started on the device, off interval is not integrated
+    assert tracker.ah_value == pytest.approx(1.0)
+    assert tracker.run_time.total_seconds() == 0
+
+
+def test_read_frame_from_simulator():
+    device = SimulatedKEL103(noise=0.0, latency=0.0)
+    device.input_on = True
+    load = simulated_load(device)
+    measured = read_frame(load)
+    assert measured.mode == Mode.constant_current
+    assert measured.input_state == OnOffState.on
+    assert measured.current == pytest.approx(1.0)
+    assert measured.power == pytest.approx(measured.voltage * measured.current, rel=1e-3)
+    assert measured.batt_cap is None
+
+
+def test_read_frame_battery_values():
+    device = SimulatedKEL103(noise=0.0, latency=0.0)
+    device.mode = Mode.battery
+    load = simulated_load(device)
+    for battery_hint in (False, True):
+        measured = read_frame(load, battery_hint)
+        assert measured.batt_time is not None and measured.batt_cap is not None
+
+
+def test_raw_serial_fails_clearly_without_wrapper():
+    with pytest.raises(RuntimeError):
+        raw_serial(object())
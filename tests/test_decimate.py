@@ -0,0 +1,43 @@
+import numpy
+from decimate import minmax_envelope, DecimatedColumn
+
+
+def test_envelope_keeps_extremes_in_order():
+    x = numpy.arange(1000, dtype=numpy.float64)
+    y = numpy.zeros(1000, dtype=numpy.float32)
+    y[123], y[124], y[999] = 5.0, -5.0, 7.0
+    plot_x, plot_y = minmax_envelope(x, y, 10)
+    assert len(plot_x) <= 20
+    assert numpy.all(numpy.diff(plot_x) >= 0)  # flat buckets give the same sample as min and max
+    assert {5.0, -5.0, 7.0} <= set(plot_y.tolist())
+
+
+def test_few_samples_are_not_reduced():
+    x, y = numpy.arange(10.0), numpy.arange(10.0)
+    plot_x, plot_y = minmax_envelope(x, y, 10)
+    assert len(plot_x) == 10
+
+
+def test_level_of_detail_matches_direct_decimation():
+    x = numpy.arange(100000) * 0.1
+    y = numpy.sin(x).astype(numpy.float32)
+    column = DecimatedColumn()
+    column.update(x[:50000], y[:50000])
+    column.update(x, y)  # only new blocks are added
+    plot_x, plot_y = column.decimate(x, y, x[0], x[-1], 500)
+    assert len(plot_x) <= 1000
+    assert plot_y.dtype == numpy.float64  # bounds of float32 data overflow in pyqtgraph
+    assert plot_y.max() == numpy.float32(y.max())
+    assert plot_y.min() == numpy.float32(y.min())
+
+
+def test_level_of_detail_rebuilt_after_drop():
+    x = numpy.arange(4096, dtype=numpy.float64)
+    y = numpy.ones(4096, dtype=numpy.float32)
+    column = DecimatedColumn()
+    column.update(x, y)
+    blocks = column.blocks
+    column.update(x[1024:], y[1024:], offset=1024)
+    assert column.offset == 1024
+    assert column.blocks == blocks - 4
+    assert column.lod_x[0] == 1024
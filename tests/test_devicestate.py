@@ -0,0 +1,58 @@
+from kelctl import *
+from devicestate import (settings_diff, describe_diff, normalized, batches, read_values, read_values_pipelined,
+                         DeviceState, SETTINGS, LIMITS)
+from simulator import simulated_load, SimulatedKEL103
+
+CURRENT = {"baudrate": BaudRate.R115200, "beep": OnOffState.on, "lock": OnOffState.off, "trigger": OnOffState.off,
+           "compensation": OnOffState.off, "dhcp": OnOffState.off, "ipaddress": "192.168.1.198",
+           "subnetmask": "255.255.255.0", "gateway": "192.168.1.1", "macaddress": "70-2f-eb-48-4d-56", "port": 18190}
+
+
+def test_unchanged_settings_are_not_sent():
+    wanted = {"baudrate": BaudRate.R115200, "beep": True, "lock": False, "ipaddress": " 192.168.1.198",
+              "macaddress": "70:2F:EB:48:4D:56", "port": "18190"}
+    assert settings_diff(CURRENT, wanted) == {}
+
+
+def test_changed_and_unknown_settings_are_sent():
+    wanted = {"beep": False, "baudrate": BaudRate.R9600, "gateway": "192.168.1.254"}
+    assert settings_diff(CURRENT, wanted) == wanted
+    assert settings_diff({}, {"lock": True}) == {"lock": True}
+
+
+def test_describe_diff_in_write_order():
+    changes = {"baudrate": BaudRate.R9600, "beep": False}
+    assert describe_diff(CURRENT, changes) == ["beep: on -> off", "baudrate: 115200 -> 9600"]
+    assert describe_diff({}, {"lock": True}) == ["lock: ? -> on"]
+
+
+def test_normalized():
+    assert normalized("dhcp", OnOffState.on) is True
+    assert normalized("dhcp", False) is False
+    assert normalized("macaddress", "70-2F-eb-48-4d-56") == "702feb484d56"
+
+
+def test_batches():
+    assert batches(range(7), 3) == [(0, 1, 2), (3, 4, 5), (6,)]
+    assert batches((), 3) == []
+
+
+def test_pipelined_read_matches_single_reads():
+    load = simulated_load(SimulatedKEL103(noise=0.0, latency=0.0), send_sleep_time=0.0)
+    pipelined = {}
+    for batch in batches(SETTINGS + LIMITS):
+        pipelined.update(read_values_pipelined(load, batch))
+    single = read_values(load.settings, SETTINGS + LIMITS)
+    assert settings_diff(single, {name: pipelined[name] for name in SETTINGS}) == {}
+    for name in LIMITS:
+        assert pipelined[name] == single[name]
+
+
+def test_cache_invalidation():
+    state = DeviceState()
+    state.update({"beep": OnOffState.on, "current_limit": 30.0})
+    assert state.missing(("beep", "lock")) == ("lock",)
+    state.invalidate("beep")
+    assert "beep" not in state and state["current_limit"] == 30.0
+    state.invalidate()
+    assert state.missing(("current_limit",)) == ("current_limit",)
@@ -0,0 +1,50 @@
+import numpy
+import pytest
+from export import write_csv, ExportCancelled
+
+
+def columns(rows: int) -> dict:
+    time_column = numpy.arange(rows) * 0.5
+    return {"time": time_column, "voltage": numpy.full(rows, 12.0, dtype=numpy.float32),
+            "current": numpy.arange(rows, dtype=numpy.float32), "power": numpy.arange(rows, dtype=numpy.float32) * 12}
+
+
+def read(path) -> tuple:
+    with open(path) as file:
+        header = file.readline().strip()
+    return header, numpy.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+
+
+def test_chunks_are_merged_into_one_file(tmp_path):
+    path = tmp_path / "all.csv"
+    data = columns(25)
+    progress = []
+    assert write_csv(str(path), data, chunk_rows=10, progress=progress.append) == 25
+    header, table = read(path)
+    assert header == "Time,Voltage,Current,Power"
+    assert progress == [10, 20, 25]
+    assert table.shape == (25, 4)
+    numpy.testing.assert_allclose(table[:, 0], data["time"])
+    numpy.testing.assert_allclose(table[:, 3], data["power"])
+
+
+def test_single_channel_header(tmp_path):
+    path = tmp_path / "current.csv"
+    write_csv(str(path), columns(5), names=("time", "current"))
+    header, table = read(path)
+    assert header == "Time,Value"
+    numpy.testing.assert_allclose(table[:, 1], numpy.arange(5))
+
+
+def test_rows_limited_to_shortest_column(tmp_path):
+    data = columns(10)
+    data["power"] = data["power"][:7]
+    assert write_csv(str(tmp_path / "short.csv"), data) == 7
+
+
+def test_cancel_removes_partial_file(tmp_path):
+    path = tmp_path / "cancelled.csv"
+    progress = []
+    with pytest.raises(ExportCancelled):
+        write_csv(str(path), columns(30), chunk_rows=10, progress=progress.append, cancelled=lambda: len(progress) >= 1)
+    assert not path.exists()
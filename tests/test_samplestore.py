@@ -0,0 +1,58 @@
+import numpy
+from samplestore import SampleStore
+
+
+def fill(store: SampleStore, count: int, start: int = 0):
+    for i in range(start, start + count):
+        store.append(float(i), i, i * 2, i * 3)
+
+
+def test_append_grows_and_keeps_values():
+    store = SampleStore(initial_capacity=4)
+    fill(store, 100)
+    assert len(store) == 100
+    assert store.capacity >= 100
+    numpy.testing.assert_array_equal(store.time, numpy.arange(100))
+    numpy.testing.assert_array_equal(store.power, numpy.arange(100) * 3)
+    assert store.voltage.dtype == numpy.float32
+
+
+def test_window_drops_oldest_quarter():
+    store = SampleStore(initial_capacity=4, max_length=100)
+    fill(store, 100)
+    assert store.offset == 0
+    fill(store, 1, 100)  # window full, oldest quarter is dropped before appending
+    assert store.capacity == 100
+    assert len(store) == 76
+    assert store.offset == 25
+    assert store.total_length == 101
+    numpy.testing.assert_array_equal(store.time, numpy.arange(25, 101))
+    numpy.testing.assert_array_equal(store.current, numpy.arange(25, 101) * 2)
+
+
+def test_window_keeps_newest_samples_of_long_run():
+    store = SampleStore(max_length=1000)
+    fill(store, 10000)
+    assert len(store) <= 1000
+    assert store.total_length == 10000
+    assert store.offset + len(store) == 10000
+    numpy.testing.assert_array_equal(store.time, numpy.arange(store.offset, 10000))
+
+
+def test_view_has_equal_columns():
+    store = SampleStore(max_length=50)
+    fill(store, 77)
+    columns = store.view()
+    assert set(columns) == {"time", "voltage", "current", "power"}
+    assert len({len(column) for column in columns.values()}) == 1
+    numpy.testing.assert_array_equal(store.column("time"), columns["time"])
+
+
+def test_clear_resets_window():
+    store = SampleStore(max_length=10)
+    fill(store, 20)
+    store.clear()
+    assert len(store) == 0
+    assert store.offset == 0
+    fill(store, 3)
+    numpy.testing.assert_array_equal(store.time, [0.0, 1.0, 2.0])
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import pytest
+from scheduler import SerialScheduler, PRIORITY_USER, PRIORITY_POLL
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = SerialScheduler("test")
+    yield scheduler
+    scheduler.stop()
+
+
+def blocked(scheduler):  # occupy the serial thread until the returned event is set, so commands queue up behind it
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    scheduler.submit(block)
+    started.wait(5)
+    return release
+
+
+def test_user_commands_preempt_queued_polling(scheduler):
+    order = []
+    release = blocked(scheduler)
+    polls = [scheduler.submit(order.append, "poll {0}".format(i), priority=PRIORITY_POLL) for i in range(3)]
+    user = scheduler.submit(order.append, "user", priority=PRIORITY_USER)
+    release.set()
+    for future in polls + [user]:
+        future.result(5)
+    assert order == ["user", "poll 0", "poll 1", "poll 2"]
+
+
+def test_same_priority_keeps_order(scheduler):
+    order = []
+    release = blocked(scheduler)
+    futures = [scheduler.submit(order.append, i, priority=PRIORITY_POLL) for i in range(5)]
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert order == list(range(5))
+
+
+def test_cancelled_command_is_not_run(scheduler):
+    order = []
+    release = blocked(scheduler)
+    dropped = scheduler.submit(order.append, "dropped")
+    kept = scheduler.submit(order.append, "kept")
+    assert dropped.cancel()
+    release.set()
+    kept.result(5)
+    assert order == ["kept"]
+
+
+def test_cancelling_awaiting_task_drops_command(scheduler):
+    order = []
+
+    async def cancel_while_queued():
+        release = blocked(scheduler)
+        task = asyncio.ensure_future(scheduler.run(order.append, "dropped"))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        release.set()
+        await scheduler.run(order.append, "kept")
+
+    asyncio.run(cancel_while_queued())
+    assert order == ["kept"]
+
+
+def test_exceptions_reach_caller(scheduler):
+    def fail():
+        raise ValueError("no response")
+
+    with pytest.raises(ValueError):
+        scheduler.call(fail)
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.run(fail))
+    assert scheduler.call(lambda: 42) == 42  # serial thread keeps running
+
+
+def test_call_from_serial_thread_does_not_deadlock(scheduler):
+    assert scheduler.call(scheduler.call, lambda: "nested") == "nested"
+
+
+def test_wait_statistics_per_priority(scheduler):
+    scheduler.call(lambda: None)
+    scheduler.call(lambda: None, priority=PRIORITY_POLL)
+    metrics = scheduler.metrics()
+    assert metrics["user_count"] == 1
+    assert metrics["poll_count"] == 1
+    assert metrics["depth"] == 0
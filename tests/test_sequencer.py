@@ -0,0 +1,122 @@
+import asyncio
+import types
+import numpy
+import pytest
+from kelctl import *
+import sequencer
+from sequencer import Sequencer, list_sequence, read_program, write_step_table, step_table_path
+
+
+class FakeClock(object):  # time only advances by waiting or by commands taking time
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay: float):
+        self.now += delay
+
+
+class FakeScheduler(object):  # sends setpoints instantly, except for the steps given a duration
+    def __init__(self, clock: FakeClock, durations: dict = None):
+        self.clock = clock
+        self.durations = durations or {}
+        self.values = []
+
+    async def run(self, fn, load, command, value):
+        assert fn is sequencer.send_setpoint
+        sent = self.clock()
+        self.clock.now += self.durations.get(len(self.values), 0.0)
+        self.values.append(value)
+        return sent
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(sequencer, "clock", clock)
+    monkeypatch.setattr(sequencer, "asyncio", types.SimpleNamespace(sleep=clock.sleep))
+    return clock
+
+
+def test_steps_are_sent_on_time(clock):
+    sequence = Sequencer([1, 2, 3], [1.0, 2.0, 0.5], loops=2)
+    scheduler = FakeScheduler(clock)
+    asyncio.run(sequence.run(scheduler, None))
+    assert scheduler.values == [1, 2, 3, 1, 2, 3]
+    assert sequence.skipped == 0
+    numpy.testing.assert_allclose(sequence.sent, sequence.planned)
+    assert clock.now == pytest.approx(100.0 + sequence.duration)
+    assert sequence.report()["lateness_max"] == pytest.approx(0.0)
+
+
+def test_late_step_skips_steps_whose_time_passed(clock):
+    sequence = Sequencer([1, 2, 3, 4, 5], [1.0] * 5)
+    scheduler = FakeScheduler(clock, {1: 2.5})  # second step takes until the middle of the fourth
+    asyncio.run(sequence.run(scheduler, None))
+    assert scheduler.values == [1, 2, 4, 5]  # third step is skipped instead of sent late, fourth is sent at once
+    assert sequence.skipped == 1
+    assert numpy.isnan(sequence.sent[2])
+    assert sequence.sent[3] == pytest.approx(3.5)
+    assert sequence.sent[4] == pytest.approx(4.0)  # later steps are back on their grid
+    report = sequence.report()
+    assert report["sent"] == 4 and report["skipped"] == 1
+    assert report["lateness_max"] == pytest.approx(0.5)
+
+
+def test_steps_over_at_end_are_skipped(clock):
+    sequence = Sequencer([1, 2, 3], [1.0] * 3)
+    scheduler = FakeScheduler(clock, {0: 10.0})
+    asyncio.run(sequence.run(scheduler, None))
+    assert scheduler.values == [1]
+    assert sequence.skipped == 2
+
+
+def test_cancel_stops_sequence(clock):
+    sequence = Sequencer([1, 2, 3, 4], [1.0] * 4)
+    scheduler = FakeScheduler(clock)
+    asyncio.run(sequence.run(scheduler, None, cancelled=lambda: len(scheduler.values) >= 2))
+    assert scheduler.values == [1, 2]
+    assert sequence.cancelled
+    assert sequence.report()["cancelled"]
+
+
+def test_steps_on_runtime_of_samples(clock):
+    sequence = Sequencer([1, 2], [1.0, 1.0])
+    asyncio.run(sequence.run(FakeScheduler(clock), None, origin=clock.now - 10.0))  # run started 10 s before
+    numpy.testing.assert_allclose(sequence.planned, [10.0, 11.0])
+    time_column = numpy.array([9.5, 10.0, 10.5, 11.2, 11.9, 12.0])
+    numpy.testing.assert_array_equal(sequence.step_index(time_column), [-1, 0, 0, 1, 1, -1])
+    numpy.testing.assert_array_equal(sequence.step_table(time_column)["samples"], [2, 2])
+
+
+def test_validate():
+    with pytest.raises(ValueError):
+        Sequencer([1, 2], [1.0, 0.0]).validate(30.0)
+    with pytest.raises(ValueError):
+        Sequencer([-1], [1.0]).validate(30.0)
+    with pytest.raises(ValueOutOfLimitError):
+        Sequencer([1, 31], [1.0, 1.0]).validate(30.0)
+    Sequencer([1, 30], [1.0, 1.0]).validate(30.0)
+
+
+def test_read_program_and_step_table(tmp_path):
+    path = tmp_path / "program.csv"
+    path.write_text("current,slope,duration\n# warm up\n1.0,0.1,2\n\n2.5,0.2,0.5\n")
+    steps = read_program(str(path))
+    sequence = list_sequence(steps, loops=2)
+    numpy.testing.assert_allclose(sequence.values, [1.0, 2.5, 1.0, 2.5])
+    assert sequence.duration == pytest.approx(5.0)
+
+    table_path = step_table_path(str(path))
+    assert table_path.endswith("program.steps.csv")
+    write_step_table(table_path, sequence.step_table())
+    assert open(table_path).readline().strip() == "step,setpoint,planned,sent,lateness"
+
+
+def test_invalid_program_line(tmp_path):
+    path = tmp_path / "program.csv"
+    path.write_text("1.0,0.1,2\nabc,0.1,2\n")
+    with pytest.raises(ValueError):
+        read_program(str(path))
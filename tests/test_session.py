@@ -0,0 +1,47 @@
+import json
+import numpy
+import pytest
+from recorder import RunRecorder
+from session import save_session, load_session, load_columns, COLUMNS
+
+
+def recorded_columns(rows: int = 20) -> dict:
+    return {"time": numpy.arange(rows) * 0.25, "voltage": numpy.linspace(12.6, 11.0, rows).astype(numpy.float32),
+            "current": numpy.full(rows, 1.5, dtype=numpy.float32), "power": numpy.linspace(18.9, 16.5, rows).astype(numpy.float32)}
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "run.session")  # not named .npz, numpy must not append its extension
+    columns = recorded_columns()
+    save_session(path, columns, {"model": "KEL103", "limits": {"current_limit": 30.0}})
+    loaded, metadata = load_session(path)
+    for name in COLUMNS:
+        numpy.testing.assert_array_equal(loaded[name], columns[name])
+        assert loaded[name].dtype == columns[name].dtype
+    assert metadata["model"] == "KEL103"
+    assert metadata["limits"] == {"current_limit": 30.0}
+    assert metadata["version"] == 1
+
+
+def test_newer_version_is_rejected(tmp_path):
+    path = tmp_path / "new.npz"
+    columns = recorded_columns()
+    numpy.savez(path, metadata=numpy.array(json.dumps({"version": 99})), **columns)
+    with pytest.raises(ValueError):
+        load_session(str(path))
+
+
+def test_load_columns_of_session_and_run_file(tmp_path):
+    columns = recorded_columns()
+    session_path = str(tmp_path / "run.npz")
+    save_session(session_path, columns, {})
+    run_path = str(tmp_path / "run.kelrun")
+    recorder = RunRecorder(run_path, chunk_records=8)  # grows the file twice
+    for row in zip(*(columns[name] for name in COLUMNS)):
+        recorder.append(*row)
+    recorder.close()
+
+    for path in (session_path, run_path):
+        loaded = load_columns(path)
+        for name in COLUMNS:
+            numpy.testing.assert_allclose(loaded[name], columns[name])
@@ -0,0 +1,76 @@
+import numpy
+import pytest
+from kelctl import *
+from session import save_session
+from waveform import resample, read_waveform, achievable_interval, waveform_sequence, MIN_INTERVAL
+
+
+def test_constant_stretches_are_merged():
+    time_column = numpy.array([0.0, 1.0, 2.0, 3.0])
+    setpoints, durations = resample(time_column, numpy.array([2.0, 2.0, 2.0, 2.0]), 0.1)
+    numpy.testing.assert_allclose(setpoints, [2.0])
+    numpy.testing.assert_allclose(durations, [3.0])
+
+
+def test_setpoints_are_interval_means():  # waveform is taken as the mean of each segment between its points
+    time_column = numpy.array([0.0, 1.0, 2.0, 2.2])
+    values = numpy.array([0.0, 2.0, 2.0, 4.0])
+    setpoints, durations = resample(time_column, values, 0.5)
+    numpy.testing.assert_allclose(setpoints, [1.0, 2.0, 3.0])
+    numpy.testing.assert_allclose(durations, [1.0, 1.0, 0.2])
+
+
+def test_grid_interval_spanning_points():
+    time_column = numpy.array([0.0, 0.5, 1.0, 1.5, 2.0])
+    values = numpy.array([1.0, 1.0, 3.0, 3.0, 3.0])
+    setpoints, durations = resample(time_column, values, 1.0)
+    numpy.testing.assert_allclose(setpoints, [1.5, 3.0])
+    numpy.testing.assert_allclose(durations, [1.0, 1.0])
+
+
+def test_last_interval_is_shortened_to_end():
+    time_column = numpy.array([0.0, 1.0, 1.05])
+    setpoints, durations = resample(time_column, numpy.array([1.0, 1.0, 5.0]), 0.5)
+    numpy.testing.assert_allclose(setpoints, [1.0, 3.0])
+    numpy.testing.assert_allclose(durations, [1.0, 0.05])
+
+
+def test_achievable_interval():
+    assert achievable_interval(115200) == MIN_INTERVAL
+    assert achievable_interval(9600, 0.05) == pytest.approx(16 * 10 / 9600 + 0.05)
+
+
+def test_read_csv_with_header_and_second_run(tmp_path):
+    path = tmp_path / "profile.csv"
+    path.write_text("time,current\n5.0,1.0\n6.0,2.0\n7.0,3.0\n0.0,9.0\n1.0,9.0\n")
+    time_column, values = read_waveform(str(path))
+    numpy.testing.assert_allclose(time_column, [0.0, 1.0, 2.0])
+    numpy.testing.assert_allclose(values, [1.0, 2.0, 3.0])
+
+
+def test_read_session_columns_by_mode(tmp_path):
+    path = str(tmp_path / "session.npz")
+    rows = 5
+    save_session(path, {"time": numpy.arange(rows, dtype=numpy.float64), "voltage": numpy.full(rows, 12.0),
+                        "current": numpy.array([0.0, 1.0, 2.0, 3.0, 4.0]), "power": numpy.arange(rows) * 12.0}, {})
+    _, current = read_waveform(path, Mode.constant_current)
+    numpy.testing.assert_allclose(current, [0.0, 1.0, 2.0, 3.0, 4.0])
+    time_column, resistance = read_waveform(path, Mode.constant_resistance)  # calculated, samples without current left out
+    numpy.testing.assert_allclose(time_column, [0.0, 1.0, 2.0, 3.0])
+    numpy.testing.assert_allclose(resistance, [12.0, 6.0, 4.0, 3.0])
+    with pytest.raises(ValueError):
+        read_waveform(path, Mode.short)
+
+
+def test_too_short_waveform(tmp_path):
+    path = tmp_path / "point.csv"
+    path.write_text("0.0,1.0\n")
+    with pytest.raises(ValueError):
+        read_waveform(str(path))
+
+
+def test_sequence_only_for_setpoint_modes():
+    time_column, values = numpy.array([0.0, 1.0]), numpy.array([1.0, 1.0])
+    assert waveform_sequence(time_column, values, 0.1, Mode.constant_power).mode == Mode.constant_power
+    with pytest.raises(ValueError):
+        waveform_sequence(time_column, values, 0.1, Mode.short)
@@ -0,0 +1,96 @@
+"""
+Playback of recorded load profiles, e.g. the current draw of a device over a day, as setpoints of a basic mode.
+
+A waveform is a time column with a setpoint column, read from CSV or NPZ(a session file of a recorded run works too).
+It is resampled onto a grid of the update interval the serial connection can sustain, each setpoint being the mean of
+the waveform over its interval(from the cumulative integral, so short peaks between grid points are not lost or
+over-weighted). Consecutive setpoints which are equal at the precision of the setpoint command are merged into one
+step, so constant stretches cost no serial traffic. The steps are played by a Sequencer, which keeps the timing free
+of drift and measures the achieved timing of every setpoint.
+"""
+
+import numpy
+from kelctl import *
+from acquisition import clock, read_frame, raw_serial
+from sequencer import Sequencer, COMMANDS
+
+MIN_INTERVAL = 0.02  # shortest update interval, setpoints have to interleave with acquisition ticks
+SETPOINT_BYTES = 16  # length of a setpoint command, e.g. ":CURR 10.0000A\n"
+NPZ_COLUMNS = {Mode.constant_current: "current", Mode.constant_voltage: "voltage", Mode.constant_resistance: "resistance",
+               Mode.constant_power: "power"}
+
+
+def read_waveform(path: str, mode: Mode = Mode.constant_current) -> tuple:
+    """ Waveform from CSV(time and setpoint in the first two columns, header row optional) or NPZ file.
+
+    NPZ files need a time array and a setpoint array, or the column of the mode(current, voltage, resistance or power) as
+    stored in session files. Session files have no resistance column, it is calculated from voltage and current instead
+    (samples without current are left out). Files with several runs(time starting at 0 again) only give their first run.
+
+    :return: tuple of time and setpoint arrays, time starting at 0
+    """
+    if path.endswith(".npz"):
+        with numpy.load(path, allow_pickle=False) as data:
+            name = "setpoint" if "setpoint" in data else NPZ_COLUMNS.get(mode, "setpoint")
+            names = ("time", "voltage", "current") if name == "resistance" and name not in data else ("time", name)
+            if any(column not in data for column in names):
+                raise ValueError("{0} has no {1} arrays".format(path, " and ".join(names)))
+            columns = [numpy.asarray(data[column], dtype=numpy.float64) for column in names]
+        if len(columns) == 3:  # resistance from voltage and current
+            time_column, voltage, current = columns
+            loaded = current > 0
+            time_column, values = time_column[loaded], voltage[loaded] / current[loaded]
+        else:
+            time_column, values = columns
+    else:
+        try:
+            table = numpy.loadtxt(path, delimiter=",", usecols=(0, 1), ndmin=2)
+        except ValueError:  # header row
+            table = numpy.loadtxt(path, delimiter=",", usecols=(0, 1), ndmin=2, skiprows=1)
+        time_column, values = table[:, 0], table[:, 1]
+
+    backward = numpy.flatnonzero(numpy.diff(time_column) <= 0)
+    if backward.shape[0] > 0:  # end of first run
+        time_column, values = time_column[:backward[0] + 1], values[:backward[0] + 1]
+    if time_column.shape[0] < 2:
+        raise ValueError("Waveform needs at least two points")
+    return time_column - time_column[0], values
+
+
+def resample(time_column: numpy.ndarray, values: numpy.ndarray, interval: float, precision: float = 1e-4) -> tuple:
+    """ Setpoints on a grid of the interval, merged where equal at the given precision.
+
+    :return: tuple of setpoint and duration arrays
+    """
+    area = numpy.concatenate(([0.0], numpy.cumsum((values[1:] + values[:-1]) / 2 * numpy.diff(time_column))))
+    count = max(int(numpy.ceil((time_column[-1] - time_column[0]) / interval - 1e-9)), 1)
+    edges = numpy.minimum(time_column[0] + numpy.arange(count + 1) * interval, time_column[-1])
+    means = numpy.diff(numpy.interp(edges, time_column, area)) / numpy.diff(edges)
+
+    rounded = numpy.round(means / precision)
+    keep = numpy.concatenate(([True], rounded[1:] != rounded[:-1]))  # first step of each run of equal setpoints
+    starts = edges[:-1][keep]
+    return means[keep], numpy.diff(numpy.append(starts, edges[-1]))
+
+
+def achievable_interval(baudrate: int, frame_seconds: float = 0.0) -> float:
+    """ Shortest update interval the connection sustains with a frame acquisition between two setpoints.
+
+    :param frame_seconds: duration of a frame acquisition
+    """
+    return max(MIN_INTERVAL, SETPOINT_BYTES * 10 / baudrate + frame_seconds)
+
+
+def update_interval(load: KELSerial) -> float:  # achievable interval measured on the connection, runs on serial thread
+    start = clock()
+    read_frame(load)
+    frame_seconds = clock() - start
+    return achievable_interval(getattr(raw_serial(load).port, "baudrate", BaudRate.R115200.b), frame_seconds)
+
+
+def waveform_sequence(time_column: numpy.ndarray, values: numpy.ndarray, interval: float,
+                      mode: Mode = Mode.constant_current, loops: int = 1) -> Sequencer:
+    if mode not in COMMANDS:
+        raise ValueError("Waveforms can only be played in CC, CV, CR or CW mode")
+    setpoints, durations = resample(time_column, values, interval)
+    return Sequencer(setpoints, durations, loops, mode)